@@ -0,0 +1,81 @@
+import os
+import hmac
+from flask import Blueprint, request, jsonify, Response
+
+import profiler
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set. Clients send it as
+# "Authorization: Bearer <token>" or "X-Admin-Token: <token>".
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+admin_bp = Blueprint("admin", __name__)
+
+
+@admin_bp.before_request
+def require_admin():
+    if not ADMIN_TOKEN:
+        return jsonify({"error": "not found"}), 404
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:] if auth.startswith("Bearer ") else request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({"error": "forbidden"}), 403
+
+
+@admin_bp.route("/admin/profile", methods=["POST", "GET"])
+def profile_endpoint():
+    """Sample all thread stacks and return collapsed stacks (text/plain).
+
+    Query params:
+    - seconds: profile duration (default 10, capped by MAX_PROFILE_SECONDS)
+    - hz: samples per second (default 100)
+    - by_thread: prefix stacks with the thread name (default 1)
+    """
+    seconds = float(request.args.get("seconds", "10"))
+    hz = int(request.args.get("hz", "100"))
+    by_thread = request.args.get("by_thread", "1") != "0"
+    try:
+        collapsed, info = profiler.sample_stacks(seconds, hz, by_thread)
+    except profiler.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    resp = Response(collapsed, mimetype="text/plain")
+    resp.headers["X-Profile-Samples"] = str(info["samples"])
+    resp.headers["X-Profile-Hz"] = str(info["hz"])
+    return resp
+
+
+@admin_bp.route("/admin/tracemalloc/start", methods=["POST"])
+def tracemalloc_start_endpoint():
+    """Start tracing allocations (?nframes=N, default 1) and take a baseline snapshot."""
+    profiler.tracemalloc_start(int(request.args.get("nframes", "1")))
+    return jsonify({"tracing": True})
+
+
+@admin_bp.route("/admin/tracemalloc/stop", methods=["POST"])
+def tracemalloc_stop_endpoint():
+    profiler.tracemalloc_stop()
+    return jsonify({"tracing": False})
+
+
+@admin_bp.route("/admin/tracemalloc/snapshot", methods=["GET"])
+def tracemalloc_snapshot_endpoint():
+    """Top allocation sites. Query params: limit (default 25), group_by (lineno|filename|traceback)."""
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    out = profiler.tracemalloc_top(int(request.args.get("limit", "25")), group_by)
+    if out is None:
+        return jsonify({"error": "tracemalloc not started"}), 409
+    return jsonify(out)
+
+
+@admin_bp.route("/admin/tracemalloc/diff", methods=["GET"])
+def tracemalloc_diff_endpoint():
+    """Allocation growth since the baseline. ?reset=1 makes this snapshot the new baseline."""
+    group_by = request.args.get("group_by", "lineno")
+    if group_by not in ("lineno", "filename", "traceback"):
+        return jsonify({"error": "group_by must be lineno, filename or traceback"}), 400
+    out = profiler.tracemalloc_diff(int(request.args.get("limit", "25")), group_by,
+                                    reset=request.args.get("reset") == "1")
+    if out is None:
+        return jsonify({"error": "tracemalloc not started"}), 409
+    return jsonify(out)
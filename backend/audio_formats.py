@@ -0,0 +1,155 @@
+"""Output-format negotiation and streaming transcoding for TTS audio.
+
+FishAudio streams MP3. Clients can ask for something more compact (Opus in
+WebM/Ogg, low-bitrate MP3) or for raw PCM for local playback, via
+`?format=<name>` or the Accept header. Anything other than `mp3` is
+transcoded on the fly by an ffmpeg subprocess, chunk in -> chunk out, so the
+first audio bytes still go out while synthesis is running. If ffmpeg is not
+installed, every request falls back to `mp3`.
+"""
+import os
+import shutil
+import threading
+import subprocess
+
+import metrics
+
+DEFAULT_FORMAT = os.environ.get('TTS_DEFAULT_FORMAT', 'mp3')
+PCM_SAMPLE_RATE = int(os.environ.get('TTS_PCM_SAMPLE_RATE', '24000'))
+
+# name -> (mimetype, ffmpeg output args); None args = provider passthrough.
+# audio/L16 is big-endian (RFC 2586), hence s16be.
+FORMATS = {
+    'mp3': ('audio/mpeg', None),
+    'mp3_low': ('audio/mpeg', ['-c:a', 'libmp3lame', '-b:a', '48k', '-f', 'mp3']),
+    'opus_webm': ('audio/webm;codecs=opus', ['-c:a', 'libopus', '-b:a', '24k', '-f', 'webm']),
+    'opus_ogg': ('audio/ogg;codecs=opus', ['-c:a', 'libopus', '-b:a', '24k', '-f', 'ogg']),
+    'pcm': (f'audio/L16;rate={PCM_SAMPLE_RATE};channels=1',
+            ['-f', 's16be', '-acodec', 'pcm_s16be', '-ac', '1', '-ar', str(PCM_SAMPLE_RATE)]),
+}
+
+# Accept media type -> format name, in server preference order
+_ACCEPT_TYPES = (
+    ('audio/webm', 'opus_webm'),
+    ('audio/ogg', 'opus_ogg'),
+    ('audio/opus', 'opus_ogg'),
+    ('audio/l16', 'pcm'),
+    ('audio/pcm', 'pcm'),
+    ('audio/mpeg', 'mp3'),
+)
+
+_FFMPEG = shutil.which('ffmpeg')
+
+
+def transcoding_available():
+    return _FFMPEG is not None
+
+
+def _accept_ranges(accept):
+    """Accept header -> {media range: q}."""
+    ranges = {}
+    for part in accept.split(','):
+        params = part.split(';')
+        media_range = params[0].strip().lower()
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        ranges[media_range] = max(q, ranges.get(media_range, 0.0))
+    return ranges
+
+
+def _quality(ranges, name):
+    """q the client gives format `name` (most specific matching range wins)."""
+    types = {mimetype(name).split(';')[0].lower()} | {mt for mt, fmt in _ACCEPT_TYPES if fmt == name}
+    best = 0.0
+    for mt in types:
+        for key in (mt, mt.split('/')[0] + '/*', '*/*'):
+            if key in ranges:
+                best = max(best, ranges[key])
+                break
+    return best
+
+
+def negotiate(requested=None, accept=None):
+    """Pick an output format from an explicit name (query/body) or an Accept header.
+
+    The default format is kept whenever Accept allows it (browsers list audio/webm
+    for any media element, which is no reason to transcode); otherwise the accepted
+    format with the highest q, server order breaking ties.
+    """
+    if requested:
+        name = requested.strip().lower()
+        if name not in FORMATS:
+            return None
+    else:
+        name = DEFAULT_FORMAT
+        if accept:
+            ranges = _accept_ranges(accept)
+            if _quality(ranges, name) <= 0:
+                best = 0.0
+                for fmt in dict.fromkeys(fmt for _, fmt in _ACCEPT_TYPES):
+                    q = _quality(ranges, fmt)
+                    if q > best:
+                        name, best = fmt, q
+    if FORMATS[name][1] is not None and not transcoding_available():
+        return 'mp3'
+    return name
+
+
+def mimetype(fmt):
+    return FORMATS[fmt][0]
+
+
+def transcode(chunks, fmt):
+    """Yield `chunks` (an MP3 stream) converted to `fmt`; passthrough for mp3."""
+    args = FORMATS[fmt][1]
+    if args is None:
+        yield from chunks
+        return
+    proc = subprocess.Popen(
+        [_FFMPEG, '-hide_banner', '-loglevel', 'error', '-f', 'mp3', '-i', 'pipe:0',
+         '-vn', '-flush_packets', '1', *args, 'pipe:1'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    failure = []
+
+    def feed():
+        try:
+            for chunk in chunks:
+                proc.stdin.write(chunk)
+                proc.stdin.flush()
+        except Exception as e:
+            # BrokenPipe when the reader side went away; anything else is a synthesis error
+            failure.append(e)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    metrics.counter_inc('tts_transcodes_total', help_text='TTS streams transcoded with ffmpeg.')
+    feeder = threading.Thread(target=feed, name='tts-transcode', daemon=True)
+    feeder.start()
+    try:
+        while True:
+            data = proc.stdout.read1(8192)
+            if not data:
+                break
+            yield data
+        feeder.join()
+        if failure and not isinstance(failure[0], BrokenPipeError):
+            raise failure[0]
+        if proc.wait() != 0:
+            raise RuntimeError(f'ffmpeg exited with {proc.returncode} transcoding to {fmt}')
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
@@ -0,0 +1,102 @@
+"""Push TTS audio to a client as binary socket.io events.
+
+Instead of a second HTTP request to /messages/<id>/tts_stream, a client that
+posts a message with "push_audio": true gets the reply's audio on the socket it
+already holds:
+
+    tts_audio      {message_id, seq, data: <bytes>}
+    tts_audio_end  {message_id, count, error?}
+
+Flow control is a per-(client, message) byte window: at most
+AUDIO_PUSH_WINDOW_BYTES may be unacknowledged, and the client acknowledges with
+`tts_ack {message_id, seq}` (highest seq received). A client that stops acking
+for AUDIO_PUSH_ACK_TIMEOUT_S, or disconnects, ends the push.
+"""
+import os
+import threading
+
+import metrics
+import audio_formats
+from message_chunks import iter_message_chunks, is_cancelled
+from tts import synthesize_stream_gen
+
+AUDIO_PUSH_WINDOW_BYTES = int(os.environ.get('AUDIO_PUSH_WINDOW_BYTES', str(256 * 1024)))
+AUDIO_PUSH_ACK_TIMEOUT_S = float(os.environ.get('AUDIO_PUSH_ACK_TIMEOUT_S', '10'))
+
+# (sid, message_id) -> _Window
+_WINDOWS = {}
+_WINDOWS_LOCK = threading.Lock()
+
+
+class _Window:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.sent = []  # cumulative bytes sent through seq i
+        self.acked_seq = -1
+        self.closed = False
+
+    def in_flight(self):
+        sent = self.sent[-1] if self.sent else 0
+        acked = self.sent[self.acked_seq] if self.acked_seq >= 0 else 0
+        return sent - acked
+
+
+def ack(sid, message_id, seq):
+    """Client received frames up to and including `seq`."""
+    w = _WINDOWS.get((sid, message_id))
+    if w is None:
+        return
+    with w.cond:
+        w.acked_seq = min(max(w.acked_seq, seq), len(w.sent) - 1)
+        w.cond.notify_all()
+
+
+def drop_client(sid):
+    """Stop every push to a disconnected client."""
+    with _WINDOWS_LOCK:
+        windows = [w for (s, _), w in _WINDOWS.items() if s == sid]
+    for w in windows:
+        with w.cond:
+            w.closed = True
+            w.cond.notify_all()
+
+
+def push_message_audio(socketio, sid, message_id, fmt='mp3', trace_id=None):
+    """Synthesize a (possibly still streaming) message and emit its audio to `sid`.
+    Blocks until done; run it as a background task."""
+    key = (sid, message_id)
+    w = _Window()
+    with _WINDOWS_LOCK:
+        _WINDOWS[key] = w
+    metrics.gauge_inc('audio_push_streams', help_text='TTS streams being pushed over socket.io.')
+    audio = audio_formats.transcode(
+        synthesize_stream_gen(iter_message_chunks(message_id), trace_id=trace_id,
+                              cancelled=lambda: is_cancelled(message_id)), fmt)
+    seq = 0
+    error = None
+    try:
+        for chunk in audio:
+            with w.cond:
+                if not w.cond.wait_for(lambda: w.closed or w.in_flight() < AUDIO_PUSH_WINDOW_BYTES,
+                                       timeout=AUDIO_PUSH_ACK_TIMEOUT_S):
+                    error = 'ack timeout'
+                    metrics.counter_inc('audio_push_stalls_total', help_text='Audio pushes ended by a client that stopped acking.')
+                    break
+                if w.closed:
+                    error = 'disconnected'
+                    break
+                w.sent.append((w.sent[-1] if w.sent else 0) + len(chunk))
+            socketio.emit('tts_audio', {'message_id': message_id, 'seq': seq, 'data': bytes(chunk)}, to=sid)
+            seq += 1
+    except Exception as e:
+        error = str(e)
+    finally:
+        audio.close()
+        with _WINDOWS_LOCK:
+            _WINDOWS.pop(key, None)
+        metrics.gauge_dec('audio_push_streams')
+    end = {'message_id': message_id, 'count': seq}
+    if error:
+        end['error'] = error
+    if error != 'disconnected':
+        socketio.emit('tts_audio_end', end, to=sid)
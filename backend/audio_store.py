@@ -0,0 +1,61 @@
+"""On-disk store for finished message audio.
+
+The first TTS request for a completed message streams live synthesis to the
+client and tees it into AUDIO_DIR/<conversation_id>/<message_id>-<format>-<digest>.
+Later requests (seek, reload, resumed download) are served from that file with
+ETag / Last-Modified / Range support instead of re-synthesizing.
+
+The digest covers voice, format and text, so it doubles as the ETag and a
+message whose text changes gets a new file.
+"""
+import os
+import uuid
+import shutil
+import hashlib
+
+import metrics
+
+AUDIO_DIR = os.environ.get('AUDIO_DIR', 'audio')
+AUDIO_CACHE_CONTROL = os.environ.get('AUDIO_CACHE_CONTROL', 'private, max-age=86400')
+
+
+def audio_digest(text, model_id, fmt):
+    return hashlib.sha1(f'{model_id}\0{fmt}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def audio_path(conversation_id, message_id, fmt, digest):
+    return os.path.join(AUDIO_DIR, conversation_id, f'{message_id}-{fmt}-{digest[:16]}')
+
+
+def materialized(path):
+    """True if the audio at `path` has been fully written."""
+    return os.path.isfile(path)
+
+
+def tee_to_file(audio_gen, path):
+    """Yield `audio_gen` unchanged and keep a copy at `path` once it completes.
+
+    Written under a unique temporary name and renamed at the end, so readers
+    never see partial audio; a failed or abandoned stream leaves nothing behind.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{uuid.uuid4().hex[:8]}.tmp'
+    complete = False
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in audio_gen:
+                f.write(chunk)
+                yield chunk
+        complete = True
+        os.replace(tmp_path, path)
+        metrics.counter_inc('tts_audio_materialized_total', help_text='Finished message audio files written.')
+    finally:
+        if not complete:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def delete_conversation_audio(conversation_id):
+    shutil.rmtree(os.path.join(AUDIO_DIR, conversation_id), ignore_errors=True)
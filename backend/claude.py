@@ -1,6 +1,11 @@
 import os
-from db import get_messages, get_conversation, insert_message
-from anthropic import Anthropic
+import time
+from db import get_conversation, get_recent_messages, get_memory_messages, insert_message
+import metrics
+import providers
+import tracing
+import llm_cache
+import hedging
 # from anthropic.types import TextBlock
 
 # Hardcoded system prompt (interviewer persona). Must be concise by design; model should follow rules.
@@ -59,31 +64,12 @@ def build_trimmed_history(conversation_id: str, token_budget: int = None):
     Order: chronological (oldest->newest), starting with system message then memory and recent messages.
     """
     token_budget = token_budget or TOKEN_BUDGET
-    conv = get_conversation(conversation_id)
+    conv = get_conversation(conversation_id, columns=('system_message',))
 
-    # Load all messages (could be optimized)
-    messages = get_messages(conversation_id, limit=10000)
-
-    # Identify memory messages (role == 'memory') and recent messages
-    memory_messages = [m for m in messages if m['role'] == 'memory']
-    regular = [m for m in messages if m['role'] != 'memory']
-
-    # Start accounting tokens with system message
-    running = 0
-    included = []
-
-    # Iterate recent messages in reverse chronological order
-    for m in reversed(regular):
-        t = m.get('tokens_est') or estimate_tokens(m.get('content', ''))
-        if running + t <= token_budget and len(included) < 200:
-            included.append(m)
-            running += t
-        else:
-            # stop including older messages
-            break
-
-    # included currently is newest-first; reverse to chronological
-    included = list(reversed(included))
+    # Memory messages are always included; the newest regular messages that
+    # fit the budget (at most 200) are selected in SQL
+    memory_messages = get_memory_messages(conversation_id, columns=('content',))
+    included = get_recent_messages(conversation_id, token_budget, max_messages=200, columns=('role', 'content'))
 
     assembled = []
     # include memory messages
@@ -95,7 +81,6 @@ def build_trimmed_history(conversation_id: str, token_budget: int = None):
 
     return conv['system_message'], assembled
 
-client = Anthropic()
 model = 'claude-haiku-4-5-20251001'
 # Use temperature 0.0 for deterministic responses
 temperature = 0.0
@@ -137,7 +122,8 @@ def build_msg_ctx(messages, code=None):
             msgs.append({"role": "user", "content": "Memory: " + content})
         elif role == 'user':
             msgs.append({"role": "user", "content": content})
-        elif role == 'assistant':
+        elif role == 'assistant' and content.strip():
+            # the API rejects empty assistant turns (e.g. a reply cancelled before its first token)
             msgs.append({"role": "assistant", "content": content})
     # Iterate msgs in reverse and add to the last one with code if provided
     if code:
@@ -163,25 +149,72 @@ def build_summary(messages_chunk):
 def insert_summary_message(conversation_id, summary_text):
     return insert_message(conversation_id=conversation_id, role='memory', content=summary_text, metadata={})
 
-def stream_haiku(code, conversation_id):
+def _live_text(request_args, on_open=None):
+    """Text of one Anthropic stream, or of a hedged pair when hedging is enabled."""
+    client = providers.anthropic_client()
+    if hedging.ENABLED:
+        input_tokens = estimate_tokens(request_args['system']) + sum(
+            estimate_tokens(m['content']) for m in request_args['messages'])
+        yield from hedging.hedged_text(lambda: client.messages.stream(**request_args), on_open, input_tokens)
+        return
+    with client.messages.stream(**request_args) as stream:
+        if on_open:
+            on_open(stream)
+        yield from stream.text_stream
+
+def stream_haiku(code, conversation_id, trace_id=None, on_open=None, pending_user=None):
+    # on_open(stream) is called with the live Anthropic stream; stream.close() from another
+    # thread aborts the upstream request (used for barge-in cancellation).
+    # pending_user is a user turn not stored yet (speculation from a partial transcript).
     # Build trimmed history synchronously
-    system_msg, messages = build_trimmed_history(conversation_id)
+    with tracing.span(trace_id, 'history_build'):
+        system_msg, messages = build_trimmed_history(conversation_id)
+    if pending_user:
+        messages.append({'role': 'user', 'content': pending_user})
 
     msgs = build_msg_ctx(messages, code=code)
 
     # print(msgs)
 
-    # Call the Anthropic Messages API and pass the system prompt as the top-level `system` parameter
-    with client.messages.stream(
+    request_args = dict(
         max_tokens=1024,
         temperature=temperature,
         messages=msgs,
         model=model,
         system=system_msg,
-    ) as stream:
-        for text in stream.text_stream:
+    )
+    cache_key = llm_cache.request_key(**request_args) if llm_cache.ENABLED else None
+    start = time.perf_counter()
+    if cache_key:
+        cached = llm_cache.get(cache_key)
+        if cached is not None:
+            # separate stage names keep replays out of the live llm_* latency histograms
+            tracing.record(trace_id, 'llm_cache_lookup', start)
+            yield from llm_cache.replay(cached)
+            tracing.record(trace_id, 'llm_cache_replay', start)
+            return
+
+    recorder = llm_cache.Recorder() if cache_key else None
+    first = True
+    metrics.gauge_inc('active_llm_streams', help_text='Anthropic streams in progress.')
+    try:
+        # Call the Anthropic Messages API and pass the system prompt as the top-level `system` parameter
+        for text in _live_text(request_args, on_open):
             # print(text)
+            if first:
+                tracing.record(trace_id, 'llm_first_token', start)
+                hedging.observe_first_token(time.perf_counter() - start)
+                first = False
+            if recorder:
+                recorder.add(text)
             yield text
+        tracing.record(trace_id, 'llm_complete', start)
+        # only complete replies get here: a closed stream (barge-in) raises in the loop
+        # above, hedged or not, and a caller that stops reading never resumes us
+        if recorder and recorder.chunks:
+            llm_cache.put(cache_key, recorder.chunks)
+    finally:
+        metrics.gauge_dec('active_llm_streams')
 
 def build_static_code_review_msgs(conversation_id: str, files: dict, language: str = 'python', extra_instructions: str = None):
     """
@@ -226,7 +259,7 @@ def stream_static_code_review(conversation_id: str, files: dict, language: str =
     system_text, msgs = build_static_code_review_msgs(conversation_id, files, language, extra_instructions)
     msgs_for_api = build_msg_ctx(msgs)
 
-    with client.messages.stream(
+    with providers.anthropic_client().messages.stream(
         max_tokens=1024,
         temperature=0.2,
         messages=msgs_for_api,
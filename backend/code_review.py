@@ -0,0 +1,148 @@
+"""Static code-review endpoint with per-file memoization.
+
+POST /conversations/<id>/code_review  JSON {files: {name: source}, language?, extra_instructions?}
+streams NDJSON events:
+
+    {"file": name, "cached": bool}   start of a file's review
+    {"text": "..."}                  review text for the current file
+    {"done": true} | {"error": "..."}
+
+Each file is reviewed on its own and the result is stored under a hash of
+(conversation, file name, language, instructions, source), so a repeated
+review only sends changed files to the model. Model calls run on
+REVIEW_WORKERS background threads fed by a queue of REVIEW_QUEUE_SIZE jobs;
+when it is full the endpoint answers 429 instead of piling up upstream calls.
+"""
+import os
+import json
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Blueprint, request, jsonify, Response
+
+import metrics
+from claude import stream_static_code_review
+from db import get_conversation
+
+REVIEW_WORKERS = int(os.environ.get('REVIEW_WORKERS', '2'))
+REVIEW_QUEUE_SIZE = int(os.environ.get('REVIEW_QUEUE_SIZE', '16'))
+REVIEW_CACHE_SIZE = int(os.environ.get('REVIEW_CACHE_SIZE', '1024'))
+MAX_REVIEW_FILES = int(os.environ.get('MAX_REVIEW_FILES', '20'))
+
+review_bp = Blueprint('code_review', __name__)
+
+_RESULTS = OrderedDict()  # file key -> review text
+_RESULTS_LOCK = threading.Lock()
+_JOBS = queue.Queue(maxsize=REVIEW_QUEUE_SIZE)
+_WORKERS = []
+_WORKERS_LOCK = threading.Lock()
+
+
+def file_key(conversation_id, name, source, language, extra_instructions):
+    h = hashlib.sha256()
+    for part in (conversation_id, name, language, extra_instructions or '', source):
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def _cached(key):
+    with _RESULTS_LOCK:
+        text = _RESULTS.get(key)
+        if text is not None:
+            _RESULTS.move_to_end(key)
+        return text
+
+
+def _store(key, text):
+    with _RESULTS_LOCK:
+        _RESULTS[key] = text
+        while len(_RESULTS) > REVIEW_CACHE_SIZE:
+            _RESULTS.popitem(last=False)
+
+
+def _worker():
+    while True:
+        # events go to the request's queue; results are stored even if the client left
+        events, conversation_id, files, language, extra = _JOBS.get()
+        try:
+            for name, source, key in files:
+                events.put({'file': name, 'cached': False})
+                parts = []
+                for chunk in stream_static_code_review(conversation_id, {name: source}, language, extra):
+                    parts.append(chunk)
+                    events.put({'text': chunk})
+                _store(key, ''.join(parts))
+            events.put({'done': True})
+        except Exception as e:
+            events.put({'error': str(e)})
+        finally:
+            events.put(None)
+            _JOBS.task_done()
+
+
+def _ensure_workers():
+    with _WORKERS_LOCK:
+        while len(_WORKERS) < REVIEW_WORKERS:
+            th = threading.Thread(target=_worker, name='code-review', daemon=True)
+            th.start()
+            _WORKERS.append(th)
+
+
+metrics.register_gauge('review_queue_depth', _JOBS.qsize, 'Code reviews waiting for a worker.')
+
+
+@review_bp.route('/conversations/<conversation_id>/code_review', methods=['POST'])
+def code_review_endpoint(conversation_id):
+    if not request.is_json:
+        return jsonify({"error": "expected JSON body"}), 400
+    payload = request.get_json()
+    files = payload.get('files')
+    language = payload.get('language') or 'python'
+    extra = payload.get('extra_instructions')
+    if not isinstance(files, dict) or not files or not all(isinstance(v, str) for v in files.values()):
+        return jsonify({"error": "files must be a non-empty object of name -> source"}), 400
+    if not isinstance(language, str) or (extra is not None and not isinstance(extra, str)):
+        return jsonify({"error": "language and extra_instructions must be strings"}), 400
+    if len(files) > MAX_REVIEW_FILES:
+        return jsonify({"error": f"too many files (max {MAX_REVIEW_FILES})"}), 413
+    if not get_conversation(conversation_id):
+        return jsonify({"error": "not found"}), 404
+
+    cached, changed = [], []
+    for name, source in files.items():
+        key = file_key(conversation_id, str(name), source, language, extra)
+        text = _cached(key)
+        if text is not None:
+            cached.append((name, text))
+        else:
+            changed.append((name, source, key))
+    metrics.counter_inc('review_files_cached_total', len(cached), 'Reviewed files served from memoized output.')
+    metrics.counter_inc('review_files_sent_total', len(changed), 'Reviewed files sent to the model.')
+
+    events = None
+    if changed:
+        events = queue.Queue()
+        _ensure_workers()
+        try:
+            _JOBS.put_nowait((events, conversation_id, changed, language, extra))
+        except queue.Full:
+            metrics.counter_inc('review_rejected_total', help_text='Code reviews refused because the queue was full.')
+            return jsonify({"error": "review queue full"}), 429, {'Retry-After': '5'}
+
+    def generate():
+        for name, text in cached:
+            yield json.dumps({'file': name, 'cached': True}) + '\n'
+            yield json.dumps({'text': text}) + '\n'
+        if events is None:
+            yield json.dumps({'done': True}) + '\n'
+            return
+        while True:
+            event = events.get()
+            if event is None:
+                break
+            yield json.dumps(event) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson', headers={'X-Accel-Buffering': 'no'})
@@ -1,19 +1,56 @@
+import os
 import sqlite3
 import json
 import uuid
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime, UTC
 
+import metrics
+
 DB_PATH = 'data.db'
 
+# Max ids bound per statement in IN (...) batches
+ID_BATCH_SIZE = 500
+
+# Write-behind settings: queued message inserts are committed by a single writer
+# thread in batches of up to WRITE_BATCH_SIZE rows, waiting at most
+# WRITE_FLUSH_MS (from the batch's first row) for a batch to fill.
+WRITE_BATCH_SIZE = int(os.environ.get('DB_WRITE_BATCH_SIZE', '64'))
+WRITE_FLUSH_MS = int(os.environ.get('DB_WRITE_FLUSH_MS', '20'))
+# how long internal callers (deletes, summarization) wait for queued writes
+WRITE_FLUSH_TIMEOUT_S = float(os.environ.get('DB_WRITE_FLUSH_TIMEOUT_S', '10'))
+
 def now_iso():
     return datetime.now(UTC).isoformat() + 'Z'
 
 
+def _add_column(cur, table, column, decl):
+    """Add a column to an existing table if it is missing. Returns True if added."""
+    cols = {r[1] for r in cur.execute(f'PRAGMA table_info({table})')}
+    if column in cols:
+        return False
+    cur.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+    return True
+
+
+# Bump whenever init_db's DDL/migrations change; stored in PRAGMA user_version
+# so an up-to-date DB is recognised with a single read at startup.
+SCHEMA_VERSION = 4
+
+
 def init_db():
     """Initialize the SQLite DB and create tables if they don't exist."""
     conn = sqlite3.connect(DB_PATH)
     try:
         cur = conn.cursor()
+        if cur.execute('PRAGMA user_version').fetchone()[0] >= SCHEMA_VERSION:
+            return
+        # only takes effect on a fresh file; existing DBs are converted by
+        # enable_incremental_vacuum() (see retention.py)
+        cur.execute('PRAGMA auto_vacuum = INCREMENTAL')
         cur.execute('''
         CREATE TABLE IF NOT EXISTS conversations (
             id TEXT PRIMARY KEY,
@@ -23,9 +60,15 @@ def init_db():
             system_message TEXT NOT NULL,
             status TEXT NOT NULL DEFAULT 'active',
             metadata TEXT,
-            last_summary_message_id TEXT
+            last_summary_message_id TEXT,
+            token_total INTEGER NOT NULL DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            last_message_id TEXT
         )
         ''')
+        added = _add_column(cur, 'conversations', 'token_total', 'INTEGER NOT NULL DEFAULT 0')
+        added = _add_column(cur, 'conversations', 'message_count', 'INTEGER NOT NULL DEFAULT 0') or added
+        added = _add_column(cur, 'conversations', 'last_message_id', 'TEXT') or added
         cur.execute('CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at)')
         cur.execute('CREATE INDEX IF NOT EXISTS idx_conversations_user_id ON conversations(user_id)')
 
@@ -37,10 +80,37 @@ def init_db():
             content TEXT NOT NULL,
             tokens_est INTEGER,
             created_at TEXT NOT NULL,
-            metadata TEXT
+            metadata TEXT,
+            summarized_by TEXT
         )
         ''')
-        cur.execute('CREATE INDEX IF NOT EXISTS idx_messages_conv_created_at ON messages(conversation_id, created_at)')
+        if _add_column(cur, 'messages', 'summarized_by', 'TEXT'):
+            # backfill rows summarized before the column existed
+            cur.execute('''
+            UPDATE messages SET summarized_by = COALESCE(
+                (SELECT last_summary_message_id FROM conversations c WHERE c.id = messages.conversation_id), '')
+            WHERE json_extract(metadata, '$.summarized') = 1
+            ''')
+        if added:
+            # backfill running totals for conversations created before the columns existed
+            cur.execute('''
+            UPDATE conversations SET
+                token_total = (SELECT COALESCE(SUM(tokens_est), 0) FROM messages m WHERE m.conversation_id = conversations.id),
+                message_count = (SELECT COUNT(*) FROM messages m WHERE m.conversation_id = conversations.id),
+                last_message_id = (SELECT id FROM messages m WHERE m.conversation_id = conversations.id
+                                   ORDER BY created_at DESC, id DESC LIMIT 1)
+            ''')
+        # (conversation_id, created_at, id) backs keyset pagination; it supersedes the old two-column index
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_messages_conv_created_id ON messages(conversation_id, created_at, id)')
+        cur.execute('DROP INDEX IF EXISTS idx_messages_conv_created_at')
+        # partial index: "unsummarized messages in conversation X" in order
+        cur.execute('CREATE INDEX IF NOT EXISTS idx_messages_unsummarized ON messages(conversation_id, created_at, id) WHERE summarized_by IS NULL')
+        # journal_mode can't change inside a transaction (the DDL/backfill above
+        # opened one) and would silently stay as it was, so commit first
+        conn.commit()
+        # WAL lets readers proceed while the writer thread commits
+        cur.execute('PRAGMA journal_mode=WAL').fetchone()
+        cur.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
     finally:
         conn.close()
@@ -68,10 +138,28 @@ def create_conversation(system_message, user_id=None, metadata=None):
         conn.close()
 
 
-def get_conversation(conversation_id):
+_CONVERSATION_COLUMNS = ('id', 'created_at', 'updated_at', 'system_message', 'user_id', 'status', 'metadata',
+                         'last_summary_message_id', 'token_total', 'message_count', 'last_message_id')
+
+
+def get_conversation(conversation_id, columns=None):
+    """Conversation dict, or None. `columns` loads only those fields (skips decoding
+    metadata unless it is asked for)."""
     conn = _connect()
     try:
         cur = conn.cursor()
+        if columns:
+            unknown = set(columns) - set(_CONVERSATION_COLUMNS)
+            if unknown:
+                raise ValueError(f'unknown conversation columns: {sorted(unknown)}')
+            cur.execute(f"SELECT {', '.join(columns)} FROM conversations WHERE id = ?", (conversation_id,))
+            row = cur.fetchone()
+            if not row:
+                return None
+            out = dict(zip(columns, row))
+            if 'metadata' in out:
+                out['metadata'] = json.loads(out['metadata']) if out['metadata'] else {}
+            return out
         cur.execute('SELECT * FROM conversations WHERE id = ?', (conversation_id,))
         row = cur.fetchone()
         if not row:
@@ -85,15 +173,22 @@ def get_conversation(conversation_id):
             'status': row['status'],
             'metadata': json.loads(row['metadata']) if row['metadata'] else {},
             'last_summary_message_id': row['last_summary_message_id'],
+            'token_total': row['token_total'],
+            'message_count': row['message_count'],
+            'last_message_id': row['last_message_id'],
         }
     finally:
         conn.close()
 
 
 def delete_conversation(conversation_id):
+    # make sure queued inserts for this conversation don't land after the delete
+    flush_writes(WRITE_FLUSH_TIMEOUT_S)
     conn = _connect()
     try:
         cur = conn.cursor()
+        # the conversation row carries the running totals, so removing it and
+        # its messages in one transaction keeps them consistent
         cur.execute('DELETE FROM conversations WHERE id = ?', (conversation_id,))
         deleted = cur.rowcount > 0
         if deleted:
@@ -104,69 +199,555 @@ def delete_conversation(conversation_id):
         conn.close()
 
 
-def insert_message(conversation_id, role, content, msg_id=None, metadata=None):
+def list_stale_conversations(updated_before, limit=100):
+    """Return ids of conversations last updated before `updated_before` (ISO string), oldest first."""
     conn = _connect()
     try:
         cur = conn.cursor()
-        msg_id = msg_id or str(uuid.uuid4())
-        created_at = now_iso()
-        tokens_est = max(1, int(len(content) / 4)) if content else None
-        meta_text = json.dumps(metadata or {})
-        cur.execute(
-            "INSERT INTO messages (id, conversation_id, role, content, tokens_est, created_at, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (msg_id, conversation_id, role, content, tokens_est, created_at, meta_text),
-        )
-        # update conversation updated_at
-        cur.execute('UPDATE conversations SET updated_at = ? WHERE id = ?', (created_at, conversation_id))
-        conn.commit()
-        return msg_id
+        cur.execute('SELECT id FROM conversations WHERE updated_at < ? ORDER BY updated_at ASC LIMIT ?', (updated_before, limit))
+        return [r['id'] for r in cur.fetchall()]
     finally:
         conn.close()
 
 
-def get_messages(conversation_id, since=None, limit=100):
+def delete_conversations(conversation_ids, updated_before=None):
+    """Delete several conversations and their messages in one transaction.
+
+    With `updated_before` (ISO string) a conversation is only deleted if it is
+    still idle, so one written to after it was picked (e.g. archived) survives.
+    Returns the ids actually deleted.
+    """
+    if not conversation_ids:
+        return []
+    flush_writes(WRITE_FLUSH_TIMEOUT_S)
     conn = _connect()
     try:
         cur = conn.cursor()
-        if since:
-            cur.execute('SELECT * FROM messages WHERE conversation_id = ? AND created_at > ? ORDER BY created_at ASC LIMIT ?', (conversation_id, since, limit))
+        # take the write lock before re-checking updated_at so no insert lands in between
+        cur.execute('BEGIN IMMEDIATE')
+        deleted = []
+        for i in range(0, len(conversation_ids), ID_BATCH_SIZE):
+            batch = conversation_ids[i:i + ID_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            if updated_before is None:
+                cur.execute(f'SELECT id FROM conversations WHERE id IN ({placeholders})', batch)
+            else:
+                cur.execute(f'SELECT id FROM conversations WHERE id IN ({placeholders}) AND updated_at < ?',
+                            (*batch, updated_before))
+            batch = [r['id'] for r in cur.fetchall()]
+            if not batch:
+                continue
+            placeholders = ','.join('?' * len(batch))
+            cur.execute(f'DELETE FROM messages WHERE conversation_id IN ({placeholders})', batch)
+            cur.execute(f'DELETE FROM conversations WHERE id IN ({placeholders})', batch)
+            deleted += batch
+        conn.commit()
+        return deleted
+    finally:
+        conn.close()
+
+
+def enable_incremental_vacuum():
+    """Switch an existing DB to auto_vacuum=INCREMENTAL. Needs one full VACUUM, so
+    it is a no-op when already enabled. Returns True if a conversion ran."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return False
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return True
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(max_pages=None):
+    """Return up to max_pages free pages (all when None) to the filesystem."""
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        if max_pages:
+            conn.execute(f'PRAGMA incremental_vacuum({int(max_pages)})').fetchall()
         else:
-            cur.execute('SELECT * FROM messages WHERE conversation_id = ? ORDER BY created_at ASC LIMIT ?', (conversation_id, limit))
-        rows = cur.fetchall()
-        out = []
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    finally:
+        conn.close()
+
+
+def db_stats():
+    """Size and row-count report for DB_PATH."""
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        page_size = cur.execute('PRAGMA page_size').fetchone()[0]
+        page_count = cur.execute('PRAGMA page_count').fetchone()[0]
+        freelist = cur.execute('PRAGMA freelist_count').fetchone()[0]
+        conversations = cur.execute('SELECT COUNT(*) FROM conversations').fetchone()[0]
+        messages = cur.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    finally:
+        conn.close()
+    wal_path = DB_PATH + '-wal'
+    return {
+        'path': DB_PATH,
+        'file_bytes': os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0,
+        'wal_bytes': os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+        'page_size': page_size,
+        'page_count': page_count,
+        'free_pages': freelist,
+        'conversations': conversations,
+        'messages': messages,
+    }
+
+
+def _message_row(conversation_id, role, content, msg_id=None, metadata=None):
+    return {
+        'id': msg_id or str(uuid.uuid4()),
+        'conversation_id': conversation_id,
+        'role': role,
+        'content': content,
+        'tokens_est': max(1, int(len(content) / 4)) if content else None,
+        'created_at': now_iso(),
+        'metadata': metadata or {},
+    }
+
+
+class Message:
+    """One message row.
+
+    Slotted to keep long histories small; the metadata JSON is only decoded on
+    first access to `.metadata`. Read-only mapping access (m['content'],
+    m.get(), dict(m)) keeps it a drop-in for the plain dicts callers used.
+    Columns left out by a `columns=` projection are simply absent (KeyError).
+    """
+    __slots__ = ('id', 'conversation_id', 'role', 'content', 'tokens_est', 'created_at',
+                 '_metadata_raw', '_metadata')
+    FIELDS = ('id', 'conversation_id', 'role', 'content', 'tokens_est', 'created_at', 'metadata')
+
+    def __init__(self, id: str, conversation_id: str, role: str, content: str,
+                 tokens_est: int = None, created_at: str = None, metadata: dict = None):
+        self.id = id
+        self.conversation_id = conversation_id
+        self.role = role
+        self.content = content
+        self.tokens_est = tokens_est
+        self.created_at = created_at
+        self._metadata = metadata or {}
+
+    @classmethod
+    def _from_values(cls, slots, values):
+        m = object.__new__(cls)
+        for slot, value in zip(slots, values):
+            if slot:
+                setattr(m, slot, value)
+        return m
+
+    @property
+    def metadata(self) -> dict:
+        try:
+            return self._metadata
+        except AttributeError:
+            raw = self._metadata_raw  # AttributeError if not selected
+            self._metadata = json.loads(raw) if raw else {}
+            return self._metadata
+
+    def _has(self, field):
+        if field == 'metadata':
+            return hasattr(self, '_metadata') or hasattr(self, '_metadata_raw')
+        return hasattr(self, field)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return [f for f in self.FIELDS if self._has(f)]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.FIELDS and self._has(key)
+
+    def __len__(self):
+        return len(self.keys())
+
+    def to_dict(self):
+        return {k: self[k] for k in self.keys()}
+
+    def to_json(self):
+        """JSON object text; undecoded metadata is spliced in as stored, not re-encoded."""
+        if hasattr(self, '_metadata') or not hasattr(self, '_metadata_raw'):
+            return json.dumps(self.to_dict())
+        head = json.dumps({k: getattr(self, k) for k in self.FIELDS[:-1] if hasattr(self, k)})
+        return f'{head[:-1]}, "metadata": {self._metadata_raw or "{}"}}}'
+
+    def __repr__(self):
+        return f'Message({self.to_dict()!r})'
+
+
+# column name -> Message slot (None = not kept, e.g. summarized_by)
+_MESSAGE_SLOTS = {f: f for f in Message.FIELDS[:-1]}
+_MESSAGE_SLOTS['metadata'] = '_metadata_raw'
+# always selected: ordering, cursors and de-duplication against pending rows need them
+_MESSAGE_KEY_COLUMNS = ('id', 'created_at')
+
+
+def _select_columns(columns):
+    """SQL column list for a projection (None = every column)."""
+    if not columns:
+        return '*'
+    cols = list(_MESSAGE_KEY_COLUMNS)
+    for c in columns:
+        if c not in _MESSAGE_SLOTS:
+            raise ValueError(f'unknown message column: {c}')
+        if c not in cols:
+            cols.append(c)
+    return ', '.join(cols)
+
+
+def _fetch_messages(cur):
+    slots = [_MESSAGE_SLOTS.get(d[0]) for d in cur.description]
+    from_values = Message._from_values
+    return [from_values(slots, row) for row in cur.fetchall()]
+
+
+def _message_connect():
+    # plain tuples: _fetch_messages maps them straight into Message slots
+    return sqlite3.connect(DB_PATH)
+
+
+def _write_rows(cur, rows):
+    """Insert message rows and update each conversation's updated_at and running
+    totals (token_total, message_count, last_message_id). Caller commits."""
+    cur.executemany(
+        "INSERT INTO messages (id, conversation_id, role, content, tokens_est, created_at, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(r['id'], r['conversation_id'], r['role'], r['content'], r['tokens_est'], r['created_at'], json.dumps(r['metadata']))
+         for r in rows],
+    )
+    # one conversation UPDATE per conversation in the batch
+    totals = {}
+    for r in rows:
+        t = totals.setdefault(r['conversation_id'], {'tokens': 0, 'count': 0, 'last': r})
+        t['tokens'] += r['tokens_est'] or 0
+        t['count'] += 1
+        if (r['created_at'], r['id']) > (t['last']['created_at'], t['last']['id']):
+            t['last'] = r
+    cur.executemany(
+        'UPDATE conversations SET updated_at = ?, token_total = token_total + ?, message_count = message_count + ?, last_message_id = ? WHERE id = ?',
+        [(t['last']['created_at'], t['tokens'], t['count'], t['last']['id'], cid) for cid, t in totals.items()],
+    )
+
+
+def insert_message(conversation_id, role, content, msg_id=None, metadata=None):
+    row = _message_row(conversation_id, role, content, msg_id, metadata)
+    conn = _connect()
+    try:
+        _write_rows(conn.cursor(), [row])
+        conn.commit()
+        return row['id']
+    finally:
+        conn.close()
+
+
+# --- Write-behind queue ---------------------------------------------------
+# enqueue_message() returns immediately; the writer thread commits queued rows
+# in batches. Until a row is committed it is kept in _PENDING so get_messages
+# still sees it (read-your-writes for the LLM history build).
+
+_WRITE_Q = queue.Queue()
+_PENDING = {}  # conversation_id -> {msg_id: row}
+_PENDING_LOCK = threading.Lock()
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def _ensure_writer():
+    global _WRITER
+    if _WRITER is not None and _WRITER.is_alive():
+        return
+    with _WRITER_LOCK:
+        if _WRITER is None or not _WRITER.is_alive():
+            _WRITER = threading.Thread(target=_writer_loop, name='db-writer', daemon=True)
+            _WRITER.start()
+
+
+def _writer_loop():
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        while True:
+            item = _WRITE_Q.get()
+            batch = [item]
+            deadline = time.monotonic() + WRITE_FLUSH_MS / 1000
+            # gather more work until the batch is full or the flush window closes;
+            # a flush/stop request ends the window early so callers don't wait on it
+            while len(batch) < WRITE_BATCH_SIZE and isinstance(batch[-1], dict):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(_WRITE_Q.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            rows = [b for b in batch if isinstance(b, dict)]
+            try:
+                if rows:
+                    _commit_batch(conn, rows)
+            except Exception as e:
+                # keep the writer alive; _commit_batch already retried row by row
+                print('db writer: batch failed:', e)
+            finally:
+                for b in batch:
+                    if isinstance(b, threading.Event):
+                        b.set()
+            if any(b is None for b in batch):
+                return
+    finally:
+        conn.close()
+
+
+def _commit_batch(conn, rows):
+    try:
+        with metrics.timed('db_commit'):
+            _write_rows(conn.cursor(), rows)
+            conn.commit()
+    except Exception as e:
+        # fall back to one row per transaction so a single bad row (a constraint
+        # violation, unserializable metadata, ...) can't drop the batch
+        conn.rollback()
+        print('db writer: batch commit failed, retrying per row:', e)
         for r in rows:
-            out.append({
-                'id': r['id'],
-                'conversation_id': r['conversation_id'],
-                'role': r['role'],
-                'content': r['content'],
-                'tokens_est': r['tokens_est'],
-                'created_at': r['created_at'],
-                'metadata': json.loads(r['metadata']) if r['metadata'] else {},
-            })
+            try:
+                _write_rows(conn.cursor(), [r])
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print('db writer: dropping message', r['id'], e)
+    with _PENDING_LOCK:
+        for r in rows:
+            pending = _PENDING.get(r['conversation_id'])
+            if pending is not None:
+                pending.pop(r['id'], None)
+                if not pending:
+                    del _PENDING[r['conversation_id']]
+
+
+def enqueue_message(conversation_id, role, content, msg_id=None, metadata=None):
+    """Queue a message insert for the background writer and return its id right away."""
+    row = _message_row(conversation_id, role, content, msg_id, metadata)
+    with _PENDING_LOCK:
+        _PENDING.setdefault(conversation_id, {})[row['id']] = row
+    _ensure_writer()
+    _WRITE_Q.put(row)
+    return row['id']
+
+
+metrics.register_gauge('db_write_queue_depth', _WRITE_Q.qsize, 'Messages waiting for the DB writer thread.')
+
+
+def flush_writes(timeout=None):
+    """Block until every message queued so far has been committed (or dropped).
+    Returns False if `timeout` ran out first."""
+    if _WRITER is None or not _WRITER.is_alive():
+        return True
+    done = threading.Event()
+    _WRITE_Q.put(done)
+    if done.wait(timeout):
+        return True
+    print(f'db writer: flush not done after {timeout}s, continuing')
+    return False
+
+
+def close_writer(timeout=10.0):
+    """Flush queued writes and stop the writer thread (registered with atexit)."""
+    if _WRITER is None or not _WRITER.is_alive():
+        return
+    _WRITE_Q.put(None)
+    _WRITER.join(timeout)
+
+
+atexit.register(close_writer)
+
+
+def _pending_messages(conversation_id):
+    with _PENDING_LOCK:
+        return [Message(**r) for r in _PENDING.get(conversation_id, {}).values()]
+
+
+def encode_cursor(message):
+    """Opaque keyset cursor for a message: its (created_at, id) position."""
+    return f"{message['created_at']}|{message['id']}"
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor. Raises ValueError on malformed input."""
+    created_at, sep, msg_id = (cursor or '').rpartition('|')
+    if not sep or not created_at or not msg_id:
+        raise ValueError('invalid cursor')
+    return created_at, msg_id
+
+
+def get_messages(conversation_id, since=None, limit=100, after=None, columns=None):
+    """Return Message records ordered by (created_at, id).
+
+    `after` is a (created_at, id) keyset position (see decode_cursor); only
+    messages strictly after it are returned, so pages never skip or repeat
+    rows that share a timestamp. `since` is the older timestamp-only filter.
+    `columns` limits the columns loaded (id and created_at are always included).
+    """
+    # snapshot queued rows before querying so a row committed in between is
+    # seen at least once (duplicates are dropped below)
+    pending = _pending_messages(conversation_id)
+    cols = _select_columns(columns)
+    conn = _message_connect()
+    try:
+        cur = conn.cursor()
+        if after:
+            cur.execute(f'SELECT {cols} FROM messages WHERE conversation_id = ? AND (created_at, id) > (?, ?) ORDER BY created_at ASC, id ASC LIMIT ?', (conversation_id, after[0], after[1], limit))
+        elif since:
+            cur.execute(f'SELECT {cols} FROM messages WHERE conversation_id = ? AND created_at > ? ORDER BY created_at ASC, id ASC LIMIT ?', (conversation_id, since, limit))
+        else:
+            cur.execute(f'SELECT {cols} FROM messages WHERE conversation_id = ? ORDER BY created_at ASC, id ASC LIMIT ?', (conversation_id, limit))
+        out = _fetch_messages(cur)
+        if pending:
+            seen = {m['id'] for m in out}
+            if after:
+                pending = [p for p in pending if (p['created_at'], p['id']) > tuple(after)]
+            elif since:
+                pending = [p for p in pending if p['created_at'] > since]
+            out.extend(p for p in pending if p['id'] not in seen)
+            out.sort(key=lambda m: (m['created_at'], m['id']))
+            out = out[:limit]
         return out
     finally:
         conn.close()
 
 
+def iter_messages(conversation_id, batch_size=500, columns=None):
+    """Yield every message of a conversation in order, one keyset page at a time.
+
+    Each page uses its own short-lived connection, so memory stays bounded and
+    no read transaction is held open while the caller consumes the rows.
+    """
+    after = None
+    while True:
+        page = get_messages(conversation_id, limit=batch_size, after=after, columns=columns)
+        yield from page
+        if len(page) < batch_size:
+            return
+        after = (page[-1]['created_at'], page[-1]['id'])
+
+
+def get_recent_messages(conversation_id, token_budget, max_messages=200, columns=None):
+    """Return the newest non-memory messages whose tokens fit in token_budget, oldest first.
+
+    The budget cut is done in SQL with a running SUM() window over the newest
+    max_messages rows, so older history is never loaded. Queued (not yet
+    committed) messages are the newest and are accounted for first.
+    """
+    pending = sorted((p for p in _pending_messages(conversation_id) if p['role'] != 'memory'),
+                     key=lambda m: (m['created_at'], m['id']), reverse=True)
+    picked = []
+    used = 0
+    for p in pending:
+        t = p['tokens_est'] or 0
+        if used + t > token_budget or len(picked) >= max_messages:
+            return list(reversed(picked))
+        picked.append(p)
+        used += t
+
+    exclude = [p['id'] for p in pending]
+    placeholders = ','.join('?' * len(exclude))
+    not_pending = f'AND id NOT IN ({placeholders})' if exclude else ''
+    cols = _select_columns(columns)
+    conn = _message_connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(f'''
+        SELECT {cols} FROM (
+            SELECT *, SUM(COALESCE(tokens_est, 0)) OVER (ORDER BY created_at DESC, id DESC ROWS UNBOUNDED PRECEDING) AS running
+            FROM (
+                SELECT * FROM messages
+                WHERE conversation_id = ? AND role != 'memory' {not_pending}
+                ORDER BY created_at DESC, id DESC
+                LIMIT ?
+            )
+        )
+        WHERE running <= ?
+        ORDER BY created_at ASC, id ASC
+        ''', (conversation_id, *exclude, max_messages - len(picked), token_budget - used))
+        return _fetch_messages(cur) + list(reversed(picked))
+    finally:
+        conn.close()
+
+
+def get_memory_messages(conversation_id, columns=None):
+    """Return the conversation's memory (summary) messages, oldest first."""
+    pending = [p for p in _pending_messages(conversation_id) if p['role'] == 'memory']
+    cols = _select_columns(columns)
+    conn = _message_connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {cols} FROM messages WHERE conversation_id = ? AND role = 'memory' ORDER BY created_at ASC, id ASC", (conversation_id,))
+        out = _fetch_messages(cur)
+    finally:
+        conn.close()
+    if pending:
+        seen = {m['id'] for m in out}
+        out.extend(p for p in pending if p['id'] not in seen)
+        out.sort(key=lambda m: (m['created_at'], m['id']))
+    return out
+
+
+def get_unsummarized_messages(conversation_id, limit=1000):
+    """Return messages not yet folded into a summary, oldest first."""
+    flush_writes(WRITE_FLUSH_TIMEOUT_S)
+    conn = _message_connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            'SELECT * FROM messages WHERE conversation_id = ? AND summarized_by IS NULL ORDER BY created_at ASC, id ASC LIMIT ?',
+            (conversation_id, limit),
+        )
+        return _fetch_messages(cur)
+    finally:
+        conn.close()
+
+
 def mark_messages_summarized(message_ids, summary_message_id):
+    """Mark messages as covered by `summary_message_id`.
+
+    One UPDATE per ID_BATCH_SIZE ids; metadata.summarized is kept in sync via
+    json_set so older readers of the metadata flag still work.
+    """
     if not message_ids:
         return
+    message_ids = list(message_ids)
+    # queued inserts must be on disk before we can update them
+    flush_writes(WRITE_FLUSH_TIMEOUT_S)
     conn = _connect()
     try:
         cur = conn.cursor()
-        for mid in message_ids:
-            # set metadata.summarized = true
-            cur.execute('SELECT metadata FROM messages WHERE id = ?', (mid,))
-            row = cur.fetchone()
-            if not row:
-                continue
-            meta = json.loads(row['metadata']) if row['metadata'] else {}
-            meta['summarized'] = True
-            cur.execute('UPDATE messages SET metadata = ? WHERE id = ?', (json.dumps(meta), mid))
+        for i in range(0, len(message_ids), ID_BATCH_SIZE):
+            batch = message_ids[i:i + ID_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            cur.execute(
+                f"UPDATE messages SET summarized_by = ?, "
+                f"metadata = json_set(COALESCE(NULLIF(metadata, ''), '{{}}'), '$.summarized', json('true')) "
+                f"WHERE id IN ({placeholders})",
+                (summary_message_id, *batch),
+            )
         # update conversation last_summary_message_id
         cur.execute('UPDATE conversations SET last_summary_message_id = ? WHERE id = (SELECT conversation_id FROM messages WHERE id = ?)', (summary_message_id, message_ids[0]))
         conn.commit()
     finally:
         conn.close()
-
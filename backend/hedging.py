@@ -0,0 +1,179 @@
+"""Hedged Anthropic streams for tail-latency reduction.
+
+With LLM_HEDGE_ENABLED=1, if the first token of a reply has not arrived by a
+deadline, a second identical request is started; whichever stream produces
+text first wins and the other is closed (which aborts it upstream).
+
+The deadline is the LLM_HEDGE_PERCENTILE of recent first-token latencies
+(never below LLM_HEDGE_MIN_DEADLINE_MS; LLM_HEDGE_DEFAULT_DEADLINE_MS until
+enough samples are in). Hedges are capped at LLM_HEDGE_MAX_RATE of requests
+by a small token bucket, so a provider-wide slowdown cannot double traffic.
+
+Closing the group handed to on_open() makes hedged_text raise StreamCancelled,
+as closing a plain stream makes its read fail, so a cut-off reply is never
+mistaken for a complete one.
+"""
+import os
+import math
+import time
+import queue
+import threading
+from collections import deque
+
+import metrics
+
+ENABLED = os.environ.get('LLM_HEDGE_ENABLED', '0') == '1'
+PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', '95'))
+MIN_DEADLINE_MS = float(os.environ.get('LLM_HEDGE_MIN_DEADLINE_MS', '500'))
+DEFAULT_DEADLINE_MS = float(os.environ.get('LLM_HEDGE_DEFAULT_DEADLINE_MS', '2000'))
+MIN_SAMPLES = int(os.environ.get('LLM_HEDGE_MIN_SAMPLES', '20'))
+MAX_RATE = float(os.environ.get('LLM_HEDGE_MAX_RATE', '0.05'))
+BURST = float(os.environ.get('LLM_HEDGE_BURST', '2'))
+
+_SAMPLES = deque(maxlen=500)  # recent first-token latencies, seconds
+_LOCK = threading.Lock()
+_credit = 1.0
+
+_DONE = object()
+
+
+class StreamCancelled(Exception):
+    """The hedge group was closed (barge-in) before the reply finished."""
+
+
+def observe_first_token(seconds):
+    with _LOCK:
+        _SAMPLES.append(seconds)
+
+
+def deadline():
+    """Seconds to wait for a first token before hedging."""
+    with _LOCK:
+        samples = sorted(_SAMPLES)
+    if len(samples) < MIN_SAMPLES:
+        return DEFAULT_DEADLINE_MS / 1000
+    rank = max(1, math.ceil(PERCENTILE / 100 * len(samples)))
+    return max(MIN_DEADLINE_MS / 1000, samples[rank - 1])
+
+
+def _earn():
+    global _credit
+    with _LOCK:
+        _credit = min(BURST, _credit + MAX_RATE)
+
+
+def _spend():
+    global _credit
+    with _LOCK:
+        if _credit >= 1.0:
+            _credit -= 1.0
+            return True
+    return False
+
+
+class _Attempt:
+    def __init__(self):
+        self.stream = None
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            stream = self.stream
+        if stream is not None:
+            stream.close()
+
+
+class _Group:
+    """Handed to on_open(): close() aborts every attempt (barge-in)."""
+
+    def __init__(self):
+        self.attempts = []
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        for a in list(self.attempts):
+            a.close()
+
+
+def _run(open_stream, attempt, q):
+    try:
+        with open_stream() as stream:
+            with attempt.lock:
+                attempt.stream = stream
+                closed = attempt.closed
+            if closed:
+                return
+            for text in stream.text_stream:
+                q.put((attempt, text))
+        q.put((attempt, _DONE))
+    except Exception as e:
+        q.put((attempt, e))
+
+
+def hedged_text(open_stream, on_open=None, input_tokens=0):
+    """Yield reply text from open_stream() (a messages.stream(...) context manager),
+    hedging with a second identical request if the first token is late."""
+    _earn()
+    q = queue.Queue()
+    group = _Group()
+
+    def launch():
+        attempt = _Attempt()
+        group.attempts.append(attempt)
+        threading.Thread(target=_run, args=(open_stream, attempt, q), name='llm-attempt', daemon=True).start()
+
+    if on_open:
+        on_open(group)
+    launch()
+    start = time.perf_counter()
+    wait_until = start + deadline()
+    hedge_considered = False
+    failed = 0
+    try:
+        # race until some attempt produces text (or finishes)
+        while True:
+            timeout = None if hedge_considered else max(0.0, wait_until - time.perf_counter())
+            try:
+                attempt, item = q.get(timeout=timeout)
+            except queue.Empty:
+                hedge_considered = True
+                if _spend():
+                    metrics.counter_inc('llm_hedges_total', help_text='Second Anthropic requests started for a late first token.')
+                    metrics.counter_inc('llm_hedge_extra_input_tokens_total', input_tokens,
+                                        'Estimated input tokens spent on hedge requests.')
+                    launch()
+                else:
+                    metrics.counter_inc('llm_hedges_skipped_total', help_text='Hedges not started because of the budget cap.')
+                continue
+            if group.closed:
+                raise StreamCancelled()
+            if isinstance(item, Exception):
+                failed += 1
+                if failed == len(group.attempts):
+                    raise item
+                continue
+            winner = attempt
+            break
+
+        if len(group.attempts) > 1:
+            if winner is group.attempts[1]:
+                metrics.counter_inc('llm_hedge_wins_total', help_text='Hedge requests that produced the first token.')
+            for a in group.attempts:
+                if a is not winner:
+                    a.close()
+
+        while True:
+            if attempt is winner:
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+            attempt, item = q.get()
+            if group.closed:
+                raise StreamCancelled()
+    finally:
+        group.close()
@@ -0,0 +1,106 @@
+"""Opt-in in-memory cache of streamed LLM replies.
+
+stream_haiku runs at temperature 0, so the same (model, system prompt,
+messages) request gets effectively the same reply - typical for the first
+turns of popular problems. With LLM_CACHE_ENABLED=1 a completed stream is
+stored under a canonical hash of the request, together with the gaps between
+its chunks, and an identical request is replayed as a stream with the same
+pacing (LLM_CACHE_REPLAY_SPEED: 2 = twice as fast, 0 = no delays) so downstream
+consumers (socket.io, TTS) see a normal reply.
+
+Entries expire after LLM_CACHE_TTL_S; the cache is LRU-bounded by
+LLM_CACHE_MAX_ENTRIES and LLM_CACHE_MAX_BYTES of stored text.
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+
+ENABLED = os.environ.get('LLM_CACHE_ENABLED', '0') == '1'
+TTL_S = float(os.environ.get('LLM_CACHE_TTL_S', '3600'))
+MAX_ENTRIES = int(os.environ.get('LLM_CACHE_MAX_ENTRIES', '512'))
+MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', str(8 * 1024 * 1024)))
+REPLAY_SPEED = float(os.environ.get('LLM_CACHE_REPLAY_SPEED', '1.0'))
+
+# key -> (stored_at, [(gap_s, text), ...], size)
+_ENTRIES = OrderedDict()
+_LOCK = threading.Lock()
+_BYTES = 0
+
+
+def request_key(**request):
+    """Canonical hash of the API request parameters (model, system, messages, ...)."""
+    blob = json.dumps(request, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+def _drop(key):
+    global _BYTES
+    _, _, size = _ENTRIES.pop(key)
+    _BYTES -= size
+
+
+def get(key):
+    """Recorded [(gap_s, text), ...] for key, or None."""
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is not None and time.time() - entry[0] > TTL_S:
+            _drop(key)
+            entry = None
+        if entry is None:
+            metrics.counter_inc('llm_cache_misses_total', help_text='LLM requests not found in the response cache.')
+            return None
+        _ENTRIES.move_to_end(key)
+    metrics.counter_inc('llm_cache_hits_total', help_text='LLM requests replayed from the response cache.')
+    return entry[1]
+
+
+def put(key, chunks):
+    global _BYTES
+    size = sum(len(text.encode('utf-8')) for _, text in chunks)
+    if size > MAX_BYTES:
+        return
+    with _LOCK:
+        if key in _ENTRIES:
+            _drop(key)
+        _ENTRIES[key] = (time.time(), chunks, size)
+        _BYTES += size
+        while len(_ENTRIES) > MAX_ENTRIES or _BYTES > MAX_BYTES:
+            _drop(next(iter(_ENTRIES)))
+
+
+def replay(chunks):
+    """Yield recorded chunks with their original pacing (first chunk immediately)."""
+    for i, (gap, text) in enumerate(chunks):
+        if i and REPLAY_SPEED > 0 and gap > 0:
+            time.sleep(gap / REPLAY_SPEED)
+        yield text
+
+
+class Recorder:
+    """Collects (gap_s, text) pairs from a live stream."""
+    __slots__ = ('chunks', 'last')
+
+    def __init__(self):
+        self.chunks = []
+        self.last = None
+
+    def add(self, text):
+        now = time.perf_counter()
+        self.chunks.append((0.0 if self.last is None else now - self.last, text))
+        self.last = now
+
+
+def clear():
+    global _BYTES
+    with _LOCK:
+        _ENTRIES.clear()
+        _BYTES = 0
+
+
+metrics.register_gauge('llm_cache_entries', lambda: len(_ENTRIES), 'Replies held in the LLM response cache.')
+metrics.register_gauge('llm_cache_bytes', lambda: _BYTES, 'Text bytes held in the LLM response cache.')
@@ -1,84 +1,51 @@
+import time
+_STARTUP_T0 = time.perf_counter()
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
 import os
+import sys
+import json
 import uuid
+import signal
 from flask import Flask, request, send_file, jsonify, Response
 from flask_socketio import SocketIO
 from flask_cors import CORS
 
 # Local modules
-from db import init_db, create_conversation, get_conversation, delete_conversation, insert_message, get_messages, now_iso
+from db import init_db, create_conversation, get_conversation, delete_conversation, enqueue_message, get_messages, iter_messages, encode_cursor, decode_cursor, now_iso
 from claude import build_trimmed_history, stream_haiku, SYSTEM_PROMPT
-from tts import synthesize_stream, synthesize_stream_gen
+from tts import synthesize_stream, synthesize_stream_gen, synthesize_complete, presynthesize, MODEL_ID
+from message_chunks import MESSAGE_CHUNKS, get_or_create_message_tracker, add_chunk_to_message, mark_message_complete, iter_message_chunks, cancel_message, is_cancelled, on_cancel
 import threading
 import queue
 from sst import sst_bp
-
-# In-memory session store: session_id -> {text_q, audio_q, thread}
+from admin import admin_bp
+from code_review import review_bp
+import metrics
+import tracing
+import providers
+import audio_formats
+import audio_store
+import audio_push
+import speculation
+from retention import start_retention_thread
+
+_IMPORTS_DONE = time.perf_counter()
+
+# In-memory session store: session_id -> {audio_q, thread}; session text lives in MESSAGE_CHUNKS[session_id]
 SESSIONS = {}
 
-# In-memory message chunk tracker: message_id -> {'chunks': [], 'complete': bool, 'lock': threading.Lock(), 'condition': threading.Condition()}
-# This allows multiple readers to wait for chunks as they arrive
-MESSAGE_CHUNKS = {}
-
-def get_or_create_message_tracker(message_id):
-    """Get or create a message tracker with thread-safe access."""
-    if message_id not in MESSAGE_CHUNKS:
-        lock = threading.Lock()
-        MESSAGE_CHUNKS[message_id] = {
-            'chunks': [],
-            'complete': False,
-            'lock': lock,
-            'condition': threading.Condition(lock)
-        }
-    return MESSAGE_CHUNKS[message_id]
-
-def add_chunk_to_message(message_id, chunk):
-    """Add a chunk to a message tracker and notify waiting consumers."""
-    tracker = get_or_create_message_tracker(message_id)
-    with tracker['condition']:
-        tracker['chunks'].append(chunk)
-        tracker['condition'].notify_all()
-
-def mark_message_complete(message_id):
-    """Mark a message as complete and notify all waiting consumers."""
-    if message_id in MESSAGE_CHUNKS:
-        tracker = MESSAGE_CHUNKS[message_id]
-        with tracker['condition']:
-            tracker['complete'] = True
-            tracker['condition'].notify_all()
-
-def iter_message_chunks(message_id, start_index=0):
-    """Yield chunks from a message as they become available. Blocks until new chunks arrive."""
-    tracker = get_or_create_message_tracker(message_id)
-    index = start_index
-
-    while True:
-        with tracker['condition']:
-            # Wait for new chunks or completion
-            while index >= len(tracker['chunks']) and not tracker['complete']:
-                tracker['condition'].wait(timeout=30.0)  # 30 second timeout
-                # Check if still no new data after timeout
-                if index >= len(tracker['chunks']) and not tracker['complete']:
-                    # Still waiting, continue loop
-                    continue
-
-            # Yield any new chunks
-            while index < len(tracker['chunks']):
-                yield tracker['chunks'][index]
-                index += 1
-
-            # If complete and no more chunks, exit
-            if tracker['complete'] and index >= len(tracker['chunks']):
-                break
-
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
 # register speech-to-text blueprint
 app.register_blueprint(sst_bp, url_prefix="")
+# admin-only diagnostics (profiler, tracemalloc); disabled unless ADMIN_TOKEN is set
+app.register_blueprint(admin_bp, url_prefix="")
+app.register_blueprint(review_bp, url_prefix="")
 
 try:
     ws_secret_key = os.environ['WS_SECRET_KEY']
@@ -91,8 +58,38 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 MAX_TEXT_CHARS = int(os.environ.get("MAX_TEXT_CHARS", "5000"))
 TOKEN_BUDGET = int(os.environ.get("TOKEN_BUDGET", "8192"))
 
-# Initialize DB
+# Initialize DB (a single user_version read when the schema is current)
 init_db()
+_INIT_DB_DONE = time.perf_counter()
+
+# Provider clients are built lazily; warm them off the request path so the
+# first turn doesn't pay for SDK imports and client construction
+if os.environ.get("WARM_PROVIDERS", "1") != "0":
+    providers.warm_async()
+
+metrics.register_gauge('message_trackers', lambda: len(MESSAGE_CHUNKS), 'In-memory message chunk trackers.')
+metrics.register_gauge('stream_sessions', lambda: len(SESSIONS), 'start_stream sessions.')
+
+# Optional in-process retention job (archive + delete idle conversations, vacuum)
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", "0"))
+if RETENTION_INTERVAL_HOURS > 0:
+    start_retention_thread(RETENTION_INTERVAL_HOURS)
+
+STARTUP = {
+    'imports_ms': round((_IMPORTS_DONE - _STARTUP_T0) * 1000, 1),
+    'init_db_ms': round((_INIT_DB_DONE - _IMPORTS_DONE) * 1000, 1),
+    'total_ms': round((time.perf_counter() - _STARTUP_T0) * 1000, 1),
+}
+print(f"startup: {STARTUP['total_ms']} ms (imports {STARTUP['imports_ms']} ms, init_db {STARTUP['init_db_ms']} ms)")
+
+@app.route('/healthz')
+def healthz():
+    """Readiness probe. Doesn't touch providers, so it passes as soon as the worker is serving."""
+    return jsonify({
+        "status": "ok",
+        "startup": STARTUP,
+        "providers_ms": {k: round(v * 1000, 1) for k, v in providers.INIT_SECONDS.items()},
+    })
 
 # Helpers
 @app.route('/conversations', methods=['POST'])
@@ -111,7 +108,9 @@ def create_conversation_endpoint():
 
     # Insert initial greeting message if provided
     if greeting:
-        insert_message(conversation_id=conv_id, role='assistant', content=greeting)
+        enqueue_message(conversation_id=conv_id, role='assistant', content=greeting)
+        # the greeting is the first thing played; have its audio ready before it is asked for
+        presynthesize(greeting)
 
     return jsonify({"conversation_id": conv_id, "created_at": now_iso()}), 201
 
@@ -127,14 +126,29 @@ def delete_conversation_endpoint(conversation_id):
     deleted = delete_conversation(conversation_id)
     if not deleted:
         return jsonify({"error": "not found"}), 404
+    audio_store.delete_conversation_audio(conversation_id)
     return '', 204
 
 @app.route('/conversations/<conversation_id>/messages', methods=['GET'])
 def list_messages_endpoint(conversation_id):
+    """List messages oldest-first.
+
+    Query params:
+    - cursor: (optional) `next_cursor` from a previous page; resumes right after it
+    - since: (optional) legacy created_at filter, ignored when cursor is given
+    - limit: (optional) page size (default: 100)
+    """
     since = request.args.get('since')
     limit = int(request.args.get('limit', '100'))
-    messages = get_messages(conversation_id, since=since, limit=limit)
-    return jsonify({"messages": messages})
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = decode_cursor(request.args.get('cursor'))
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+    messages = get_messages(conversation_id, since=since, limit=limit, after=after)
+    next_cursor = encode_cursor(messages[-1]) if messages and len(messages) == limit else None
+    return jsonify({"messages": [m.to_dict() for m in messages], "next_cursor": next_cursor})
 
 # def background(sid):
 #     socketio.emit('my event', 'WOW', to=sid)
@@ -150,8 +164,18 @@ def post_message_endpoint(conversation_id):
     role = payload.get('role', 'user')
     sid = payload.get('sid')
     code = payload.get('code', None)
+    # indexed: emit llm_chunk {message_id, index, text} + llm_done instead of bare llm_response strings,
+    # so the client can resume a dropped stream with the socket.io 'resume' event
+    indexed = bool(payload.get('indexed'))
+    # push_audio: send the reply's TTS as binary tts_audio events on this socket (see audio_push.py)
+    push_audio = bool(payload.get('push_audio'))
+    fmt = _audio_format(payload) if push_audio else None
+    if push_audio and fmt is None:
+        return _bad_format()
     content = payload.get('content')
     metadata = payload.get('metadata') if isinstance(payload.get('metadata'), dict) else {}
+    # continue the turn's trace from /sst if the client passed it on
+    trace_id = tracing.continue_trace(payload.get('trace_id') or request.headers.get('X-Trace-Id'))
 
     if not content or not isinstance(content, str) or not content.strip():
         return jsonify({"error": "content is required"}), 400
@@ -160,42 +184,83 @@ def post_message_endpoint(conversation_id):
     if len(content) > MAX_TEXT_CHARS:
         return jsonify({"error": f"text too long (max {MAX_TEXT_CHARS} chars)"}), 413
 
-    # persist caller message
-    msg_id = insert_message(conversation_id=conversation_id, role=role, content=content, metadata=metadata)
-
-    # For sync responses, call Claude Haiku immediately (trimmed)
-    text_gen = stream_haiku(code, conversation_id)
+    # persist caller message (write-behind; get_messages sees it before it is committed)
+    with tracing.span(trace_id, 'db_insert'):
+        msg_id = enqueue_message(conversation_id=conversation_id, role=role, content=content, metadata=metadata)
 
     assistant_id = str(uuid.uuid4())
+    tracing.link_message(trace_id, assistant_id)
 
     get_or_create_message_tracker(assistant_id)
 
+    # A speculative reply started from a partial transcript is reused if it matches
+    spec_key = speculation.claim(conversation_id, content, code) if speculation.ENABLED and role == 'user' else None
+
+    def live_reply():
+        # For sync responses, call Claude Haiku immediately (trimmed).
+        # Barge-in (cancel_message) closes the upstream stream so the read below ends at once.
+        return stream_haiku(code, conversation_id, trace_id=trace_id,
+                            on_open=lambda stream: on_cancel(assistant_id, stream.close))
+
+    if spec_key:
+        # a speculation that fails before any text falls back to a live reply
+        text_gen = speculation.follow(spec_key, fallback=live_reply)
+        on_cancel(assistant_id, lambda: cancel_message(spec_key))
+    else:
+        text_gen = live_reply()
+    if push_audio:
+        socketio.start_background_task(audio_push.push_message_audio, socketio, sid, assistant_id, fmt, trace_id)
+
     def gen_chunks():
         chunks = []
+        failed = False
 
-        for chunk in text_gen:
-            # Emit to WebSocket
-            socketio.emit('llm_response', chunk, to=sid)
-            # Track chunk in memory for streaming TTS consumers
-            add_chunk_to_message(assistant_id, chunk)
-            chunks.append(chunk)
-            yield chunk
+        try:
+            for index, chunk in enumerate(text_gen):
+                if is_cancelled(assistant_id):
+                    break
+                # Track chunk in memory for streaming TTS consumers and resuming clients
+                add_chunk_to_message(assistant_id, chunk)
+                # Emit to WebSocket
+                if indexed:
+                    socketio.emit('llm_chunk', {'message_id': assistant_id, 'index': index, 'text': chunk}, to=sid)
+                else:
+                    socketio.emit('llm_response', chunk, to=sid)
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            # closing the upstream stream on cancel surfaces as a read error here;
+            # any other failure keeps what was produced, marked truncated
+            if not is_cancelled(assistant_id):
+                print('assistant reply failed', e)
+                failed = True
+        finally:
+            text_gen.close()
 
         assistant_text = ''.join(chunks)
+        cancelled = is_cancelled(assistant_id)
 
-
-        # persist assistant reply
-        insert_message(conversation_id=conversation_id, role='assistant', content=assistant_text,
-                                      msg_id=assistant_id,
-                                      metadata={})
+        # persist assistant reply (what was produced before a barge-in, if cancelled);
+        # a barge-in before the first token leaves nothing worth storing
+        if assistant_text.strip():
+            enqueue_message(conversation_id=conversation_id, role='assistant', content=assistant_text,
+                            msg_id=assistant_id,
+                            metadata={'truncated': True} if cancelled or failed else {})
 
         # Mark this message as complete
         mark_message_complete(assistant_id)
+        if indexed:
+            done = {'message_id': assistant_id, 'count': len(chunks)}
+            if cancelled:
+                done['cancelled'] = True
+            if failed:
+                done['error'] = True
+            socketio.emit('llm_done', done, to=sid)
 
     gen_thing = gen_chunks()
 
     threading.Thread(target=lambda: list(gen_thing), daemon=True).start()
-    return jsonify({"assistant_message_id": assistant_id}), 201
+    return jsonify({"assistant_message_id": assistant_id, "trace_id": trace_id}), 201
     # try:
     #     tts_response = synthesize_stream_gen(gen_chunks())
     #
@@ -211,6 +276,44 @@ def post_message_endpoint(conversation_id):
     #     mark_message_complete(assistant_id)
     #     return jsonify({"error": "TTS generation failed", "detail": str(e)}), 500
 
+def _audio_format(payload=None):
+    """Output format from ?format= / JSON "format" (names in audio_formats.FORMATS) or Accept."""
+    requested = (payload or {}).get('format') or request.args.get('format')
+    return audio_formats.negotiate(requested, request.headers.get('Accept'))
+
+
+def _bad_format():
+    return jsonify({"error": "unsupported format", "formats": sorted(audio_formats.FORMATS)}), 400
+
+
+def _audio_response(audio_gen, fmt):
+    resp = Response(audio_gen, content_type=audio_formats.mimetype(fmt), direct_passthrough=True)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    # no Connection header: it is hop-by-hop, and werkzeug appends its own
+    # ("keep-alive, close"), which kills a pooled client connection
+    resp.headers['Vary'] = 'Accept'
+    return resp
+
+def _find_message(conversation_id, message_id):
+    msgs = get_messages(conversation_id, limit=1000, columns=('content',))
+    return next((m for m in msgs if m['id'] == message_id), None)
+
+def _finished_audio_response(conversation_id, message_id, text, fmt, trace_id=None):
+    """Audio for a completed message: served from its materialized file (ETag,
+    Last-Modified, Range/206) if present, else streamed live and written to disk."""
+    digest = audio_store.audio_digest(text, MODEL_ID, fmt)
+    path = audio_store.audio_path(conversation_id, message_id, fmt, digest)
+    if audio_store.materialized(path):
+        # the ETag names these exact bytes, so it is only sent (and 304 only answered) for the file
+        resp = send_file(os.path.abspath(path), mimetype=audio_formats.mimetype(fmt),
+                         conditional=True, etag=digest)
+    else:
+        resp = _audio_response(audio_store.tee_to_file(synthesize_complete(text, trace_id=trace_id, fmt=fmt), path), fmt)
+    resp.headers['Cache-Control'] = audio_store.AUDIO_CACHE_CONTROL
+    resp.headers['Vary'] = 'Accept'
+    return resp
+
 @app.route('/conversations/<conversation_id>/tts', methods=['POST'])
 def tts_endpoint(conversation_id):
     if not request.is_json:
@@ -218,9 +321,12 @@ def tts_endpoint(conversation_id):
     payload = request.get_json()
     message_id = payload.get('message_id')
     text = payload.get('text')
+    fmt = _audio_format(payload)
+    if fmt is None:
+        return _bad_format()
 
     if message_id:
-        msgs = get_messages(conversation_id, limit=1000)
+        msgs = get_messages(conversation_id, limit=1000, columns=('content',))
         message = next((m for m in msgs if m['id'] == message_id), None)
         if not message:
             return jsonify({"error": "message_id not found"}), 404
@@ -236,9 +342,9 @@ def tts_endpoint(conversation_id):
     try:
         # stream generator
         def generate():
-            for chunk in synthesize_stream(text_to_speak):
+            for chunk in synthesize_complete(text_to_speak, fmt=fmt):
                 yield chunk
-        return Response(generate(), mimetype='audio/mpeg')
+        return Response(generate(), content_type=audio_formats.mimetype(fmt), headers={'Vary': 'Accept'})
     except Exception as e:
         return jsonify({"error": "TTS generation failed", "detail": str(e)}), 500
 
@@ -250,22 +356,32 @@ def tts_stream_by_message_id(conversation_id, message_id):
 
     Query params:
     - start_index: (optional) start from a specific chunk index (default: 0)
+    - format: (optional) output format, see audio_formats.FORMATS (or use Accept)
     """
     start_index = int(request.args.get('start_index', '0'))
+    fmt = _audio_format()
+    if fmt is None:
+        return _bad_format()
 
     # Check if this message is being tracked (in-progress or recently completed)
-    if message_id in MESSAGE_CHUNKS:
-        tts_gen = synthesize_stream_gen(iter_message_chunks(message_id, start_index))
-
-        resp = Response(tts_gen, mimetype='audio/mpeg', direct_passthrough=True)
-        resp.headers['Cache-Control'] = 'no-cache'
-        resp.headers['X-Accel-Buffering'] = 'no'
-        resp.headers['Connection'] = 'keep-alive'
-        return resp
+    trace_id = tracing.trace_for_message(message_id)
+    tracker = MESSAGE_CHUNKS.get(message_id)
+    if tracker and tracker['complete'] and not tracker['cancelled'] and start_index == 0:
+        # finished on this worker: same cached/materialized path as a reply loaded from the db,
+        # which is keyed by conversation_id, so check the message really belongs to it
+        if not _find_message(conversation_id, message_id):
+            return jsonify({"error": "message_id not found"}), 404
+        text_to_speak = ''.join(tracker['chunks'])
+        if len(text_to_speak) > MAX_TEXT_CHARS:
+            return jsonify({"error": f"text too long (max {MAX_TEXT_CHARS} chars)"}), 413
+        return _finished_audio_response(conversation_id, message_id, text_to_speak, fmt, trace_id)
+    if tracker:
+        tts_gen = synthesize_stream_gen(iter_message_chunks(message_id, start_index), trace_id=trace_id,
+                                        cancelled=lambda: is_cancelled(message_id))
+        return _audio_response(audio_formats.transcode(tts_gen, fmt), fmt)
     else:
         # Message not being tracked, check if it exists in database
-        msgs = get_messages(conversation_id, limit=1000)
-        message = next((m for m in msgs if m['id'] == message_id), None)
+        message = _find_message(conversation_id, message_id)
         if not message:
             return jsonify({"error": "message_id not found"}), 404
 
@@ -273,23 +389,65 @@ def tts_stream_by_message_id(conversation_id, message_id):
         if len(text_to_speak) > MAX_TEXT_CHARS:
             return jsonify({"error": f"text too long (max {MAX_TEXT_CHARS} chars)"}), 413
 
-        # Stream TTS for the complete message
-        def generate_complete():
-            for chunk in synthesize_stream(text_to_speak):
-                yield chunk
-
-        resp = Response(generate_complete(), mimetype='audio/mpeg', direct_passthrough=True)
-        resp.headers['Cache-Control'] = 'no-cache'
-        resp.headers['X-Accel-Buffering'] = 'no'
-        resp.headers['Connection'] = 'keep-alive'
-        return resp
+        return _finished_audio_response(conversation_id, message_id, text_to_speak, fmt, trace_id)
+
+@app.route('/conversations/<conversation_id>/messages/<message_id>/trace', methods=['GET'])
+def message_trace_endpoint(conversation_id, message_id):
+    """Span waterfall (upload -> ASR -> LLM -> TTS) for the turn that produced message_id.
+    Only recent turns are kept (see tracing.TRACE_BUFFER_SIZE)."""
+    trace_id = tracing.trace_for_message(message_id)
+    trace = tracing.get_trace(trace_id) if trace_id else None
+    if not trace:
+        return jsonify({"error": "trace not found"}), 404
+    return jsonify(trace)
+
+@app.route('/conversations/<conversation_id>/speculate', methods=['POST'])
+def speculate_endpoint(conversation_id):
+    """Start generating a reply from a stable partial transcript while the candidate is
+    still speaking: JSON { "content": str, "code"?: str, "trace_id"?: str }.
+    The following message POST reuses it if its content matches (see speculation.py)."""
+    if not speculation.ENABLED:
+        return jsonify({"error": "speculation disabled"}), 404
+    if not request.is_json:
+        return jsonify({"error": "expected JSON body"}), 400
+    payload = request.get_json()
+    content = payload.get('content')
+    if not content or not isinstance(content, str) or not content.strip():
+        return jsonify({"error": "content is required"}), 400
+    if len(content) > MAX_TEXT_CHARS:
+        return jsonify({"error": f"text too long (max {MAX_TEXT_CHARS} chars)"}), 413
+    if not get_conversation(conversation_id):
+        return jsonify({"error": "not found"}), 404
+    trace_id = payload.get('trace_id') or request.headers.get('X-Trace-Id')
+    if not tracing.is_trace_id(trace_id):
+        trace_id = None
+    speculation.start(conversation_id, content, payload.get('code'), trace_id)
+    return jsonify({"speculating": True}), 202
+
+def _cancel(message_id):
+    result = cancel_message(message_id)
+    if result:
+        metrics.counter_inc('turns_cancelled_total', help_text='Assistant turns stopped by barge-in.')
+    return result
+
+@app.route('/conversations/<conversation_id>/messages/<message_id>/cancel', methods=['POST'])
+def cancel_message_endpoint(conversation_id, message_id):
+    """Barge-in: abort the in-flight LLM stream and TTS for an assistant message.
+    The text produced so far is persisted with metadata {"truncated": true}."""
+    result = _cancel(message_id)
+    if result is None:
+        return jsonify({"error": "message not in progress"}), 404
+    if result is False:
+        return jsonify({"error": "message already complete"}), 409
+    return jsonify({"message_id": message_id, "cancelled": True})
 
 @app.route('/conversations/<conversation_id>/tts_stream', methods=['POST','GET'])
 def tts_stream_endpoint(conversation_id):
     """Stream TTS audio bytes to the client as they are generated.
-    For POST: accept JSON { "message_id"?: str, "text"?: str, "voice"?: str }.
-    For GET: accept query params ?message_id=... or ?text=...&voice=...
-    Response: chunked audio/mpeg stream (suitable for <audio src="..."> playback)
+    For POST: accept JSON { "message_id"?: str, "text"?: str, "voice"?: str, "format"?: str }.
+    For GET: accept query params ?message_id=... or ?text=...&voice=...&format=...
+    Response: chunked audio stream (suitable for <audio src="..."> playback), audio/mpeg
+    unless another format is requested via "format" or the Accept header
     """
     # Support both POST (JSON body) and GET (query string) for streaming URL usage
     if request.method == 'POST':
@@ -299,14 +457,18 @@ def tts_stream_endpoint(conversation_id):
         message_id = payload.get('message_id')
         text = payload.get('text')
         voice = payload.get('voice')
+        fmt = _audio_format(payload)
     else:
         # GET
         message_id = request.args.get('message_id')
         text = request.args.get('text')
         voice = request.args.get('voice')
+        fmt = _audio_format()
+    if fmt is None:
+        return _bad_format()
 
     if message_id:
-        msgs = get_messages(conversation_id, limit=1000)
+        msgs = get_messages(conversation_id, limit=1000, columns=('content',))
         message = next((m for m in msgs if m['id'] == message_id), None)
         if not message:
             return jsonify({"error": "message_id not found"}), 404
@@ -322,46 +484,78 @@ def tts_stream_endpoint(conversation_id):
     try:
         # Return a streaming response the browser can play via <audio src="..."> (GET)
         # Use direct_passthrough so Flask/Werkzeug doesn't buffer the iterable
-        resp = Response(synthesize_stream(text_to_speak), mimetype='audio/mpeg', direct_passthrough=True)
         # Avoid setting Content-Length so Transfer-Encoding: chunked is used
         # Advise proxies not to buffer the response
-        resp.headers['Cache-Control'] = 'no-cache'
-        resp.headers['X-Accel-Buffering'] = 'no'
-        resp.headers['Connection'] = 'keep-alive'
-        return resp
+        if message_id:
+            return _finished_audio_response(conversation_id, message_id, text_to_speak, fmt)
+        return _audio_response(synthesize_complete(text_to_speak, fmt=fmt), fmt)
     except Exception as e:
         return jsonify({"error": "TTS streaming failed", "detail": str(e)}), 500
 
 @app.route('/conversations/<conversation_id>/export', methods=['GET'])
 def export_conversation(conversation_id):
+    """Stream a full conversation export without loading all messages at once.
+
+    Query params:
+    - format: `json` (default) -> {"conversation": ..., "messages": [...]}
+              `ndjson` -> first line {"conversation": ...}, then one message object per line
+    """
     conv = get_conversation(conversation_id)
     if not conv:
         return jsonify({"error": "not found"}), 404
-    messages = get_messages(conversation_id, limit=10000)
-    return jsonify({"conversation": conv, "messages": messages})
+    fmt = request.args.get('format', 'json')
+
+    if fmt == 'ndjson':
+        def generate_ndjson():
+            yield json.dumps({"conversation": conv}) + '\n'
+            for m in iter_messages(conversation_id):
+                yield m.to_json() + '\n'
+        return Response(generate_ndjson(), mimetype='application/x-ndjson')
+    if fmt != 'json':
+        return jsonify({"error": "format must be json or ndjson"}), 400
+
+    def generate_json():
+        yield '{"conversation": ' + json.dumps(conv) + ', "messages": ['
+        sep = ''
+        for m in iter_messages(conversation_id):
+            yield sep + m.to_json()
+            sep = ', '
+        yield ']}'
+    return Response(generate_json(), mimetype='application/json')
 
 
 @app.route('/conversations/<conversation_id>/stream_text')
 def stream_text(conversation_id):
-    """SSE endpoint that reads from a session's text queue.
-    Query param: ?session=<session_id>
+    """SSE endpoint for a start_stream session (?session=<session_id>) or an assistant
+    message still held in memory (?message_id=<id>).
+
+    Each event carries the chunk index as its id, so a reconnecting EventSource
+    (Last-Event-ID header, or ?last_event_id=) continues after the last chunk it saw.
+    A final "done" event tells the client not to reconnect.
     """
-    session_id = request.args.get('session')
-    if not session_id or session_id not in SESSIONS:
+    key = request.args.get('message_id') or request.args.get('session')
+    if not key or key not in MESSAGE_CHUNKS:
         return jsonify({"error": "session not found"}), 404
-    text_q = SESSIONS[session_id]['text_q']
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        start_index = int(last_event_id) + 1 if last_event_id else 0
+    except ValueError:
+        return jsonify({"error": "invalid Last-Event-ID"}), 400
+    # the client cannot have seen chunks that don't exist yet
+    start_index = max(0, min(start_index, len(MESSAGE_CHUNKS[key]['chunks'])))
 
     def event_stream():
-        while True:
-            try:
-                item = text_q.get(timeout=0.1)
-            except queue.Empty:
-                continue
-            if item is None:
-                break
-            yield f"data: {item}\n\n"
+        index = start_index
+        for chunk in iter_message_chunks(key, start_index):
+            data = ''.join(f"data: {line}\n" for line in chunk.split('\n'))
+            yield f"id: {index}\n{data}\n"
+            index += 1
+        # the id is the last chunk's; with no chunks at all there is none to give
+        event_id = f"id: {index - 1}\n" if index else ''
+        yield f"event: done\n{event_id}data: {index}\n\n"
 
-    return Response(event_stream(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+    return Response(event_stream(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route('/conversations/<conversation_id>/live_audio', methods=['POST','GET'])
@@ -369,6 +563,9 @@ def live_audio(conversation_id):
     """POST JSON { "text": "..." } -> streams audio bytes as chunked response by proxying synthesize_stream.
     This is a minimal forwarder that turns text into audio stream for an <audio src=> element.
     """
+    fmt = _audio_format()
+    if fmt is None:
+        return _bad_format()
     # Support GET for session streaming: if GET, expect ?session=<id>
     if request.method == 'GET':
         session_id = request.args.get('session')
@@ -388,10 +585,7 @@ def live_audio(conversation_id):
                     break
                 yield data
 
-        resp = Response(generate_from_queue(), mimetype='audio/mpeg', direct_passthrough=True)
-        resp.headers['Cache-Control'] = 'no-cache'
-        resp.headers['X-Accel-Buffering'] = 'no'
-        return resp
+        return _audio_response(audio_formats.transcode(generate_from_queue(), fmt), fmt)
 
     # For POST (direct synthesis), expect JSON with 'text'
     session_id = request.args.get('session')
@@ -408,10 +602,7 @@ def live_audio(conversation_id):
                 yield bytes(chunk)
             else:
                 yield str(chunk).encode('utf-8')
-    resp = Response(generate_direct(), mimetype='audio/mpeg', direct_passthrough=True)
-    resp.headers['Cache-Control'] = 'no-cache'
-    resp.headers['X-Accel-Buffering'] = 'no'
-    return resp
+    return _audio_response(audio_formats.transcode(generate_direct(), fmt), fmt)
 
 
 @app.route('/conversations/<conversation_id>/start_stream', methods=['POST'])
@@ -420,16 +611,17 @@ def start_stream(conversation_id):
     Returns: { session_id }
     """
     session_id = str(uuid.uuid4())
-    text_q = queue.Queue()
     audio_q = queue.Queue()
+    # text goes to a chunk log keyed by session id, so stream_text readers can resume
+    get_or_create_message_tracker(session_id)
 
     def orchestrator():
         try:
-            # For each text chunk from stream_haiku, put to text_q and synthesize audio for that chunk
+            # For each text chunk from stream_haiku, log it for stream_text and synthesize audio for that chunk
             for chunk in stream_haiku(conversation_id):
                 if chunk is None:
                     continue
-                text_q.put(chunk)
+                add_chunk_to_message(session_id, chunk)
                 # Synthesize audio for this chunk and push bytes to audio_q
                 try:
                     for achunk in synthesize_stream(chunk):
@@ -442,14 +634,19 @@ def start_stream(conversation_id):
                     break
         finally:
             # signal completion
-            text_q.put(None)
+            mark_message_complete(session_id)
             audio_q.put(None)
 
     th = threading.Thread(target=orchestrator, daemon=True)
-    SESSIONS[session_id] = {'text_q': text_q, 'audio_q': audio_q, 'thread': th}
+    SESSIONS[session_id] = {'audio_q': audio_q, 'thread': th}
     th.start()
     return jsonify({'session_id': session_id})
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus text exposition of stage timings and gauges."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/')
 def index():
     # Serve the single-file frontend from the same origin to avoid CORS/file:// issues
@@ -465,6 +662,51 @@ def record():
         return send_file(path)
     return jsonify({"error": "record.html not found"}), 404
 
+@socketio.on('resume')
+def resume_stream(data):
+    """Replay an assistant message from chunk `from_index` to this client and follow it
+    live: { "message_id": str, "from_index"?: int } -> llm_chunk events, then llm_done.
+    Emits llm_resume_miss if the message is no longer in memory (fetch it via GET messages)."""
+    data = data if isinstance(data, dict) else {}
+    message_id = data.get('message_id')
+    try:
+        from_index = max(0, int(data.get('from_index') or 0))
+    except (TypeError, ValueError):
+        from_index = 0
+    tracker = MESSAGE_CHUNKS.get(message_id) if message_id else None
+    if tracker is None:
+        socketio.emit('llm_resume_miss', {'message_id': message_id}, to=request.sid)
+        return
+    from_index = min(from_index, len(tracker['chunks']))
+    sid = request.sid
+
+    def replay():
+        index = from_index
+        for chunk in iter_message_chunks(message_id, from_index):
+            socketio.emit('llm_chunk', {'message_id': message_id, 'index': index, 'text': chunk}, to=sid)
+            index += 1
+        socketio.emit('llm_done', {'message_id': message_id, 'count': index}, to=sid)
+
+    metrics.counter_inc('stream_resumes_total', help_text='socket.io resume requests served from the chunk log.')
+    socketio.start_background_task(replay)
+
+@socketio.on('cancel')
+def cancel_event(data):
+    """Barge-in over the socket: { "message_id": str } -> llm_cancelled { message_id, cancelled }."""
+    message_id = data.get('message_id') if isinstance(data, dict) else None
+    result = _cancel(message_id) if message_id else None
+    socketio.emit('llm_cancelled', {'message_id': message_id, 'cancelled': bool(result)}, to=request.sid)
+
+@socketio.on('tts_ack')
+def tts_ack(data):
+    """Flow control for pushed audio: { "message_id": str, "seq": int } = received through seq."""
+    if isinstance(data, dict) and isinstance(data.get('seq'), int):
+        audio_push.ack(request.sid, data.get('message_id'), data['seq'])
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    audio_push.drop_client(request.sid)
+
 # @socketio.on('my event')
 # def handle_message(data):
 #     print('received message: ' + str(data))
@@ -472,5 +714,7 @@ def record():
 #     socketio.start_background_task(background, request.sid)
 
 if __name__ == '__main__':
+    # turn SIGTERM into a normal exit so atexit flushes the DB write queue
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     # cant use reloader with sockets on werkzeug
     socketio.run(app, host='127.0.0.1', port=5067, debug=True, allow_unsafe_werkzeug=True, use_reloader=False)
@@ -0,0 +1,98 @@
+import threading
+
+# In-memory message chunk tracker: message_id -> {'chunks': [], 'complete': bool, 'cancelled': bool,
+#   'on_cancel': [callbacks], 'lock': threading.Lock(), 'condition': threading.Condition()}
+# This allows multiple readers to wait for chunks as they arrive
+MESSAGE_CHUNKS = {}
+
+_TRACKERS_LOCK = threading.Lock()
+
+def get_or_create_message_tracker(message_id):
+    """Get or create a message tracker with thread-safe access."""
+    tracker = MESSAGE_CHUNKS.get(message_id)
+    if tracker is None:
+        with _TRACKERS_LOCK:
+            tracker = MESSAGE_CHUNKS.get(message_id)
+            if tracker is None:
+                lock = threading.Lock()
+                tracker = MESSAGE_CHUNKS[message_id] = {
+                    'chunks': [],
+                    'complete': False,
+                    'cancelled': False,
+                    'on_cancel': [],
+                    'lock': lock,
+                    'condition': threading.Condition(lock)
+                }
+    return tracker
+
+def add_chunk_to_message(message_id, chunk):
+    """Add a chunk to a message tracker and notify waiting consumers."""
+    tracker = get_or_create_message_tracker(message_id)
+    with tracker['condition']:
+        tracker['chunks'].append(chunk)
+        tracker['condition'].notify_all()
+
+def mark_message_complete(message_id):
+    """Mark a message as complete and notify all waiting consumers."""
+    if message_id in MESSAGE_CHUNKS:
+        tracker = MESSAGE_CHUNKS[message_id]
+        with tracker['condition']:
+            tracker['complete'] = True
+            tracker['condition'].notify_all()
+
+def iter_message_chunks(message_id, start_index=0):
+    """Yield chunks from a message as they become available. Blocks until new chunks arrive."""
+    tracker = get_or_create_message_tracker(message_id)
+    index = start_index
+
+    while True:
+        with tracker['condition']:
+            # Wait for new chunks or completion
+            while index >= len(tracker['chunks']) and not tracker['complete']:
+                tracker['condition'].wait(timeout=30.0)  # 30 second timeout
+            new_chunks = tracker['chunks'][index:]
+            done = tracker['complete']
+
+        # Yield outside the lock so a slow consumer doesn't block the producer
+        # or the other readers of this message
+        for chunk in new_chunks:
+            yield chunk
+        index += len(new_chunks)
+
+        # If complete and no more chunks, exit
+        if done and index >= len(tracker['chunks']):
+            break
+
+def on_cancel(message_id, callback):
+    """Run callback() when the message is cancelled (right away if it already was)."""
+    tracker = get_or_create_message_tracker(message_id)
+    with tracker['condition']:
+        if not tracker['cancelled']:
+            tracker['on_cancel'].append(callback)
+            return
+    callback()
+
+def is_cancelled(message_id):
+    tracker = MESSAGE_CHUNKS.get(message_id)
+    return bool(tracker and tracker['cancelled'])
+
+def cancel_message(message_id):
+    """Barge-in: stop an in-progress message. Readers see it as complete right away and
+    the registered callbacks abort upstream work (LLM stream, TTS).
+    Returns None if the message is not tracked, False if it had already completed."""
+    tracker = MESSAGE_CHUNKS.get(message_id)
+    if tracker is None:
+        return None
+    with tracker['condition']:
+        if tracker['complete']:
+            return False
+        tracker['cancelled'] = True
+        tracker['complete'] = True
+        callbacks, tracker['on_cancel'] = tracker['on_cancel'], []
+        tracker['condition'].notify_all()
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception as e:
+            print('cancel callback error', e)
+    return True
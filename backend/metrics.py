@@ -0,0 +1,117 @@
+"""Minimal in-process metrics with Prometheus text exposition.
+
+Hot-path code records stage timings with `observe(stage, seconds)` or the
+`timed(stage)` context manager; both cost one perf_counter pair, a bisect and a
+short lock. Gauges are either set/inc/dec'ed or computed at scrape time via
+`register_gauge(name, fn)`. `render()` returns the /metrics payload.
+"""
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# seconds; covers sub-ms DB work up to long LLM completions
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _Histogram:
+    def __init__(self, name, help_text, buckets=STAGE_BUCKETS, label='stage'):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.label = label
+        self.lock = threading.Lock()
+        # label value -> [bucket counts..., +Inf count], sum
+        self.series = {}
+
+    def observe(self, label_value, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            s = self.series.get(label_value)
+            if s is None:
+                s = self.series[label_value] = [[0] * (len(self.buckets) + 1), 0.0]
+            s[0][i] += 1
+            s[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            snapshot = {k: (list(v[0]), v[1]) for k, v in self.series.items()}
+        for lv, (counts, total) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets, counts):
+                cumulative += c
+                lines.append(f'{self.name}_bucket{{{self.label}="{lv}",le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'{self.name}_bucket{{{self.label}="{lv}",le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{self.label}="{lv}"}} {total}')
+            lines.append(f'{self.name}_count{{{self.label}="{lv}"}} {cumulative}')
+        return lines
+
+
+STAGES = _Histogram('turn_stage_seconds', 'Time spent per interview-turn stage.')
+
+_GAUGES = {}  # name -> [help, value]
+_GAUGE_FNS = {}  # name -> (help, fn)
+_COUNTERS = {}  # name -> [help, value]
+_LOCK = threading.Lock()
+
+
+def observe(stage, seconds):
+    STAGES.observe(stage, seconds)
+
+
+@contextmanager
+def timed(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGES.observe(stage, time.perf_counter() - start)
+
+
+def gauge_inc(name, amount=1, help_text=''):
+    with _LOCK:
+        g = _GAUGES.setdefault(name, [help_text, 0])
+        g[1] += amount
+
+
+def gauge_dec(name, amount=1):
+    gauge_inc(name, -amount)
+
+
+def counter_inc(name, amount=1, help_text=''):
+    with _LOCK:
+        c = _COUNTERS.setdefault(name, [help_text, 0])
+        c[1] += amount
+
+
+def counter_value(name):
+    with _LOCK:
+        c = _COUNTERS.get(name)
+        return c[1] if c else 0
+
+
+def register_gauge(name, fn, help_text=''):
+    """Register a gauge whose value is computed by fn() at scrape time."""
+    _GAUGE_FNS[name] = (help_text, fn)
+
+
+def render():
+    lines = STAGES.render()
+    with _LOCK:
+        gauges = {k: tuple(v) for k, v in _GAUGES.items()}
+        counters = {k: tuple(v) for k, v in _COUNTERS.items()}
+    for name, (help_text, fn) in list(_GAUGE_FNS.items()):
+        try:
+            gauges[name] = (help_text, fn())
+        except Exception:
+            continue
+    for name, (help_text, value) in sorted(gauges.items()):
+        lines += [f'# HELP {name} {help_text or name}', f'# TYPE {name} gauge', f'{name} {value}']
+    for name, (help_text, value) in sorted(counters.items()):
+        lines += [f'# HELP {name} {help_text or name}', f'# TYPE {name} counter', f'{name} {value}']
+    return '\n'.join(lines) + '\n'
+
+
+register_gauge('process_threads', threading.active_count, 'Live Python threads.')
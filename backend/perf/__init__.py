@@ -0,0 +1,5 @@
+"""Performance tooling for the backend: offline load test, fake providers and
+micro-benchmarks. Run modules from the backend directory, e.g.
+
+    python -m perf.loadtest --candidates 20 --turns 3
+"""
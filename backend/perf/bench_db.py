@@ -0,0 +1,189 @@
+"""Micro-benchmarks for db.py.
+
+Builds a synthetic dataset (many conversations, long transcripts with code
+blocks) in a scratch SQLite file, then times the DB API single- and
+multi-threaded and reports ops/sec with latency percentiles.
+
+    python -m perf.bench_db --conversations 2000 --messages 200 --threads 1,4,16
+    python -m perf.bench_db --json after.json --compare before.json
+
+Use --db to benchmark a copy of a real data.db (the file itself is not modified).
+"""
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+import db
+from perf.stats import summarize
+
+WORDS = ('the candidate should consider the edge case where the input is empty and explain '
+         'why a hash map gives linear time while sorting costs n log n in the worst case').split()
+CODE = '''```python
+def two_sum(nums, target):
+    seen = {}
+    for i, n in enumerate(nums):
+        if target - n in seen:
+            return [seen[target - n], i]
+        seen[n] = i
+```'''
+
+
+def make_text(rng, words=80, code_prob=0.2):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words * 2)))
+    if rng.random() < code_prob:
+        text += '\n\n' + CODE
+    return text
+
+
+def build_dataset(conversations, messages, seed=0):
+    """Create `conversations` conversations with `messages` messages each. Returns conversation ids."""
+    rng = random.Random(seed)
+    conn = db._connect()
+    ids = []
+    try:
+        cur = conn.cursor()
+        for _ in range(conversations):
+            conv_id = db.create_conversation(system_message=make_text(rng, 200))
+            ids.append(conv_id)
+            rows = [db._message_row(conv_id, 'user' if i % 2 else 'assistant', make_text(rng))
+                    for i in range(messages)]
+            db._write_rows(cur, rows)
+            conn.commit()
+    finally:
+        conn.close()
+    return ids
+
+
+def run(name, op, ops, threads=1):
+    """Run op(i) `ops` times split across `threads` threads; returns a result dict."""
+    latencies = []
+    lock = threading.Lock()
+    errors = [0]
+
+    def worker(start, count):
+        local = []
+        for i in range(start, start + count):
+            t = time.perf_counter()
+            try:
+                op(i)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            local.append(time.perf_counter() - t)
+        with lock:
+            latencies.extend(local)
+
+    per = ops // threads
+    workers = [threading.Thread(target=worker, args=(k * per, per)) for k in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    wall = time.perf_counter() - started
+    result = {'name': name, 'threads': threads, 'ops': len(latencies), 'errors': errors[0],
+              'ops_per_s': round(len(latencies) / wall, 1) if wall else None}
+    result.update({f'{k}_ms': v for k, v in summarize(latencies).items() if k != 'count'})
+    return result
+
+
+def workloads(conv_ids, rng_seed, ops, thread_counts):
+    rng = random.Random(rng_seed)
+    texts = [make_text(rng) for _ in range(256)]
+    results = []
+
+    def pick(i):
+        return conv_ids[(i * 7919) % len(conv_ids)]
+
+    for threads in thread_counts:
+        results.append(run('insert_message', lambda i: db.insert_message(pick(i), 'user', texts[i % len(texts)]),
+                           ops, threads))
+
+        def enqueue(i):
+            db.enqueue_message(pick(i), 'user', texts[i % len(texts)])
+        r = run('enqueue_message', enqueue, ops, threads)
+        t = time.perf_counter()
+        db.flush_writes()
+        r['flush_ms'] = round((time.perf_counter() - t) * 1000, 2)
+        results.append(r)
+
+        results.append(run('get_conversation', lambda i: db.get_conversation(pick(i)), ops, threads))
+        results.append(run('get_messages(limit=100)', lambda i: db.get_messages(pick(i), limit=100), ops, threads))
+        results.append(run('get_messages(all)', lambda i: db.get_messages(pick(i), limit=100000),
+                           max(threads, ops // 10), threads))
+        results.append(run('get_recent_messages(8192)', lambda i: db.get_recent_messages(pick(i), 8192),
+                           ops, threads))
+    return results
+
+
+def bench_delete(conversations, messages, seed):
+    """delete_conversation on a dedicated set of conversations (single-threaded)."""
+    ids = build_dataset(conversations, messages, seed + 1)
+    return run('delete_conversation', lambda i: db.delete_conversation(ids[i]), len(ids), 1)
+
+
+def print_results(results, baseline=None):
+    base = {(r['name'], r['threads']): r for r in (baseline or [])}
+    header = f"{'workload':<28}{'thr':>4}{'ops/s':>11}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+    if baseline:
+        header += f"{'vs base':>10}"
+    print(header)
+    for r in results:
+        line = (f"{r['name']:<28}{r['threads']:>4}{r['ops_per_s']:>11}{r.get('p50_ms', '-'):>9}"
+                f"{r.get('p95_ms', '-'):>9}{r.get('p99_ms', '-'):>9}")
+        b = base.get((r['name'], r['threads']))
+        if b and b.get('ops_per_s'):
+            line += f"{(r['ops_per_s'] / b['ops_per_s'] - 1) * 100:>+9.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='db.py micro-benchmarks')
+    parser.add_argument('--conversations', type=int, default=1000)
+    parser.add_argument('--messages', type=int, default=100, help='messages per conversation')
+    parser.add_argument('--ops', type=int, default=2000, help='operations per workload')
+    parser.add_argument('--threads', default='1,4', help='comma-separated thread counts')
+    parser.add_argument('--db', default=None, help='existing DB file to copy and benchmark against')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', dest='json_path', default=None, help='write results to this file')
+    parser.add_argument('--compare', default=None, help='baseline JSON from a previous --json run')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-db-')
+    db.DB_PATH = os.path.join(workdir, 'bench.db')
+    try:
+        if args.db:
+            shutil.copyfile(args.db, db.DB_PATH)
+        db.init_db()
+        t = time.perf_counter()
+        conv_ids = build_dataset(args.conversations, args.messages, args.seed)
+        build_s = time.perf_counter() - t
+        stats = db.db_stats()
+        print(f"dataset: {stats['conversations']} conversations, {stats['messages']} messages, "
+              f"{stats['file_bytes'] / 1e6:.1f} MB (built in {build_s:.1f}s)\n")
+
+        thread_counts = [int(x) for x in args.threads.split(',') if x]
+        results = workloads(conv_ids, args.seed, args.ops, thread_counts)
+        results.append(bench_delete(min(200, args.conversations), args.messages, args.seed))
+        db.close_writer()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'params': vars(args), 'dataset': stats, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
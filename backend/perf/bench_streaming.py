@@ -0,0 +1,208 @@
+"""Micro-benchmarks for the in-memory streaming primitives.
+
+Simulates LLM producers appending tokens at a realistic rate to message
+trackers (message_chunks.py) while 1..N readers per message consume them with
+iter_message_chunks, plus a reader resuming mid-stream from chunk 0 (the
+stream_text / socket.io resume path) and (when flask_socketio is installed)
+the cost of socketio.emit per chunk.
+
+Reports per-chunk delivery latency (append -> reader wake-up), process CPU
+per token and memory per tracker.
+
+    python -m perf.bench_streaming --messages 1,100,1000 --readers 1,10,100
+"""
+import gc
+import time
+import argparse
+import threading
+import tracemalloc
+
+import message_chunks
+from perf.stats import summarize
+
+TOKEN = 'token '
+
+
+def run_fanout(messages, readers, tokens, rate, reader_work_s=0.0):
+    """`messages` concurrent messages, `readers` consumers each, producers at `rate` tokens/s.
+    reader_work_s simulates per-chunk consumer work (e.g. a TTS websocket send)."""
+    message_chunks.MESSAGE_CHUNKS.clear()
+    ids = [f'bench-{i}' for i in range(messages)]
+    for mid in ids:
+        message_chunks.get_or_create_message_tracker(mid)
+
+    lock = threading.Lock()
+    latencies = []
+
+    def reader(mid):
+        local = []
+        for sent, _ in message_chunks.iter_message_chunks(mid):
+            local.append(time.perf_counter() - sent)
+            if reader_work_s:
+                time.sleep(reader_work_s)
+        with lock:
+            latencies.extend(local)
+
+    # a few producer threads drive all messages, one token per message per tick
+    n_producers = min(messages, 8)
+
+    def producer(mine):
+        interval = 1.0 / rate if rate else 0
+        next_tick = time.perf_counter()
+        for _ in range(tokens):
+            for mid in mine:
+                message_chunks.add_chunk_to_message(mid, (time.perf_counter(), TOKEN))
+            if interval:
+                next_tick += interval
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        for mid in mine:
+            message_chunks.mark_message_complete(mid)
+
+    reader_threads = [threading.Thread(target=reader, args=(mid,)) for mid in ids for _ in range(readers)]
+    for t in reader_threads:
+        t.start()
+    producer_threads = [threading.Thread(target=producer, args=(ids[k::n_producers],)) for k in range(n_producers)]
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    for t in producer_threads:
+        t.start()
+    for t in producer_threads + reader_threads:
+        t.join()
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+    produced = messages * tokens
+    delivered = len(latencies)
+    message_chunks.MESSAGE_CHUNKS.clear()
+    result = {
+        'scenario': f'{messages} msg x {readers} rdr',
+        'tokens_produced': produced,
+        'chunks_delivered': delivered,
+        'wall_s': round(wall, 3),
+        'cpu_us_per_token': round(cpu / produced * 1e6, 2),
+        'cpu_us_per_delivery': round(cpu / delivered * 1e6, 2) if delivered else None,
+    }
+    result.update({f'latency_{k}_ms': v for k, v in summarize(latencies).items() if k != 'count'})
+    return result
+
+
+def run_resume(tokens, rate):
+    """A reader reconnecting halfway through a message (stream_text Last-Event-ID /
+    socket.io 'resume'): time to replay the backlog, then live delivery latency."""
+    message_chunks.MESSAGE_CHUNKS.clear()
+    mid = 'bench-resume'
+    message_chunks.get_or_create_message_tracker(mid)
+    half = threading.Event()
+    latencies = []
+    timing = {}
+
+    def producer():
+        interval = 1.0 / rate if rate else 0
+        for i in range(tokens):
+            message_chunks.add_chunk_to_message(mid, (time.perf_counter(), TOKEN))
+            if i == tokens // 2:
+                half.set()
+            if interval:
+                time.sleep(interval)
+        half.set()
+        message_chunks.mark_message_complete(mid)
+
+    th = threading.Thread(target=producer)
+    cpu0 = time.process_time()
+    th.start()
+    half.wait()
+    t = time.perf_counter()
+    backlog = len(message_chunks.MESSAGE_CHUNKS[mid]['chunks'])
+    for n, (sent, _) in enumerate(message_chunks.iter_message_chunks(mid, 0)):
+        if n == backlog - 1:
+            timing['replay'] = time.perf_counter() - t
+        elif n >= backlog:
+            latencies.append(time.perf_counter() - sent)
+    th.join()
+    cpu = time.process_time() - cpu0
+    message_chunks.MESSAGE_CHUNKS.clear()
+    result = {'scenario': 'resume mid-stream', 'tokens_produced': tokens, 'chunks_delivered': backlog + len(latencies),
+              'cpu_us_per_token': round(cpu / tokens * 1e6, 2),
+              'replay_us': round(timing.get('replay', 0) * 1e6, 1)}
+    result.update({f'latency_{k}_ms': v for k, v in summarize(latencies).items() if k != 'count'})
+    return result
+
+
+def run_socketio_emit(tokens):
+    """Cost of socketio.emit('llm_response', chunk, to=sid) with no connected client."""
+    try:
+        from flask import Flask
+        from flask_socketio import SocketIO
+    except ImportError:
+        return None
+    app = Flask(__name__)
+    sio = SocketIO(app, async_mode='threading')
+    samples = []
+    cpu0 = time.process_time()
+    for _ in range(tokens):
+        t = time.perf_counter()
+        sio.emit('llm_response', TOKEN, to='no-such-sid')
+        samples.append(time.perf_counter() - t)
+    cpu = time.process_time() - cpu0
+    result = {'scenario': 'socketio.emit', 'tokens_produced': tokens, 'cpu_us_per_token': round(cpu / tokens * 1e6, 2)}
+    result.update({f'latency_{k}_ms': v for k, v in summarize(samples).items() if k != 'count'})
+    return result
+
+
+def tracker_memory(trackers, tokens):
+    """Bytes retained per tracker holding `tokens` chunks."""
+    message_chunks.MESSAGE_CHUNKS.clear()
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(trackers):
+        mid = f'mem-{i}'
+        for _ in range(tokens):
+            message_chunks.add_chunk_to_message(mid, TOKEN)
+        message_chunks.mark_message_complete(mid)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    message_chunks.MESSAGE_CHUNKS.clear()
+    return {'trackers': trackers, 'tokens_each': tokens, 'bytes_per_tracker': round((after - before) / trackers)}
+
+
+def _ints(text):
+    return [int(x) for x in text.split(',') if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming primitive micro-benchmarks')
+    parser.add_argument('--messages', default='1,100,1000', help='concurrent messages (comma-separated)')
+    parser.add_argument('--readers', default='1,10,100', help='readers per message (comma-separated)')
+    parser.add_argument('--tokens', type=int, default=200, help='tokens per message')
+    parser.add_argument('--rate', type=float, default=50.0, help='tokens/s per message (0 = as fast as possible)')
+    parser.add_argument('--reader-work-ms', type=float, default=0.5, help='simulated consumer work per chunk')
+    parser.add_argument('--max-threads', type=int, default=2000, help='skip scenarios needing more reader threads')
+    args = parser.parse_args()
+
+    rows = []
+    for messages in _ints(args.messages):
+        for readers in _ints(args.readers):
+            if messages * readers > args.max_threads:
+                print(f'skip {messages} msg x {readers} rdr (> --max-threads)')
+                continue
+            rows.append(run_fanout(messages, readers, args.tokens, args.rate, args.reader_work_ms / 1000))
+    rows.append(run_resume(args.tokens, args.rate))
+    emit = run_socketio_emit(args.tokens * 10)
+    if emit:
+        rows.append(emit)
+    else:
+        print('skip socketio.emit (flask_socketio not installed)')
+
+    cols = ['tokens_produced', 'chunks_delivered', 'cpu_us_per_token', 'replay_us', 'latency_p50_ms', 'latency_p95_ms', 'latency_p99_ms']
+    print(f"{'scenario':<22}" + ''.join(f'{c:>18}' for c in cols))
+    for r in rows:
+        print(f"{r['scenario']:<22}" + ''.join(f"{str(r.get(c, '-')):>18}" for c in cols))
+
+    mem = tracker_memory(1000, args.tokens)
+    print(f"\nmemory: {mem['bytes_per_tracker']} bytes per tracker ({mem['tokens_each']} chunks each, {mem['trackers']} trackers)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Local stand-in for the Anthropic Messages API.
+
+Serves POST /v1/messages (streaming and non-streaming) with the same SSE event
+sequence as the real API, so the `anthropic` SDK can be pointed at it with
+ANTHROPIC_BASE_URL=http://127.0.0.1:<port>. Timing is configurable:
+
+- first_token_ms: delay before the first text delta
+- token_rate: text deltas per second after that
+- jitter: relative gaussian jitter applied to every delay (0.2 = +-20%)
+- error_rate: fraction of requests answered with 529 overloaded
+- stream_error_rate: fraction of streams that break with an error event midway
+
+    python -m perf.fake_anthropic --port 8901 --token-rate 60
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = ('that sounds reasonable so walk me through what happens when the input '
+         'array is empty and then think about how your loop handles duplicates '
+         'before you start writing the code tell me the time complexity').split()
+
+
+class FakeAnthropicConfig:
+    def __init__(self, first_token_ms=400, token_rate=60.0, reply_tokens=80, jitter=0.2,
+                 error_rate=0.0, stream_error_rate=0.0, seed=None):
+        self.first_token_ms = first_token_ms
+        self.token_rate = token_rate
+        self.reply_tokens = reply_tokens
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stream_error_rate = stream_error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def delay(self, seconds):
+        with self.rng_lock:
+            factor = self.rng.gauss(1.0, self.jitter) if self.jitter else 1.0
+        time.sleep(max(0.0, seconds * factor))
+
+    def roll(self, rate):
+        with self.rng_lock:
+            return self.rng.random() < rate
+
+    def tokens(self):
+        with self.rng_lock:
+            return [self.rng.choice(WORDS) + ' ' for _ in range(self.reply_tokens)]
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
+
+
+def make_handler(config):
+    class Handler(BaseHTTPRequestHandler):
+        # keep-alive like the real API, so pooled connection reuse is exercised
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _json(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, data):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+
+        def do_GET(self):
+            if self.path.startswith('/v1/models'):
+                # used by providers.py for warm-up / keep-alive pings
+                return self._json(200, {'data': [{'type': 'model', 'id': 'fake-model', 'display_name': 'Fake',
+                                                  'created_at': '2025-01-01T00:00:00Z'}],
+                                        'has_more': False, 'first_id': 'fake-model', 'last_id': 'fake-model'})
+            self._json(200, {'ok': True})
+
+        def do_POST(self):
+            if not self.path.startswith('/v1/messages'):
+                return self._json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            length = int(self.headers.get('Content-Length') or 0)
+            req = json.loads(self.rfile.read(length) or b'{}')
+            if config.roll(config.error_rate):
+                return self._json(529, {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded (injected)'}})
+
+            msg_id = 'msg_' + uuid.uuid4().hex[:24]
+            model = req.get('model', 'fake-model')
+            input_tokens = sum(len(str(m.get('content', ''))) // 4 for m in req.get('messages', []))
+            tokens = config.tokens()
+            if not req.get('stream'):
+                config.delay(config.first_token_ms / 1000 + len(tokens) / config.token_rate)
+                return self._json(200, {
+                    'id': msg_id, 'type': 'message', 'role': 'assistant', 'model': model,
+                    'content': [{'type': 'text', 'text': ''.join(tokens)}],
+                    'stop_reason': 'end_turn', 'stop_sequence': None,
+                    'usage': {'input_tokens': input_tokens, 'output_tokens': len(tokens)},
+                })
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            fail_at = len(tokens) // 2 if config.roll(config.stream_error_rate) else None
+            try:
+                self._chunk(_sse('message_start', {'type': 'message_start', 'message': {
+                    'id': msg_id, 'type': 'message', 'role': 'assistant', 'model': model, 'content': [],
+                    'stop_reason': None, 'stop_sequence': None,
+                    'usage': {'input_tokens': input_tokens, 'output_tokens': 1}}}))
+                self._chunk(_sse('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                                          'content_block': {'type': 'text', 'text': ''}}))
+                self.wfile.flush()
+                config.delay(config.first_token_ms / 1000)
+                for i, tok in enumerate(tokens):
+                    if i == fail_at:
+                        self._chunk(_sse('error', {'type': 'error', 'error': {
+                            'type': 'overloaded_error', 'message': 'Overloaded (injected mid-stream)'}}))
+                        self._chunk(b'')
+                        self.wfile.flush()
+                        return
+                    if i:
+                        config.delay(1 / config.token_rate)
+                    self._chunk(_sse('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                                              'delta': {'type': 'text_delta', 'text': tok}}))
+                    self.wfile.flush()
+                self._chunk(_sse('content_block_stop', {'type': 'content_block_stop', 'index': 0}))
+                self._chunk(_sse('message_delta', {'type': 'message_delta',
+                                                    'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                                    'usage': {'output_tokens': len(tokens)}}))
+                self._chunk(_sse('message_stop', {'type': 'message_stop'}))
+                self._chunk(b'')
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # client cancelled the stream
+                pass
+
+    return Handler
+
+
+def serve(port=8901, host='127.0.0.1', config=None):
+    """Start the fake API in a daemon thread and return the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(config or FakeAnthropicConfig()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='fake-anthropic', daemon=True).start()
+    return server
+
+
+def add_arguments(parser):
+    parser.add_argument('--llm-first-token-ms', type=float, default=400)
+    parser.add_argument('--llm-token-rate', type=float, default=60.0, help='text deltas per second')
+    parser.add_argument('--llm-reply-tokens', type=int, default=80)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-stream-error-rate', type=float, default=0.0)
+
+
+def config_from_args(args):
+    return FakeAnthropicConfig(first_token_ms=args.llm_first_token_ms, token_rate=args.llm_token_rate,
+                               reply_tokens=args.llm_reply_tokens, jitter=args.jitter,
+                               error_rate=args.llm_error_rate, stream_error_rate=args.llm_stream_error_rate,
+                               seed=args.seed)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Anthropic Messages API')
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=None)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(config_from_args(args)))
+    server.daemon_threads = True
+    print(f'fake anthropic listening on http://127.0.0.1:{args.port}', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
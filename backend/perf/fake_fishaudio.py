@@ -0,0 +1,127 @@
+"""In-process stand-in for the FishAudio client used by tts.py and sst.py.
+
+Only the calls the backend makes are implemented: tts.stream_websocket,
+tts.convert and asr.transcribe. The live TTS websocket protocol is not a
+documented public contract, so instead of a fake server the load test swaps
+this object in as the shared provider client (see install()).
+
+Timing knobs:
+- first_audio_ms: delay from the first text chunk to the first audio chunk
+- chunk_ms / chunk_bytes: audio cadence and size while text keeps arriving
+- chars_per_chunk: how much text one audio chunk "covers"
+- asr_ms: transcription latency
+- jitter / error_rate: relative gaussian jitter and injected failures
+"""
+import time
+import random
+import threading
+
+# an MPEG-1 layer III frame header followed by silence is enough for byte counting
+_FRAME = b'\xff\xfb\x90\x64' + bytes(413)
+
+
+class FakeFishAudioConfig:
+    def __init__(self, first_audio_ms=250, chunk_ms=60, chunk_bytes=4096, chars_per_chunk=40,
+                 asr_ms=300, transcript='I would sort the array first and then scan it once.',
+                 jitter=0.2, error_rate=0.0, seed=None):
+        self.first_audio_ms = first_audio_ms
+        self.chunk_ms = chunk_ms
+        self.chunk_bytes = chunk_bytes
+        self.chars_per_chunk = chars_per_chunk
+        self.asr_ms = asr_ms
+        self.transcript = transcript
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+
+    def delay(self, seconds):
+        with self.rng_lock:
+            factor = self.rng.gauss(1.0, self.jitter) if self.jitter else 1.0
+        time.sleep(max(0.0, seconds * factor))
+
+    def maybe_fail(self, what):
+        with self.rng_lock:
+            failed = self.rng.random() < self.error_rate
+        if failed:
+            raise RuntimeError(f'injected {what} failure')
+
+    def audio_chunk(self):
+        return (_FRAME * (self.chunk_bytes // len(_FRAME) + 1))[:self.chunk_bytes]
+
+
+class _ASRResult:
+    def __init__(self, text, duration):
+        self.text = text
+        self.duration = duration
+
+
+class _FakeTTS:
+    def __init__(self, config):
+        self.config = config
+
+    def stream_websocket(self, text, reference_id=None, latency='balanced', **kwargs):
+        cfg = self.config
+        cfg.maybe_fail('tts')
+        pending = 0
+        started = False
+        for piece in text:
+            if not piece:
+                continue
+            if not started:
+                cfg.delay(cfg.first_audio_ms / 1000)
+                started = True
+            pending += len(piece)
+            while pending >= cfg.chars_per_chunk:
+                pending -= cfg.chars_per_chunk
+                yield cfg.audio_chunk()
+                cfg.delay(cfg.chunk_ms / 1000)
+        if pending:
+            if not started:
+                cfg.delay(cfg.first_audio_ms / 1000)
+            yield cfg.audio_chunk()
+
+    def convert(self, text, reference_id=None, latency='balanced', **kwargs):
+        return b''.join(self.stream_websocket([text], reference_id, latency))
+
+
+class _FakeASR:
+    def __init__(self, config):
+        self.config = config
+
+    def transcribe(self, audio, language=None, **kwargs):
+        cfg = self.config
+        cfg.delay(cfg.asr_ms / 1000)
+        cfg.maybe_fail('asr')
+        return _ASRResult(cfg.transcript, duration=len(audio) // 16)
+
+
+class FakeFishAudio:
+    def __init__(self, config=None):
+        self.config = config or FakeFishAudioConfig()
+        self.tts = _FakeTTS(self.config)
+        self.asr = _FakeASR(self.config)
+
+
+def install(config=None):
+    """Use a fake as the FishAudio client shared by tts.py and sst.py."""
+    import providers
+    fake = FakeFishAudio(config)
+    providers.set_client('fishaudio', fake)
+    return fake
+
+
+def add_arguments(parser):
+    parser.add_argument('--tts-first-audio-ms', type=float, default=250)
+    parser.add_argument('--tts-chunk-ms', type=float, default=60)
+    parser.add_argument('--tts-chunk-bytes', type=int, default=4096)
+    parser.add_argument('--tts-chars-per-chunk', type=int, default=40)
+    parser.add_argument('--asr-ms', type=float, default=300)
+    parser.add_argument('--fish-error-rate', type=float, default=0.0)
+
+
+def config_from_args(args):
+    return FakeFishAudioConfig(first_audio_ms=args.tts_first_audio_ms, chunk_ms=args.tts_chunk_ms,
+                               chunk_bytes=args.tts_chunk_bytes, chars_per_chunk=args.tts_chars_per_chunk,
+                               asr_ms=args.asr_ms, jitter=args.jitter, error_rate=args.fish_error_rate,
+                               seed=args.seed)
@@ -0,0 +1,272 @@
+"""Offline end-to-end load test for main.py.
+
+Boots a fake Anthropic server and the backend (with FishAudio stand-ins) as
+subprocesses, then drives N simulated candidates concurrently through
+
+    create conversation -> /sst upload -> POST message -> tts_stream
+
+and reports throughput plus latency percentiles. Time to first token is taken
+from the first `llm_response` socket.io event and time to first audio byte
+from the tts_stream response, both measured from the start of the message
+POST. No real API credits are used.
+
+    python -m perf.loadtest --candidates 20 --turns 3 --llm-token-rate 60
+    python -m perf.loadtest --app-url http://127.0.0.1:5067   # existing server
+
+The /sst stage needs ffmpeg (for both the sample clip and the server); it is
+skipped with a note when ffmpeg is not installed.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+import requests
+import socketio
+
+from perf import fake_anthropic, fake_fishaudio
+from perf.stats import summarize, format_table
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBLEM = {
+    'problem_title': 'Two Sum',
+    'problem_desc': 'Given an array of integers nums and an integer target, return indices of the two numbers that add up to target.',
+    'greeting': 'Hi, thanks for joining. Let us start with a quick problem. Have you read the description?',
+}
+CODE = 'def two_sum(nums, target):\n    seen = {}\n    for i, n in enumerate(nums):\n        pass\n'
+FALLBACK_TRANSCRIPT = 'I think I can use a dictionary to remember what I have seen so far.'
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_http(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return True
+        except requests.RequestException:
+            time.sleep(0.2)
+    return False
+
+
+def make_sample_audio(seconds=2.0):
+    """A short Opus/WebM clip like the browser recorder produces, or None without ffmpeg."""
+    if not shutil.which('ffmpeg'):
+        return None
+    out = subprocess.run(
+        ['ffmpeg', '-loglevel', 'error', '-f', 'lavfi', '-i', f'sine=frequency=300:duration={seconds}',
+         '-c:a', 'libopus', '-f', 'webm', 'pipe:1'],
+        check=True, capture_output=True,
+    )
+    return out.stdout
+
+
+class Recorder:
+    """Thread-safe collection of per-stage samples and error counts."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+        self.turns = 0
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def error(self, stage, exc):
+        with self.lock:
+            key = f'{stage}: {type(exc).__name__}'
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def turn_done(self):
+        with self.lock:
+            self.turns += 1
+
+
+def run_candidate(base, turns, audio, rec, think_s, timeout):
+    http = requests.Session()
+    sio = socketio.Client(reconnection=False)
+    state = {'first': None}
+    got_first = threading.Event()
+
+    @sio.on('llm_response')
+    def on_chunk(chunk):
+        if state['first'] is None:
+            state['first'] = time.perf_counter()
+            got_first.set()
+
+    try:
+        sio.connect(base, wait_timeout=timeout)
+        sid = sio.get_sid()
+        t = time.perf_counter()
+        r = http.post(f'{base}/conversations', json=PROBLEM, timeout=timeout)
+        r.raise_for_status()
+        rec.add('create_conversation', time.perf_counter() - t)
+        conv_id = r.json()['conversation_id']
+    except Exception as e:
+        rec.error('setup', e)
+        sio.disconnect()
+        return
+
+    for _ in range(turns):
+        transcript = FALLBACK_TRANSCRIPT
+        trace_id = None
+        if audio is not None:
+            t = time.perf_counter()
+            try:
+                r = http.post(f'{base}/sst', files={'file': ('answer.webm', audio, 'audio/webm')}, timeout=timeout)
+                r.raise_for_status()
+                rec.add('sst', time.perf_counter() - t)
+                transcript = r.json().get('text') or transcript
+                trace_id = r.json().get('trace_id')
+            except Exception as e:
+                rec.error('sst', e)
+
+        state['first'] = None
+        got_first.clear()
+        t0 = time.perf_counter()
+        try:
+            r = http.post(f'{base}/conversations/{conv_id}/messages',
+                          json={'content': transcript, 'sid': sid, 'code': CODE, 'trace_id': trace_id},
+                          timeout=timeout)
+            r.raise_for_status()
+            rec.add('post_message', time.perf_counter() - t0)
+            msg_id = r.json()['assistant_message_id']
+
+            first_audio = None
+            nbytes = 0
+            with http.get(f'{base}/conversations/{conv_id}/messages/{msg_id}/tts_stream',
+                          stream=True, timeout=timeout) as resp:
+                resp.raise_for_status()
+                for chunk in resp.iter_content(chunk_size=None):
+                    if chunk and first_audio is None:
+                        first_audio = time.perf_counter()
+                    nbytes += len(chunk)
+            done = time.perf_counter()
+            if first_audio is None:
+                raise RuntimeError('empty audio stream')
+            rec.add('time_to_first_audio', first_audio - t0)
+            rec.add('turn_total', done - t0)
+            if got_first.wait(timeout):
+                rec.add('time_to_first_token', state['first'] - t0)
+            else:
+                rec.error('llm_response', TimeoutError('no llm_response event'))
+            rec.turn_done()
+        except Exception as e:
+            rec.error('turn', e)
+        if think_s:
+            time.sleep(think_s)
+
+    sio.disconnect()
+
+
+def run_load(base, candidates, turns, audio, ramp_s=0.0, think_s=0.0, timeout=60.0):
+    rec = Recorder()
+    threads = []
+    started = time.perf_counter()
+    for i in range(candidates):
+        th = threading.Thread(target=run_candidate, args=(base, turns, audio, rec, think_s, timeout), daemon=True)
+        th.start()
+        threads.append(th)
+        if ramp_s and candidates > 1:
+            time.sleep(ramp_s / (candidates - 1))
+    for th in threads:
+        th.join()
+    wall = time.perf_counter() - started
+    return {
+        'candidates': candidates,
+        'turns_per_candidate': turns,
+        'completed_turns': rec.turns,
+        'wall_s': round(wall, 3),
+        'turns_per_s': round(rec.turns / wall, 3) if wall else None,
+        'sst': 'enabled' if audio is not None else 'skipped (ffmpeg not found)',
+        'latency_ms': {stage: summarize(v) for stage, v in sorted(rec.samples.items())},
+        'errors': rec.errors,
+    }
+
+
+def boot(args, workdir):
+    """Start fake_anthropic and serve_app subprocesses; returns (base_url, procs)."""
+    llm_port = _free_port()
+    app_port = _free_port()
+    common = ['--jitter', str(args.jitter)] + (['--seed', str(args.seed)] if args.seed is not None else [])
+    llm_cmd = [sys.executable, '-m', 'perf.fake_anthropic', '--port', str(llm_port),
+               '--llm-first-token-ms', str(args.llm_first_token_ms), '--llm-token-rate', str(args.llm_token_rate),
+               '--llm-reply-tokens', str(args.llm_reply_tokens), '--llm-error-rate', str(args.llm_error_rate),
+               '--llm-stream-error-rate', str(args.llm_stream_error_rate)] + common
+    app_cmd = [sys.executable, '-m', 'perf.serve_app', '--port', str(app_port),
+               '--anthropic-url', f'http://127.0.0.1:{llm_port}', '--db', os.path.join(workdir, 'loadtest.db'),
+               '--tts-first-audio-ms', str(args.tts_first_audio_ms), '--tts-chunk-ms', str(args.tts_chunk_ms),
+               '--tts-chunk-bytes', str(args.tts_chunk_bytes), '--tts-chars-per-chunk', str(args.tts_chars_per_chunk),
+               '--asr-ms', str(args.asr_ms), '--fish-error-rate', str(args.fish_error_rate)] + common
+    procs = [subprocess.Popen(llm_cmd, cwd=BACKEND_DIR)]
+    if not _wait_http(f'http://127.0.0.1:{llm_port}/'):
+        raise RuntimeError('fake anthropic server did not start')
+    procs.append(subprocess.Popen(app_cmd, cwd=BACKEND_DIR))
+    base = f'http://127.0.0.1:{app_port}'
+    if not _wait_http(base + '/healthz'):
+        raise RuntimeError('backend did not start')
+    return base, procs
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline load test for the interview backend')
+    parser.add_argument('--candidates', type=int, default=10, help='concurrent simulated candidates')
+    parser.add_argument('--turns', type=int, default=3, help='turns per candidate')
+    parser.add_argument('--ramp-s', type=float, default=2.0, help='spread candidate start over this many seconds')
+    parser.add_argument('--think-ms', type=float, default=0, help='pause between turns')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--app-url', default=None, help='drive an already running backend instead of booting one')
+    parser.add_argument('--no-sst', action='store_true', help='skip the /sst upload stage')
+    parser.add_argument('--json', dest='json_path', default=None, help='also write the report to this file')
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=None)
+    fake_anthropic.add_arguments(parser)
+    fake_fishaudio.add_arguments(parser)
+    args = parser.parse_args()
+
+    audio = None if args.no_sst else make_sample_audio()
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    procs = []
+    try:
+        if args.app_url:
+            base = args.app_url.rstrip('/')
+        else:
+            base, procs = boot(args, workdir)
+        report = run_load(base, args.candidates, args.turns, audio,
+                          ramp_s=args.ramp_s, think_s=args.think_ms / 1000, timeout=args.timeout)
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{report['completed_turns']} turns in {report['wall_s']}s "
+          f"({report['turns_per_s']} turns/s), {report['candidates']} candidates, sst {report['sst']}")
+    print(format_table(report['latency_ms']))
+    if report['errors']:
+        print('errors:', json.dumps(report['errors'], indent=2))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
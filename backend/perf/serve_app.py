@@ -0,0 +1,42 @@
+"""Boot the backend (main.py) against local provider stand-ins.
+
+The Anthropic SDK is pointed at a fake_anthropic server via ANTHROPIC_BASE_URL
+and the shared FishAudio client is replaced in-process (fake_fishaudio.install).
+Uses a throwaway SQLite file so load tests never touch data.db.
+
+    python -m perf.serve_app --port 5099 --anthropic-url http://127.0.0.1:8901
+"""
+import os
+import argparse
+
+from perf import fake_fishaudio
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run main.py against fake providers')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--anthropic-url', required=True)
+    parser.add_argument('--db', default='loadtest.db')
+    parser.add_argument('--jitter', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=None)
+    fake_fishaudio.add_arguments(parser)
+    args = parser.parse_args()
+
+    # read when providers.py first constructs the Anthropic client
+    os.environ['ANTHROPIC_BASE_URL'] = args.anthropic_url
+    os.environ.setdefault('ANTHROPIC_API_KEY', 'fake-key')
+    os.environ.setdefault('FISH_API_KEY', 'fake-key')
+    os.environ.setdefault('WS_SECRET_KEY', 'loadtest')
+
+    import db
+    db.DB_PATH = args.db
+    fake_fishaudio.install(fake_fishaudio.config_from_args(args))
+
+    import main as backend
+    print(f'backend (fake providers) on http://127.0.0.1:{args.port}', flush=True)
+    backend.socketio.run(backend.app, host='127.0.0.1', port=args.port,
+                         allow_unsafe_werkzeug=True, use_reloader=False, log_output=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Small helpers for latency reports."""
+import math
+
+
+def percentile(values, p):
+    """Nearest-rank percentile of `values` (p in 0..100). None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def summarize(values, scale=1000.0):
+    """count/mean/p50/p95/p99/max of `values` (seconds), reported in ms by default."""
+    if not values:
+        return {'count': 0}
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values) * scale, 2),
+        'p50': round(percentile(values, 50) * scale, 2),
+        'p95': round(percentile(values, 95) * scale, 2),
+        'p99': round(percentile(values, 99) * scale, 2),
+        'max': round(max(values) * scale, 2),
+    }
+
+
+def format_table(rows):
+    """Render {name: summarize(...)} as a fixed-width text table."""
+    cols = ['count', 'mean', 'p50', 'p95', 'p99', 'max']
+    lines = [f"{'':<24}" + ''.join(f'{c:>10}' for c in cols)]
+    for name, s in rows.items():
+        lines.append(f'{name:<24}' + ''.join(f"{str(s.get(c, '-')):>10}" for c in cols))
+    return '\n'.join(lines)
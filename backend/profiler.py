@@ -0,0 +1,126 @@
+"""On-demand diagnostics: a stack-sampling profiler and tracemalloc snapshots.
+
+The sampler reads sys._current_frames() at a fixed rate from its own thread,
+so profiled code is never instrumented; cost is one frame walk per thread per
+sample. Output is the collapsed-stack format consumed by flamegraph.pl and
+speedscope ("root;caller;callee count" per line).
+
+Only one profile runs at a time and duration/rate are clamped, so it is safe
+to trigger on a loaded production worker.
+"""
+import os
+import sys
+import time
+import threading
+import tracemalloc
+
+MAX_PROFILE_SECONDS = float(os.environ.get('MAX_PROFILE_SECONDS', '60'))
+MAX_SAMPLE_HZ = 1000
+
+_PROFILE_LOCK = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+
+
+def sample_stacks(seconds=10.0, hz=100, by_thread=True):
+    """Sample every thread's stack for `seconds` at `hz` and return collapsed stacks.
+
+    Raises ProfilerBusy if another profile is already running.
+    """
+    seconds = max(0.1, min(float(seconds), MAX_PROFILE_SECONDS))
+    hz = max(1, min(int(hz), MAX_SAMPLE_HZ))
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        raise ProfilerBusy('a profile is already running')
+    try:
+        me = threading.get_ident()
+        counts = {}
+        interval = 1.0 / hz
+        deadline = time.monotonic() + seconds
+        samples = 0
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                if by_thread:
+                    # "Thread-12 (run)" -> "Thread" so worker threads share one root
+                    stack.append(names.get(ident, str(ident)).split(' (')[0].rstrip('0123456789-') or 'thread')
+                key = ';'.join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+        lines = [f'{stack} {n}' for stack, n in sorted(counts.items(), key=lambda kv: -kv[1])]
+        return '\n'.join(lines) + '\n', {'seconds': seconds, 'hz': hz, 'samples': samples}
+    finally:
+        _PROFILE_LOCK.release()
+
+
+# --- tracemalloc ----------------------------------------------------------
+
+_BASELINE = {'snapshot': None}
+
+
+def tracemalloc_start(nframes=1):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(1, min(int(nframes), 25)))
+    _BASELINE['snapshot'] = tracemalloc.take_snapshot()
+
+
+def tracemalloc_stop():
+    _BASELINE['snapshot'] = None
+    tracemalloc.stop()
+
+
+def _filtered(snapshot):
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ))
+
+
+def _stat_dict(stat, diff=False):
+    out = {
+        'where': [f'{f.filename}:{f.lineno}' for f in stat.traceback],
+        'size_kb': round(stat.size / 1024, 1),
+        'count': stat.count,
+    }
+    if diff:
+        out['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+        out['count_diff'] = stat.count_diff
+    return out
+
+
+def tracemalloc_top(limit=25, group_by='lineno'):
+    """Top allocation sites right now. Requires tracemalloc_start()."""
+    if not tracemalloc.is_tracing():
+        return None
+    snap = _filtered(tracemalloc.take_snapshot())
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'traced_kb': round(current / 1024, 1),
+        'peak_kb': round(peak / 1024, 1),
+        'top': [_stat_dict(s) for s in snap.statistics(group_by)[:limit]],
+    }
+
+
+def tracemalloc_diff(limit=25, group_by='lineno', reset=False):
+    """Allocation growth since the baseline snapshot (taken at start or last reset)."""
+    if not tracemalloc.is_tracing() or _BASELINE['snapshot'] is None:
+        return None
+    snap = tracemalloc.take_snapshot()
+    stats = _filtered(snap).compare_to(_filtered(_BASELINE['snapshot']), group_by)
+    if reset:
+        _BASELINE['snapshot'] = snap
+    return {'top': [_stat_dict(s, diff=True) for s in stats[:limit]]}
@@ -0,0 +1,165 @@
+"""Shared, lazily constructed provider clients.
+
+Importing the Anthropic and FishAudio SDKs and building their clients is the
+slowest part of importing main.py, so nothing is built at import time: the
+first caller of anthropic_client()/fishaudio_client() pays for it, or
+warm_async() does it off the request path right after startup. tts.py and
+sst.py share one FishAudio client.
+
+The Anthropic client runs on a sized httpx keep-alive pool. warm_async() also
+opens UPSTREAM_WARM_CONNECTIONS pooled connections with a free API call
+(models.list), and a keep-alive thread repeats that after
+UPSTREAM_KEEPALIVE_INTERVAL_S of inactivity, so the TCP+TLS handshake is not
+paid on a turn's critical path after a quiet period. New vs reused
+connections are counted per request and exported via metrics.
+
+FishAudio TTS opens one websocket per synthesis, so it has no reusable pool;
+only client construction is warmed for it.
+"""
+import os
+import time
+import threading
+
+import metrics
+
+ANTHROPIC_POOL_SIZE = int(os.environ.get('ANTHROPIC_POOL_SIZE', '20'))
+# keep idle pooled connections longer than the keep-alive interval
+ANTHROPIC_KEEPALIVE_EXPIRY_S = float(os.environ.get('ANTHROPIC_KEEPALIVE_EXPIRY_S', '120'))
+UPSTREAM_KEEPALIVE_INTERVAL_S = float(os.environ.get('UPSTREAM_KEEPALIVE_INTERVAL_S', '30'))
+UPSTREAM_WARM_CONNECTIONS = int(os.environ.get('UPSTREAM_WARM_CONNECTIONS', '2'))
+
+_CLIENTS = {}
+_LOCKS = {'anthropic': threading.Lock(), 'fishaudio': threading.Lock()}
+
+# name -> seconds spent importing + constructing the client
+INIT_SECONDS = {}
+
+
+def _get(name, factory):
+    client = _CLIENTS.get(name)
+    if client is None:
+        with _LOCKS[name]:
+            client = _CLIENTS.get(name)
+            if client is None:
+                start = time.perf_counter()
+                client = _CLIENTS[name] = factory()
+                INIT_SECONDS[name] = time.perf_counter() - start
+    return client
+
+
+# provider -> monotonic time of the last upstream response
+_LAST_USED = {}
+
+
+class _ConnTrace:
+    """httpx trace hook: notes whether a request had to open a new connection."""
+    __slots__ = ('new_connection',)
+
+    def __init__(self):
+        self.new_connection = False
+
+    def __call__(self, event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            self.new_connection = True
+
+
+def _on_request(request):
+    request.extensions['trace'] = _ConnTrace()
+
+
+def _on_response(response):
+    _LAST_USED['anthropic'] = time.monotonic()
+    trace = response.request.extensions.get('trace')
+    if isinstance(trace, _ConnTrace):
+        if trace.new_connection:
+            metrics.counter_inc('anthropic_connections_new_total', help_text='Anthropic requests that opened a new connection.')
+        else:
+            metrics.counter_inc('anthropic_connections_reused_total', help_text='Anthropic requests served on a pooled connection.')
+
+
+def _make_anthropic():
+    import httpx
+    from anthropic import Anthropic, DefaultHttpxClient
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(max_connections=ANTHROPIC_POOL_SIZE,
+                            max_keepalive_connections=ANTHROPIC_POOL_SIZE,
+                            keepalive_expiry=ANTHROPIC_KEEPALIVE_EXPIRY_S),
+        event_hooks={'request': [_on_request], 'response': [_on_response]},
+    )
+    return Anthropic(http_client=http_client)
+
+
+def _make_fishaudio():
+    from fishaudio import FishAudio
+    return FishAudio()
+
+
+def anthropic_client():
+    return _get('anthropic', _make_anthropic)
+
+
+def fishaudio_client():
+    return _get('fishaudio', _make_fishaudio)
+
+
+def set_client(name, client):
+    """Install a client explicitly (e.g. the load-test stand-ins)."""
+    _CLIENTS[name] = client
+
+
+def _ping_anthropic(connections):
+    """Open/refresh `connections` pooled connections with concurrent free calls."""
+    client = anthropic_client()
+    errors = []
+
+    def ping():
+        try:
+            client.models.list(limit=1)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ping, daemon=True) for _ in range(max(1, connections))]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join(timeout=30)
+    metrics.counter_inc('upstream_warm_pings_total', len(threads), 'Keep-alive/warm-up calls sent upstream.')
+    if errors:
+        print('anthropic warm-up failed:', errors[0])
+
+
+def _keepalive_loop():
+    while True:
+        time.sleep(UPSTREAM_KEEPALIVE_INTERVAL_S / 2)
+        idle = time.monotonic() - _LAST_USED.get('anthropic', 0)
+        if idle >= UPSTREAM_KEEPALIVE_INTERVAL_S:
+            _ping_anthropic(UPSTREAM_WARM_CONNECTIONS)
+
+
+def _reuse_ratio():
+    new = metrics.counter_value('anthropic_connections_new_total')
+    reused = metrics.counter_value('anthropic_connections_reused_total')
+    return round(reused / (new + reused), 4) if new + reused else 0
+
+
+metrics.register_gauge('anthropic_connection_reuse_ratio', _reuse_ratio,
+                       'Share of Anthropic requests that reused a pooled connection.')
+
+
+def warm_async():
+    """Construct all clients and pre-open pooled connections in a background
+    thread, then keep the pool warm across idle gaps."""
+    def warm():
+        for make in (anthropic_client, fishaudio_client):
+            try:
+                make()
+            except Exception as e:
+                print('provider warm-up failed:', e)
+        if 'anthropic' in _CLIENTS and UPSTREAM_WARM_CONNECTIONS > 0:
+            _ping_anthropic(UPSTREAM_WARM_CONNECTIONS)
+            if UPSTREAM_KEEPALIVE_INTERVAL_S > 0:
+                _keepalive_loop()
+
+    th = threading.Thread(target=warm, name='provider-warmup', daemon=True)
+    th.start()
+    return th
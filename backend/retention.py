@@ -0,0 +1,164 @@
+"""Retention job for data.db.
+
+Conversations idle for longer than RETENTION_DAYS are archived to
+ARCHIVE_DIR/<conversation_id>.ndjson.gz (same layout as the NDJSON export),
+removed from the hot DB in batches, and the freed pages are returned to the
+filesystem with an incremental vacuum.
+
+Run it from cron:  python retention.py [--days N] [--dry-run]
+or in-process by setting RETENTION_INTERVAL_HOURS (see main.py).
+"""
+import os
+import sys
+import gzip
+import json
+import fcntl
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta, UTC
+
+import db
+import audio_store
+
+RETENTION_DAYS = float(os.environ.get('RETENTION_DAYS', '30'))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+RETENTION_BATCH_SIZE = int(os.environ.get('RETENTION_BATCH_SIZE', '100'))
+# pages released per incremental_vacuum call between batches (0 = all)
+VACUUM_PAGES_PER_BATCH = int(os.environ.get('VACUUM_PAGES_PER_BATCH', '2000'))
+# only the worker holding this lock runs the in-process job
+RETENTION_LOCK_PATH = os.environ.get('RETENTION_LOCK_PATH', 'retention.lock')
+
+
+def archive_path(conversation_id):
+    return os.path.join(ARCHIVE_DIR, f'{conversation_id}.ndjson.gz')
+
+
+def archive_conversation(conversation_id):
+    """Write a conversation and its messages to a gzip NDJSON file.
+
+    The file is written under a temporary name, fsynced and then renamed, so a
+    crash never leaves a truncated archive behind a deleted conversation.
+    Returns the archive path, or None if the conversation no longer exists.
+    """
+    conv = db.get_conversation(conversation_id)
+    if not conv:
+        return None
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(conversation_id)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as gz:
+            gz.write((json.dumps({'conversation': conv}) + '\n').encode('utf-8'))
+            for m in db.iter_messages(conversation_id):
+                gz.write((m.to_json() + '\n').encode('utf-8'))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_retention(max_age_days=None, batch_size=None, dry_run=False):
+    """Archive and delete conversations idle for more than max_age_days.
+
+    Returns a report dict with counts, timings and DB size before/after.
+    """
+    max_age_days = RETENTION_DAYS if max_age_days is None else max_age_days
+    batch_size = batch_size or RETENTION_BATCH_SIZE
+    cutoff = (datetime.now(UTC) - timedelta(days=max_age_days)).isoformat()
+    started = time.monotonic()
+    before = db.db_stats()
+
+    if dry_run:
+        # LIMIT -1 means no limit in SQLite
+        stale = len(db.list_stale_conversations(cutoff, limit=-1))
+        return {'cutoff': cutoff, 'dry_run': True, 'would_archive': stale, 'before': before}
+
+    converted = db.enable_incremental_vacuum()
+    archived = 0
+    deleted = 0
+    failed = set()
+    while True:
+        # over-fetch by the failures so far so a stuck conversation can't stall the run
+        ids = [i for i in db.list_stale_conversations(cutoff, limit=batch_size + len(failed)) if i not in failed]
+        if not ids:
+            break
+        done = []
+        for conv_id in ids:
+            try:
+                archive_conversation(conv_id)
+                done.append(conv_id)
+            except OSError as e:
+                print('retention: failed to archive', conv_id, e)
+                failed.add(conv_id)
+        archived += len(done)
+        # a conversation written to since it was archived is no longer stale and is kept
+        removed = db.delete_conversations(done, updated_before=cutoff)
+        deleted += len(removed)
+        for conv_id in removed:
+            audio_store.delete_conversation_audio(conv_id)
+        db.incremental_vacuum(VACUUM_PAGES_PER_BATCH)
+
+    db.incremental_vacuum()
+    after = db.db_stats()
+    return {
+        'cutoff': cutoff,
+        'dry_run': False,
+        'archived': archived,
+        'deleted': deleted,
+        'failed': len(failed),
+        'converted_to_incremental_vacuum': converted,
+        'elapsed_s': round(time.monotonic() - started, 3),
+        'before': before,
+        'after': after,
+    }
+
+
+def _acquire_leader_lock():
+    """Exclusive lock on RETENTION_LOCK_PATH, held for the life of the process.
+    Returns the open lock file, or None if another process holds it."""
+    f = open(RETENTION_LOCK_PATH, 'a')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def start_retention_thread(interval_hours):
+    """Run run_retention every interval_hours in a daemon thread.
+
+    Every worker process starts the thread, but only the one holding the
+    retention lock runs the job; if it exits, another worker takes over.
+    """
+    def loop():
+        lock = None
+        while True:
+            time.sleep(interval_hours * 3600)
+            lock = lock or _acquire_leader_lock()
+            if lock is None:
+                continue
+            try:
+                print('retention:', json.dumps(run_retention()))
+            except Exception as e:
+                print('retention job failed', e)
+
+    th = threading.Thread(target=loop, name='retention', daemon=True)
+    th.start()
+    return th
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=float, default=None, help=f'max idle age in days (default {RETENTION_DAYS})')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--dry-run', action='store_true', help='only count what would be archived')
+    parser.add_argument('--stats', action='store_true', help='print DB size report and exit')
+    args = parser.parse_args()
+    db.init_db()
+    if args.stats:
+        print(json.dumps(db.db_stats(), indent=2))
+        sys.exit(0)
+    report = run_retention(args.days, args.batch_size, args.dry_run)
+    print(json.dumps(report, indent=2))
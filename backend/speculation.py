@@ -0,0 +1,164 @@
+"""Speculative LLM generation from partial transcripts.
+
+With SPECULATIVE_LLM=1 the client may POST a stable partial transcript to
+/conversations/<id>/speculate while the candidate is still finishing speaking.
+stream_haiku starts right away with that text as the pending user turn and its
+output is buffered in a chunk log (message_chunks) under a private key.
+
+When the final message POST arrives, claim() compares it with the partial:
+if they match after normalization (case, punctuation, whitespace) or are at
+least SPECULATION_MATCH_RATIO similar, and the code is unchanged, the buffered
+stream becomes the reply and the LLM time-to-first-token is already paid.
+Otherwise the speculative stream is cancelled and discarded. If a claimed
+speculation fails before producing text, follow() switches to a live reply;
+if it fails part-way, follow() raises so the reply is stored as truncated.
+Unclaimed speculations are dropped after SPECULATION_TTL_S.
+"""
+import os
+import re
+import time
+import uuid
+import difflib
+import threading
+
+import metrics
+from claude import stream_haiku
+from message_chunks import (MESSAGE_CHUNKS, get_or_create_message_tracker, add_chunk_to_message,
+                            mark_message_complete, iter_message_chunks, cancel_message, is_cancelled,
+                            on_cancel)
+
+ENABLED = os.environ.get('SPECULATIVE_LLM', '0') == '1'
+MATCH_RATIO = float(os.environ.get('SPECULATION_MATCH_RATIO', '0.95'))
+TTL_S = float(os.environ.get('SPECULATION_TTL_S', '30'))
+
+# conversation_id -> {'key', 'transcript', 'code', 'started'}
+_SPECS = {}
+_LOCK = threading.Lock()
+# key -> exception of a speculation whose generation failed
+_ERRORS = {}
+
+_NON_WORD = re.compile(r"[^\w']+")
+
+
+def normalize(text):
+    return ' '.join(_NON_WORD.sub(' ', (text or '').lower()).split())
+
+
+def matches(partial, final):
+    a, b = normalize(partial), normalize(final)
+    if a == b:
+        return True
+    return bool(a) and difflib.SequenceMatcher(None, a, b).ratio() >= MATCH_RATIO
+
+
+def _discard(spec):
+    _ERRORS.pop(spec['key'], None)
+    if not cancel_message(spec['key']):
+        # producer already finished, so nothing else will drop the chunk log
+        MESSAGE_CHUNKS.pop(spec['key'], None)
+    # else the producer thread drops it once it has stopped
+
+
+def _expire(conversation_id, spec):
+    with _LOCK:
+        if _SPECS.get(conversation_id) is not spec:
+            return
+        del _SPECS[conversation_id]
+    metrics.counter_inc('speculation_expired_total', help_text='Speculative replies never claimed.')
+    _discard(spec)
+
+
+def _produce(key, conversation_id, transcript, code, trace_id):
+    gen = stream_haiku(code, conversation_id, trace_id=trace_id, pending_user=transcript,
+                       on_open=lambda stream: on_cancel(key, stream.close))
+    try:
+        for chunk in gen:
+            if is_cancelled(key):
+                break
+            add_chunk_to_message(key, chunk)
+    except Exception as e:
+        if not is_cancelled(key):
+            print('speculative generation failed', e)
+            # claim() rejects it; a follow() already reading sees the error
+            _ERRORS[key] = e
+            cancel_message(key)
+    finally:
+        gen.close()
+        mark_message_complete(key)
+        # a failed log is kept for follow() / _discard() to see and drop
+        if is_cancelled(key) and key not in _ERRORS:
+            MESSAGE_CHUNKS.pop(key, None)
+
+
+def start(conversation_id, transcript, code=None, trace_id=None):
+    """Begin generating a reply to `transcript`, replacing any earlier speculation."""
+    key = f'spec:{uuid.uuid4()}'
+    get_or_create_message_tracker(key)
+    spec = {'key': key, 'transcript': transcript, 'code': code, 'started': time.monotonic()}
+    with _LOCK:
+        old = _SPECS.get(conversation_id)
+        _SPECS[conversation_id] = spec
+    if old:
+        _discard(old)
+    metrics.counter_inc('speculation_started_total', help_text='Speculative LLM generations started.')
+    threading.Thread(target=_produce, args=(key, conversation_id, transcript, code, trace_id),
+                     name='llm-speculate', daemon=True).start()
+    timer = threading.Timer(TTL_S, _expire, args=(conversation_id, spec))
+    timer.daemon = True
+    timer.start()
+    return key
+
+
+def claim(conversation_id, transcript, code=None):
+    """Key of the speculation for this conversation if it matches the final transcript
+    (hit; read it with follow()), else None (the speculation is discarded)."""
+    with _LOCK:
+        spec = _SPECS.pop(conversation_id, None)
+    if spec is None:
+        return None
+    fresh = time.monotonic() - spec['started'] <= TTL_S
+    if (fresh and not is_cancelled(spec['key']) and (code or None) == (spec['code'] or None)
+            and matches(spec['transcript'], transcript)):
+        metrics.counter_inc('speculation_hits_total', help_text='Final transcripts served by a speculative reply.')
+        return spec['key']
+    metrics.counter_inc('speculation_misses_total', help_text='Speculative replies discarded.')
+    _discard(spec)
+    return None
+
+
+def follow(key, fallback=None):
+    """Buffered and live chunks of a claimed speculation; closing it stops the producer.
+
+    If the speculation fails before any text, fallback() (a live reply) is streamed
+    instead; after some text, RuntimeError is raised.
+    """
+    produced = False
+    error = None
+    try:
+        if key in MESSAGE_CHUNKS:
+            for chunk in iter_message_chunks(key):
+                produced = True
+                yield chunk
+        else:
+            # dropped before we started reading
+            error = RuntimeError('speculative reply is gone')
+    finally:
+        error = _ERRORS.pop(key, None) or error
+        if not cancel_message(key):
+            # producer already finished
+            MESSAGE_CHUNKS.pop(key, None)
+    if error is None:
+        return
+    metrics.counter_inc('speculation_failed_total', help_text='Claimed speculative replies whose generation failed.')
+    if produced or fallback is None:
+        raise RuntimeError('speculative reply failed') from error
+    yield from fallback()
+
+
+def _hit_rate():
+    hits = metrics.counter_value('speculation_hits_total')
+    total = hits + metrics.counter_value('speculation_misses_total')
+    return round(hits / total, 4) if total else 0
+
+
+metrics.register_gauge('speculation_hit_rate', _hit_rate, 'Share of claimed speculations that were used.')
@@ -2,10 +2,9 @@ import os
 import tempfile
 from typing import Dict, Any
 from flask import Blueprint, request, jsonify, current_app
-from fishaudio import FishAudio
 
-# Create FishAudio client (same pattern as tts.py)
-client = FishAudio()
+import providers
+import tracing
 
 # Maximum allowed upload size in bytes (default 50 MB). Can be overridden via env var.
 MAX_UPLOAD_BYTES = int(os.environ.get("MAX_SST_UPLOAD_BYTES", 50 * 1024 * 1024))
@@ -20,7 +19,7 @@ def transcribe_bytes(audio_bytes: bytes) -> Dict[str, Any]:
     Returns a dict with keys: text (str) and duration_ms (int|None)
     """
     # The FishAudio demo uses client.asr.transcribe(audio=f.read())
-    result = client.asr.transcribe(audio=audio_bytes, language='en')
+    result = providers.fishaudio_client().asr.transcribe(audio=audio_bytes, language='en')
 
     print(str(result))
     # Some SDKs return `duration` in ms, adapt gracefully if available
@@ -91,9 +90,14 @@ def sst_endpoint():
     Usage examples:
     - multipart/form-data: form field name 'file'
     - raw POST body: POST /sst with content-type audio/mpeg or application/octet-stream
+
+    The response carries a `trace_id` (also accepted via X-Trace-Id) that the
+    client passes on to the message POST so the whole turn shares one trace.
     """
+    trace_id = tracing.continue_trace(request.headers.get("X-Trace-Id") or request.args.get("trace_id"))
     try:
-        tmp_path = save_request_to_tempfile(request)
+        with tracing.span(trace_id, 'upload'):
+            tmp_path = save_request_to_tempfile(request)
     except ValueError:
         return jsonify({"error": "upload too large"}), 413
     except Exception as e:
@@ -109,9 +113,10 @@ def sst_endpoint():
             mp3_path = mp3_tmp.name
             mp3_tmp.close()
             # Convert to mp3. If ffmpeg missing or conversion fails, raise.
-            subprocess.run([
-                "ffmpeg", "-y", "-i", tmp_path, "-vn", "-acodec", "libmp3lame", mp3_path
-            ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with tracing.span(trace_id, 'ffmpeg'):
+                subprocess.run([
+                    "ffmpeg", "-y", "-i", tmp_path, "-vn", "-acodec", "libmp3lame", mp3_path
+                ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
         except FileNotFoundError as e:
             current_app.logger.exception("ffmpeg not found")
             return jsonify({"error": "ffmpeg_not_found", "detail": "ffmpeg is required for SST and was not found on the server."}), 500
@@ -120,7 +125,9 @@ def sst_endpoint():
             return jsonify({"error": "ffmpeg_conversion_failed", "detail": str(e)}), 500
 
         # If conversion succeeded, transcribe the produced MP3 file
-        result = transcribe_file(mp3_path)
+        with tracing.span(trace_id, 'asr'):
+            result = transcribe_file(mp3_path)
+        result["trace_id"] = trace_id
         return jsonify(result)
     except Exception as e:
         current_app.logger.exception("STT transcription failed")
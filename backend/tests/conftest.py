@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# backend modules are imported flat (`import db`), as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    """db module pointed at an empty database in tmp_path (also the cwd)."""
+    import db
+    db.close_writer()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(db, 'DB_PATH', str(tmp_path / 'data.db'))
+    db.init_db()
+    yield db
+    db.close_writer()
+    with db._PENDING_LOCK:
+        db._PENDING.clear()
+
+
+@pytest.fixture
+def app_module(fresh_db, monkeypatch):
+    """main.py with a test DB; skipped where the web dependencies are not installed."""
+    for dep in ('flask', 'flask_socketio', 'flask_cors', 'dotenv'):
+        pytest.importorskip(dep)
+    monkeypatch.setenv('WS_SECRET_KEY', 'test')
+    monkeypatch.setenv('WARM_PROVIDERS', '0')
+    import main
+    return main
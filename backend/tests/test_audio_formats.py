@@ -0,0 +1,53 @@
+import pytest
+
+import audio_formats
+
+FIREFOX_MEDIA_ACCEPT = ('audio/webm,audio/ogg,audio/wav,audio/*;q=0.9,application/ogg;q=0.7,'
+                        'video/*;q=0.6,*/*;q=0.5')
+
+
+@pytest.fixture(autouse=True)
+def with_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio_formats, '_FFMPEG', '/usr/bin/ffmpeg')
+    monkeypatch.setattr(audio_formats, 'DEFAULT_FORMAT', 'mp3')
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, 'mp3'),
+    ('*/*', 'mp3'),
+    ('audio/mpeg, audio/webm;q=0.1', 'mp3'),
+    (FIREFOX_MEDIA_ACCEPT, 'mp3'),
+    ('audio/webm', 'opus_webm'),
+    ('audio/ogg;q=0.5, audio/webm;q=0.8', 'opus_webm'),
+    ('audio/mpeg;q=0, audio/ogg', 'opus_ogg'),
+    ('audio/mpeg;q=0, audio/*;q=0.5', 'opus_webm'),
+    ('audio/L16', 'pcm'),
+    ('audio/wav', 'mp3'),
+])
+def test_accept_negotiation(accept, expected):
+    assert audio_formats.negotiate(None, accept) == expected
+
+
+def test_explicit_format_wins_over_accept():
+    assert audio_formats.negotiate('Opus_Ogg', 'audio/mpeg') == 'opus_ogg'
+
+
+def test_unknown_explicit_format_is_rejected():
+    assert audio_formats.negotiate('flac', None) is None
+
+
+def test_falls_back_to_mp3_without_ffmpeg(monkeypatch):
+    monkeypatch.setattr(audio_formats, '_FFMPEG', None)
+    assert audio_formats.negotiate('opus_webm', None) == 'mp3'
+    assert audio_formats.negotiate(None, 'audio/webm') == 'mp3'
+
+
+def test_pcm_is_big_endian_as_audio_l16_requires():
+    mimetype, args = audio_formats.FORMATS['pcm']
+    assert mimetype.startswith('audio/L16')
+    assert 's16be' in args and 'pcm_s16be' in args
+
+
+def test_mp3_is_passed_through():
+    chunks = [b'a', b'b']
+    assert list(audio_formats.transcode(iter(chunks), 'mp3')) == chunks
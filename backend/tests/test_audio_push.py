@@ -0,0 +1,187 @@
+import threading
+import time
+import types
+
+import pytest
+
+import audio_push
+import metrics
+import tts
+from message_chunks import (MESSAGE_CHUNKS, get_or_create_message_tracker, add_chunk_to_message,
+                            mark_message_complete, cancel_message)
+
+SID = 'sid-1'
+
+
+class _FakeTTS:
+    """stream_websocket stand-in: one audio chunk per text piece."""
+
+    def stream_websocket(self, text_iter, reference_id=None, latency=None):
+        for piece in text_iter:
+            yield piece.encode()
+
+
+class _FakeSocketIO:
+    def __init__(self, on_emit=None):
+        self.events = []
+        self.ended = threading.Event()
+        self.on_emit = on_emit
+
+    def emit(self, name, data, to=None):
+        self.events.append((name, data))
+        if self.on_emit:
+            self.on_emit(name, data)
+        if name == 'tts_audio_end':
+            self.ended.set()
+
+    def audio(self):
+        return [data['data'] for name, data in self.events if name == 'tts_audio']
+
+
+@pytest.fixture
+def message(monkeypatch):
+    monkeypatch.setattr(tts.providers, 'fishaudio_client', lambda: types.SimpleNamespace(tts=_FakeTTS()))
+
+    def make(*chunks, complete=True):
+        get_or_create_message_tracker('m1')
+        for chunk in chunks:
+            add_chunk_to_message('m1', chunk)
+        if complete:
+            mark_message_complete('m1')
+        return 'm1'
+    yield make
+    MESSAGE_CHUNKS.pop('m1', None)
+    assert audio_push._WINDOWS == {}
+
+
+def _push(sio, mid):
+    th = threading.Thread(target=audio_push.push_message_audio, args=(sio, SID, mid))
+    th.start()
+    return th
+
+
+def _wait(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def test_window_holds_back_frames_until_acked(message, monkeypatch):
+    monkeypatch.setattr(audio_push, 'AUDIO_PUSH_WINDOW_BYTES', 10)
+    mid = message('aaaa', 'bbbb', 'cccc', 'dddd', 'eeee')
+    sio = _FakeSocketIO()
+    th = _push(sio, mid)
+
+    # 4 + 4 bytes in flight is under the window, so a third frame goes out, then it waits
+    assert _wait(lambda: len(sio.audio()) == 3)
+    time.sleep(0.05)
+    assert len(sio.audio()) == 3
+    audio_push.ack(SID, mid, 2)
+    assert sio.ended.wait(5)
+    th.join(5)
+    assert sio.audio() == [b'aaaa', b'bbbb', b'cccc', b'dddd', b'eeee']
+    assert sio.events[-1] == ('tts_audio_end', {'message_id': mid, 'count': 5})
+
+
+def test_ack_beyond_what_was_sent_is_clamped(message, monkeypatch):
+    monkeypatch.setattr(audio_push, 'AUDIO_PUSH_WINDOW_BYTES', 10)
+    monkeypatch.setattr(audio_push, 'AUDIO_PUSH_ACK_TIMEOUT_S', 0.2)
+    mid = message('aaaa', 'bbbb', 'cccc', 'dddd', 'eeee', 'ffff', 'gggg')
+    sio = _FakeSocketIO()
+    th = _push(sio, mid)
+    assert _wait(lambda: len(sio.audio()) == 3)
+    # acking frames not sent yet only releases what is in flight now
+    audio_push.ack(SID, mid, 100)
+    assert sio.ended.wait(5)
+    th.join(5)
+    assert len(sio.audio()) == 6
+    assert sio.events[-1][1]['error'] == 'ack timeout'
+
+
+def test_client_that_stops_acking_times_out(message, monkeypatch):
+    monkeypatch.setattr(audio_push, 'AUDIO_PUSH_WINDOW_BYTES', 4)
+    monkeypatch.setattr(audio_push, 'AUDIO_PUSH_ACK_TIMEOUT_S', 0.05)
+    before = metrics.counter_value('audio_push_stalls_total')
+    mid = message('aaaa', 'bbbb')
+    sio = _FakeSocketIO()
+    _push(sio, mid).join(5)
+    assert sio.events == [
+        ('tts_audio', {'message_id': mid, 'seq': 0, 'data': b'aaaa'}),
+        ('tts_audio_end', {'message_id': mid, 'count': 1, 'error': 'ack timeout'}),
+    ]
+    assert metrics.counter_value('audio_push_stalls_total') == before + 1
+
+
+def test_disconnect_ends_the_push_silently(message, monkeypatch):
+    monkeypatch.setattr(audio_push, 'AUDIO_PUSH_WINDOW_BYTES', 4)
+    mid = message('aaaa', 'bbbb')
+    sio = _FakeSocketIO()
+    th = _push(sio, mid)
+    assert _wait(lambda: len(sio.audio()) == 1)
+    audio_push.drop_client(SID)
+    th.join(5)
+    assert not th.is_alive()
+    # nobody is listening, so no tts_audio_end
+    assert [name for name, _ in sio.events] == ['tts_audio']
+
+
+def test_cancel_stops_pushing(message):
+    mid = message('aaaa', 'bbbb', 'cccc', complete=False)
+    sio = _FakeSocketIO(on_emit=lambda name, data: name == 'tts_audio' and cancel_message(mid))
+    _push(sio, mid).join(5)
+    assert sio.audio() == [b'aaaa']
+    assert sio.events[-1] == ('tts_audio_end', {'message_id': mid, 'count': 1})
+
+
+# --- socket.io wiring and the tts_stream fallback (needs flask) ---
+
+@pytest.fixture
+def api(app_module, monkeypatch):
+    main = app_module
+    started = []
+    monkeypatch.setattr(main.socketio, 'start_background_task', lambda fn, *a: started.append(fn))
+    monkeypatch.setattr(main.socketio, 'emit', lambda *a, **k: None)
+    monkeypatch.setattr(main, 'stream_haiku', lambda code, cid, **kw: iter(['Hi ', 'there.']))
+    monkeypatch.setattr(tts.providers, 'fishaudio_client', lambda: types.SimpleNamespace(tts=_FakeTTS()))
+    return main, started
+
+
+def _post(main, cid, **extra):
+    resp = main.app.test_client().post(f'/conversations/{cid}/messages',
+                                       json={'content': 'hello', 'sid': SID, **extra})
+    assert resp.status_code == 201
+    mid = resp.get_json()['assistant_message_id']
+    assert _wait(lambda: MESSAGE_CHUNKS.get(mid, {}).get('complete'))
+    return mid
+
+
+def test_push_is_started_only_when_requested(api, fresh_db):
+    main, started = api
+    cid = fresh_db.create_conversation('sys')
+    mid = _post(main, cid, push_audio=True)
+    assert started == [audio_push.push_message_audio]
+    MESSAGE_CHUNKS.pop(mid, None)
+
+
+def test_without_push_the_client_falls_back_to_tts_stream(api, fresh_db):
+    main, started = api
+    cid = fresh_db.create_conversation('sys')
+    mid = _post(main, cid)
+    assert started == []
+    resp = main.app.test_client().get(f'/conversations/{cid}/messages/{mid}/tts_stream?format=mp3')
+    assert resp.status_code == 200
+    assert resp.data == b'Hi there.'
+    MESSAGE_CHUNKS.pop(mid, None)
+
+
+def test_socket_ack_and_disconnect_reach_the_window(app_module, monkeypatch):
+    main = app_module
+    calls = []
+    monkeypatch.setattr(audio_push, 'ack', lambda sid, mid, seq: calls.append(('ack', mid, seq)))
+    monkeypatch.setattr(audio_push, 'drop_client', lambda sid: calls.append(('drop',)))
+    client = main.socketio.test_client(main.app)
+    client.emit('tts_ack', {'message_id': 'm1', 'seq': 3})
+    client.emit('tts_ack', {'message_id': 'm1', 'seq': 'x'})
+    client.disconnect()
+    assert calls == [('ack', 'm1', 3), ('drop',)]
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from claude import build_msg_ctx
+from message_chunks import (MESSAGE_CHUNKS, get_or_create_message_tracker, add_chunk_to_message,
+                            mark_message_complete, iter_message_chunks, cancel_message, on_cancel)
+
+
+@pytest.fixture
+def message_id():
+    mid = 'test-cancel'
+    get_or_create_message_tracker(mid)
+    yield mid
+    MESSAGE_CHUNKS.pop(mid, None)
+
+
+def test_cancel_runs_callbacks_and_ends_readers(message_id):
+    calls = []
+    on_cancel(message_id, lambda: calls.append('llm'))
+    add_chunk_to_message(message_id, 'a')
+    reader = iter_message_chunks(message_id)
+    assert next(reader) == 'a'
+    assert cancel_message(message_id) is True
+    assert calls == ['llm']
+    assert list(reader) == []
+    # registered after the fact: runs right away
+    on_cancel(message_id, lambda: calls.append('tts'))
+    assert calls == ['llm', 'tts']
+
+
+def test_cancel_reports_untracked_and_completed_messages(message_id):
+    assert cancel_message('never-tracked') is None
+    mark_message_complete(message_id)
+    assert cancel_message(message_id) is False
+
+
+def test_empty_assistant_turns_are_not_sent_upstream():
+    history = [
+        {'role': 'user', 'content': 'hi'},
+        {'role': 'assistant', 'content': ''},
+        {'role': 'user', 'content': 'are you there?'},
+        {'role': 'assistant', 'content': 'yes'},
+    ]
+    assert build_msg_ctx(history) == [
+        {'role': 'user', 'content': 'hi'},
+        {'role': 'user', 'content': 'are you there?'},
+        {'role': 'assistant', 'content': 'yes'},
+    ]
+
+
+# --- barge-in through the HTTP API (needs flask) ---
+
+class _FakeStream:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+@pytest.fixture
+def api(app_module, monkeypatch):
+    main = app_module
+    finished = threading.Event()
+    real_complete = main.mark_message_complete
+
+    def complete(mid):
+        real_complete(mid)
+        finished.set()
+
+    monkeypatch.setattr(main, 'mark_message_complete', complete)
+    monkeypatch.setattr(main.socketio, 'emit', lambda *a, **k: None)
+    return main, main.app.test_client(), finished
+
+
+def _replying(*chunks):
+    def stream_haiku(code, conversation_id, trace_id=None, on_open=None, **kwargs):
+        stream = _FakeStream()
+        on_open(stream)
+        yield from chunks
+        # an upstream read fails once the stream is closed by the barge-in
+        stream.closed.wait(5)
+        raise IOError('stream closed')
+    return stream_haiku
+
+
+def _post(client, cid):
+    resp = client.post(f'/conversations/{cid}/messages', json={'content': 'question', 'sid': 'sid-1'})
+    assert resp.status_code == 201
+    return resp.get_json()['assistant_message_id']
+
+
+def test_barge_in_persists_partial_reply_as_truncated(api, fresh_db, monkeypatch):
+    main, client, finished = api
+    monkeypatch.setattr(main, 'stream_haiku', _replying('partial ', 'answer'))
+    cid = fresh_db.create_conversation('sys')
+    mid = _post(client, cid)
+    tracker = MESSAGE_CHUNKS[mid]
+    with tracker['condition']:
+        assert tracker['condition'].wait_for(lambda: len(tracker['chunks']) == 2, timeout=5)
+
+    assert client.post(f'/conversations/{cid}/messages/{mid}/cancel').status_code == 200
+    assert finished.wait(5)
+    fresh_db.flush_writes(5)
+    reply = next(m for m in fresh_db.get_messages(cid) if m['id'] == mid)
+    assert reply['content'] == 'partial answer'
+    assert reply['metadata'] == {'truncated': True}
+    MESSAGE_CHUNKS.pop(mid, None)
+
+
+def test_barge_in_before_first_token_stores_nothing(api, fresh_db, monkeypatch):
+    main, client, finished = api
+    monkeypatch.setattr(main, 'stream_haiku', _replying())
+    cid = fresh_db.create_conversation('sys')
+    mid = _post(client, cid)
+
+    assert client.post(f'/conversations/{cid}/messages/{mid}/cancel').status_code == 200
+    assert finished.wait(5)
+    fresh_db.flush_writes(5)
+    assert [m['role'] for m in fresh_db.get_messages(cid)] == ['user']
+    MESSAGE_CHUNKS.pop(mid, None)
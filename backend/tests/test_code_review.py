@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+pytest.importorskip('flask')
+
+from flask import Flask  # noqa: E402
+
+import code_review  # noqa: E402
+
+
+@pytest.fixture
+def client(fresh_db, monkeypatch):
+    calls = []
+
+    def review(conversation_id, files, language, extra):
+        (name, source), = files.items()
+        calls.append(name)
+        yield f'review of {name}: '
+        yield f'{len(source)} chars'
+
+    monkeypatch.setattr(code_review, 'stream_static_code_review', review)
+    monkeypatch.setattr(code_review, '_RESULTS', code_review.OrderedDict())
+    app = Flask(__name__)
+    app.register_blueprint(code_review.review_bp)
+    cid = fresh_db.create_conversation('sys')
+    return app.test_client(), cid, calls
+
+
+def _events(resp):
+    return [json.loads(line) for line in resp.data.decode().splitlines()]
+
+
+def test_unchanged_files_are_served_from_memo(client):
+    http, cid, calls = client
+    url = f'/conversations/{cid}/code_review'
+    first = _events(http.post(url, json={'files': {'a.py': 'x = 1', 'b.py': 'y = 2'}}))
+    assert calls == ['a.py', 'b.py']
+    assert first[-1] == {'done': True}
+
+    second = _events(http.post(url, json={'files': {'a.py': 'x = 1', 'b.py': 'y = 3'}}))
+    assert calls == ['a.py', 'b.py', 'b.py']
+    assert {'file': 'a.py', 'cached': True} in second
+    assert {'text': 'review of a.py: 5 chars'} in second
+    assert {'file': 'b.py', 'cached': False} in second
+
+
+def test_memo_key_includes_language_and_instructions():
+    key = code_review.file_key('c', 'a.py', 'x = 1', 'python', None)
+    assert key == code_review.file_key('c', 'a.py', 'x = 1', 'python', '')
+    assert key != code_review.file_key('c', 'a.py', 'x = 1', 'java', None)
+    assert key != code_review.file_key('c', 'a.py', 'x = 1', 'python', 'be strict')
+    assert key != code_review.file_key('other', 'a.py', 'x = 1', 'python', None)
+
+
+@pytest.mark.parametrize('payload', [
+    {'files': {}},
+    {'files': {'a.py': 1}},
+    {'files': {'a.py': 'x'}, 'language': 3},
+    {'files': {'a.py': 'x'}, 'extra_instructions': {'be': 'strict'}},
+])
+def test_invalid_payloads_are_rejected(client, payload):
+    http, cid, calls = client
+    assert http.post(f'/conversations/{cid}/code_review', json=payload).status_code == 400
+    assert calls == []
+
+
+class _FullQueue(code_review.queue.Queue):
+    def put_nowait(self, item):
+        raise code_review.queue.Full
+
+
+def test_full_queue_answers_429(client, monkeypatch):
+    http, cid, calls = client
+    monkeypatch.setattr(code_review, '_JOBS', _FullQueue())
+    resp = http.post(f'/conversations/{cid}/code_review', json={'files': {'a.py': 'x'}})
+    assert resp.status_code == 429
+    assert resp.headers['Retry-After'] == '5'
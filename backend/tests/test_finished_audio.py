@@ -0,0 +1,124 @@
+import os
+
+import pytest
+
+import audio_store
+from message_chunks import MESSAGE_CHUNKS, get_or_create_message_tracker, add_chunk_to_message, mark_message_complete
+
+AUDIO = b'0123456789'
+
+
+def test_tee_keeps_file_only_for_a_complete_stream(tmp_path):
+    path = str(tmp_path / 'c' / 'm-mp3-abc')
+    assert list(audio_store.tee_to_file(iter([b'ab', b'cd']), path)) == [b'ab', b'cd']
+    assert audio_store.materialized(path)
+    with open(path, 'rb') as f:
+        assert f.read() == b'abcd'
+
+
+def test_abandoned_or_failed_stream_leaves_nothing(tmp_path):
+    path = str(tmp_path / 'c' / 'm-mp3-abc')
+    gen = audio_store.tee_to_file(iter([b'ab', b'cd']), path)
+    next(gen)
+    gen.close()
+
+    def failing():
+        yield b'ab'
+        raise RuntimeError('synthesis failed')
+
+    with pytest.raises(RuntimeError):
+        list(audio_store.tee_to_file(failing(), path))
+    assert not audio_store.materialized(path)
+    assert os.listdir(tmp_path / 'c') == []
+
+
+def test_digest_covers_voice_format_and_text():
+    base = audio_store.audio_digest('hello', 'voice', 'mp3')
+    assert base == audio_store.audio_digest('hello', 'voice', 'mp3')
+    assert base != audio_store.audio_digest('hello!', 'voice', 'mp3')
+    assert base != audio_store.audio_digest('hello', 'other', 'mp3')
+    assert base != audio_store.audio_digest('hello', 'voice', 'opus_ogg')
+
+
+# --- HTTP behaviour (needs flask) ---
+
+@pytest.fixture
+def reply(app_module, fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    mid = db.insert_message(cid, 'assistant', 'hello there')
+    digest = audio_store.audio_digest('hello there', app_module.MODEL_ID, 'mp3')
+    path = audio_store.audio_path(cid, mid, 'mp3', digest)
+    yield cid, mid, digest, path
+    MESSAGE_CHUNKS.pop(mid, None)
+
+
+def _url(cid, mid):
+    return f'/conversations/{cid}/messages/{mid}/tts_stream?format=mp3'
+
+
+def _materialize(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(AUDIO)
+
+
+def test_stored_audio_supports_etag_and_range(app_module, reply):
+    cid, mid, digest, path = reply
+    _materialize(path)
+    client = app_module.app.test_client()
+
+    resp = client.get(_url(cid, mid))
+    assert resp.status_code == 200
+    assert resp.data == AUDIO
+    assert resp.headers['ETag'] == f'"{digest}"'
+
+    resp = client.get(_url(cid, mid), headers={'Range': 'bytes=2-5'})
+    assert resp.status_code == 206
+    assert resp.data == b'2345'
+
+    resp = client.get(_url(cid, mid), headers={'If-None-Match': f'"{digest}"'})
+    assert resp.status_code == 304
+
+
+def test_live_synthesis_has_no_etag_and_ignores_if_none_match(app_module, reply, monkeypatch):
+    cid, mid, digest, path = reply
+    monkeypatch.setattr(app_module, 'synthesize_complete', lambda text, **kw: iter([b'live']))
+    client = app_module.app.test_client()
+
+    resp = client.get(_url(cid, mid), headers={'If-None-Match': f'"{digest}"'})
+    assert resp.status_code == 200
+    assert resp.data == b'live'
+    assert 'ETag' not in resp.headers
+    # the live stream was kept, so the next request is served from the file
+    assert audio_store.materialized(path)
+
+
+def test_reply_finished_on_this_worker_uses_the_stored_file(app_module, reply):
+    cid, mid, digest, path = reply
+    get_or_create_message_tracker(mid)
+    add_chunk_to_message(mid, 'hello ')
+    add_chunk_to_message(mid, 'there')
+    mark_message_complete(mid)
+    _materialize(path)
+    client = app_module.app.test_client()
+
+    resp = client.get(_url(cid, mid), headers={'Range': 'bytes=0-3'})
+    assert resp.status_code == 206
+    assert resp.data == b'0123'
+    assert resp.headers['ETag'] == f'"{digest}"'
+
+
+def test_tracked_reply_is_not_served_under_another_conversation(app_module, reply, fresh_db, monkeypatch):
+    cid, mid, digest, path = reply
+    other = fresh_db.create_conversation('sys')
+    get_or_create_message_tracker(mid)
+    add_chunk_to_message(mid, 'hello there')
+    mark_message_complete(mid)
+    synthesized = []
+    monkeypatch.setattr(app_module, 'synthesize_complete', lambda text, **kw: synthesized.append(text) or iter([b'x']))
+    client = app_module.app.test_client()
+
+    assert client.get(_url(other, mid)).status_code == 404
+    assert synthesized == []
+    assert not os.path.exists(os.path.join(audio_store.AUDIO_DIR, other))
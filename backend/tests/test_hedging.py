@@ -0,0 +1,176 @@
+import time
+import types
+import threading
+from contextlib import contextmanager
+
+import pytest
+
+import hedging
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def hedge_state(monkeypatch):
+    monkeypatch.setattr(hedging, '_SAMPLES', hedging.deque(maxlen=500))
+    monkeypatch.setattr(hedging, '_credit', 1.0)
+    monkeypatch.setattr(hedging, 'MIN_SAMPLES', 5)
+    monkeypatch.setattr(hedging, 'MIN_DEADLINE_MS', 10)
+    monkeypatch.setattr(hedging, 'DEFAULT_DEADLINE_MS', 50)
+
+
+class _Stream:
+    def __init__(self, delay, chunks):
+        self.delay = delay
+        self.chunks = chunks
+        self.closed = threading.Event()
+
+    @property
+    def text_stream(self):
+        if self.closed.wait(self.delay):
+            return
+        yield from self.chunks
+
+    def close(self):
+        self.closed.set()
+
+
+def _opener(*delays):
+    """open_stream() whose n-th call answers after delays[n] seconds with ['<n>:a', '<n>:b']."""
+    streams = []
+
+    @contextmanager
+    def open_stream():
+        n = len(streams)
+        stream = _Stream(delays[n], [f'{n}:a', f'{n}:b'])
+        streams.append(stream)
+        yield stream
+
+    return open_stream, streams
+
+
+def test_deadline_uses_default_until_enough_samples():
+    assert hedging.deadline() == pytest.approx(0.05)
+    for s in (0.1, 0.2, 0.3, 0.4, 1.0):
+        hedging.observe_first_token(s)
+    # p95 of five samples is the largest
+    assert hedging.deadline() == pytest.approx(1.0)
+
+
+def test_deadline_has_a_floor():
+    for _ in range(10):
+        hedging.observe_first_token(0.001)
+    assert hedging.deadline() == pytest.approx(0.01)
+
+
+def test_budget_allows_bursts_then_refills_at_max_rate(monkeypatch):
+    monkeypatch.setattr(hedging, 'MAX_RATE', 0.25)
+    monkeypatch.setattr(hedging, 'BURST', 2)
+    monkeypatch.setattr(hedging, '_credit', 0.0)
+    granted = []
+    for _ in range(40):
+        hedging._earn()
+        granted.append(hedging._spend())
+    # one hedge per 1 / MAX_RATE requests
+    assert sum(granted) == 10
+
+
+def test_fast_first_attempt_is_not_hedged():
+    open_stream, streams = _opener(0.0, 0.0)
+    assert list(hedging.hedged_text(open_stream)) == ['0:a', '0:b']
+    assert len(streams) == 1
+
+
+def test_late_first_token_starts_a_hedge_that_wins():
+    before = metrics.counter_value('llm_hedge_wins_total')
+    open_stream, streams = _opener(2.0, 0.0)
+    start = time.monotonic()
+    assert list(hedging.hedged_text(open_stream)) == ['1:a', '1:b']
+    assert time.monotonic() - start < 1.0
+    assert len(streams) == 2
+    # the losing attempt is closed (aborted upstream)
+    assert streams[0].closed.wait(1)
+    assert metrics.counter_value('llm_hedge_wins_total') == before + 1
+
+
+def test_no_hedge_without_budget(monkeypatch):
+    monkeypatch.setattr(hedging, '_credit', 0.0)
+    monkeypatch.setattr(hedging, 'MAX_RATE', 0.0)
+    open_stream, streams = _opener(0.2, 0.0)
+    assert list(hedging.hedged_text(open_stream)) == ['0:a', '0:b']
+    assert len(streams) == 1
+
+
+def test_error_is_raised_only_when_every_attempt_failed():
+    @contextmanager
+    def failing():
+        raise IOError('upstream down')
+        yield
+
+    with pytest.raises(IOError):
+        list(hedging.hedged_text(failing))
+
+
+def test_closing_the_group_aborts_attempts_and_raises():
+    groups = []
+    open_stream, streams = _opener(5.0)
+    gen = hedging.hedged_text(open_stream, on_open=groups.append)
+    errors = []
+
+    def consume():
+        try:
+            list(gen)
+        except hedging.StreamCancelled as e:
+            errors.append(e)
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    time.sleep(0.02)
+    groups[0].close()
+    consumer.join(2)
+    assert not consumer.is_alive()
+    assert streams[0].closed.is_set()
+    # a barge-in must not look like a finished reply
+    assert len(errors) == 1
+
+
+class _PartialStream:
+    """Sends one chunk, then blocks until closed."""
+
+    def __init__(self):
+        self.closed = threading.Event()
+
+    @property
+    def text_stream(self):
+        yield 'partial'
+        self.closed.wait(5)
+
+    def close(self):
+        self.closed.set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_cancelled_hedged_reply_is_not_cached(monkeypatch):
+    import claude
+    import llm_cache
+    import providers
+
+    monkeypatch.setattr(hedging, 'ENABLED', True)
+    monkeypatch.setattr(llm_cache, 'ENABLED', True)
+    monkeypatch.setattr(claude, 'build_trimmed_history', lambda cid: ('sys', [{'role': 'user', 'content': 'q'}]))
+    client = types.SimpleNamespace(messages=types.SimpleNamespace(stream=lambda **kw: _PartialStream()))
+    monkeypatch.setattr(providers, 'anthropic_client', lambda: client)
+    llm_cache.clear()
+
+    groups = []
+    gen = claude.stream_haiku(None, 'c1', on_open=groups.append)
+    assert next(gen) == 'partial'
+    groups[0].close()
+    with pytest.raises(hedging.StreamCancelled):
+        next(gen)
+    assert llm_cache._ENTRIES == {}
+    llm_cache.clear()
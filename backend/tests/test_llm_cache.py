@@ -0,0 +1,55 @@
+import time
+import types
+
+import pytest
+
+import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    llm_cache.clear()
+    yield
+    llm_cache.clear()
+
+
+def test_request_key_is_canonical():
+    a = llm_cache.request_key(model='m', messages=[{'role': 'user', 'content': 'hi'}], temperature=0)
+    b = llm_cache.request_key(temperature=0, messages=[{'content': 'hi', 'role': 'user'}], model='m')
+    assert a == b
+    assert a != llm_cache.request_key(model='m', messages=[{'role': 'user', 'content': 'hi!'}], temperature=0)
+
+
+def test_put_get_and_ttl(monkeypatch):
+    llm_cache.put('k', [(0.0, 'a'), (0.1, 'b')])
+    assert llm_cache.get('k') == [(0.0, 'a'), (0.1, 'b')]
+    monkeypatch.setattr(llm_cache, 'TTL_S', -1)
+    assert llm_cache.get('k') is None
+    assert llm_cache._BYTES == 0
+
+
+def test_lru_eviction_by_entries_and_bytes(monkeypatch):
+    monkeypatch.setattr(llm_cache, 'MAX_ENTRIES', 2)
+    llm_cache.put('a', [(0.0, 'x')])
+    llm_cache.put('b', [(0.0, 'x')])
+    llm_cache.get('a')
+    llm_cache.put('c', [(0.0, 'x')])
+    assert llm_cache.get('b') is None
+    assert llm_cache.get('a') is not None
+
+    monkeypatch.setattr(llm_cache, 'MAX_BYTES', 5)
+    llm_cache.put('big', [(0.0, 'toolarge')])
+    assert llm_cache.get('big') is None
+    llm_cache.put('d', [(0.0, 'xxx')])
+    assert llm_cache._BYTES <= 5
+
+
+@pytest.mark.parametrize('speed, expected', [(1.0, [0.2, 0.4]), (2.0, [0.1, 0.2]), (0.0, [])])
+def test_replay_speed_divides_recorded_gaps(monkeypatch, speed, expected):
+    sleeps = []
+    monkeypatch.setattr(llm_cache, 'time', types.SimpleNamespace(sleep=sleeps.append, time=time.time))
+    monkeypatch.setattr(llm_cache, 'REPLAY_SPEED', speed)
+    chunks = [(0.5, 'a'), (0.2, 'b'), (0.4, 'c')]
+    assert list(llm_cache.replay(chunks)) == ['a', 'b', 'c']
+    # the first chunk goes out immediately whatever its recorded gap
+    assert sleeps == pytest.approx(expected)
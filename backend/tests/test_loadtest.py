@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+for _dep in ('flask', 'flask_socketio', 'flask_cors', 'dotenv', 'requests', 'socketio'):
+    pytest.importorskip(_dep)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_two_turns_against_fake_backends(tmp_path):
+    # one pooled requests.Session carries both turns, so a response that closes
+    # the connection behind the client's back shows up as a turn error
+    report_path = tmp_path / 'report.json'
+    subprocess.run(
+        [sys.executable, '-m', 'perf.loadtest', '--candidates', '1', '--turns', '2', '--no-sst',
+         '--timeout', '20', '--jitter', '0', '--llm-first-token-ms', '20', '--llm-token-rate', '500',
+         '--llm-reply-tokens', '10', '--tts-first-audio-ms', '10', '--tts-chunk-ms', '5',
+         '--json', str(report_path)],
+        cwd=BACKEND_DIR, check=True, timeout=120,
+    )
+    report = json.loads(report_path.read_text())
+    assert report['errors'] == {}
+    assert report['completed_turns'] == 2
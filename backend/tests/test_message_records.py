@@ -0,0 +1,101 @@
+import json
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def conversation(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys', metadata={'problem': 'two-sum'})
+    ids = [
+        db.insert_message(cid, 'user', 'hi', metadata={'k': 1, 'nested': {'a': [1, 2]}}),
+        db.insert_message(cid, 'assistant', 'hello'),
+        db.insert_message(cid, 'memory', 'summary'),
+    ]
+    return db, cid, ids
+
+
+def test_full_record_reads_like_the_old_dict(conversation):
+    db, cid, ids = conversation
+    m = db.get_messages(cid)[0]
+    assert set(m.keys()) == set(db.Message.FIELDS)
+    assert m['id'] == m.id == ids[0]
+    assert m['metadata'] == {'k': 1, 'nested': {'a': [1, 2]}}
+    assert dict(m) == m.to_dict()
+    assert 'summarized_by' not in m
+    with pytest.raises(KeyError):
+        m['summarized_by']
+
+
+def test_metadata_is_decoded_lazily(conversation):
+    db, cid, _ = conversation
+    m = db.get_messages(cid)[0]
+    assert not hasattr(m, '_metadata')
+    assert m.metadata['k'] == 1
+    assert m.metadata is m.metadata
+
+
+def test_to_json_matches_to_dict_with_raw_or_decoded_metadata(conversation):
+    db, cid, _ = conversation
+    for m in db.get_messages(cid):
+        assert json.loads(m.to_json()) == m.to_dict()
+    m = db.get_messages(cid)[0]
+    m.metadata['k'] = 2
+    assert json.loads(m.to_json())['metadata']['k'] == 2
+
+
+def test_empty_stored_metadata_is_an_empty_object(conversation):
+    db, cid, ids = conversation
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("UPDATE messages SET metadata = NULL WHERE id = ?", (ids[1],))
+    conn.commit()
+    conn.close()
+    m = next(m for m in db.get_messages(cid) if m['id'] == ids[1])
+    assert json.loads(m.to_json())['metadata'] == {}
+    assert m.metadata == {}
+
+
+def test_projection_loads_only_requested_columns(conversation):
+    db, cid, ids = conversation
+    msgs = db.get_messages(cid, columns=('content',))
+    assert [m['content'] for m in msgs] == ['hi', 'hello', 'summary']
+    m = msgs[0]
+    assert m.keys() == ['id', 'content', 'created_at']
+    assert m.get('role') is None
+    assert 'metadata' not in m
+    assert json.loads(m.to_json()) == {'id': ids[0], 'content': 'hi', 'created_at': m['created_at']}
+
+
+def test_projection_on_the_other_readers(conversation):
+    db, cid, _ = conversation
+    recent = db.get_recent_messages(cid, 1000, columns=('role', 'content'))
+    assert [(m['role'], m['content']) for m in recent] == [('user', 'hi'), ('assistant', 'hello')]
+    assert 'tokens_est' not in recent[0]
+    memory = db.get_memory_messages(cid, columns=('content',))
+    assert [m.to_dict()['content'] for m in memory] == ['summary']
+    assert [m['content'] for m in db.iter_messages(cid, batch_size=2, columns=('content',))] == ['hi', 'hello', 'summary']
+
+
+def test_queued_messages_are_records_too(conversation):
+    db, cid, _ = conversation
+    mid = db.enqueue_message(cid, 'user', 'queued', metadata={'q': True})
+    m = db.get_messages(cid, columns=('content',))[-1]
+    assert isinstance(m, db.Message)
+    assert (m['id'], m['content'], m.metadata) == (mid, 'queued', {'q': True})
+    assert json.loads(m.to_json())['metadata'] == {'q': True}
+
+
+def test_unknown_columns_are_rejected(conversation):
+    db, cid, _ = conversation
+    with pytest.raises(ValueError):
+        db.get_messages(cid, columns=('content; DROP TABLE messages',))
+    with pytest.raises(ValueError):
+        db.get_conversation(cid, columns=('nope',))
+
+
+def test_conversation_projection(conversation):
+    db, cid, _ = conversation
+    assert db.get_conversation(cid, columns=('system_message',)) == {'system_message': 'sys'}
+    assert db.get_conversation(cid, columns=('metadata',)) == {'metadata': {'problem': 'two-sum'}}
+    assert db.get_conversation('missing', columns=('id',)) is None
@@ -0,0 +1,50 @@
+import pytest
+
+
+def _page_through(db, cid, limit):
+    seen, after = [], None
+    while True:
+        page = db.get_messages(cid, limit=limit, after=after)
+        seen += [m['id'] for m in page]
+        if len(page) < limit:
+            return seen
+        after = db.decode_cursor(db.encode_cursor(page[-1]))
+
+
+def test_pages_never_skip_or_repeat_rows_sharing_a_timestamp(fresh_db, monkeypatch):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    monkeypatch.setattr(db, 'now_iso', lambda: '2025-01-01T00:00:00+00:00Z')
+    ids = [db.insert_message(cid, 'user', f'm{i}') for i in range(10)]
+    assert _page_through(db, cid, 3) == sorted(ids)
+
+
+def test_pages_include_queued_messages_once(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    stored = [db.insert_message(cid, 'user', f'm{i}') for i in range(4)]
+    queued = [db.enqueue_message(cid, 'user', f'q{i}') for i in range(3)]
+    assert _page_through(db, cid, 2) == stored + queued
+    db.flush_writes(5)
+    assert _page_through(db, cid, 2) == stored + queued
+
+
+def test_iter_messages_streams_every_message_in_order(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    ids = [db.insert_message(cid, 'user', f'm{i}') for i in range(7)]
+    assert [m['id'] for m in db.iter_messages(cid, batch_size=3)] == ids
+    assert [m['id'] for m in db.iter_messages(cid, batch_size=7)] == ids
+
+
+def test_cursor_round_trip_keeps_pipes_in_timestamp():
+    import db
+    msg = {'created_at': '2025|01', 'id': 'abc'}
+    assert db.decode_cursor(db.encode_cursor(msg)) == ('2025|01', 'abc')
+
+
+@pytest.mark.parametrize('cursor', ['', 'no-separator', '|id-only', 'ts-only|'])
+def test_malformed_cursor_is_rejected(cursor):
+    import db
+    with pytest.raises(ValueError):
+        db.decode_cursor(cursor)
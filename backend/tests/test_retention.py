@@ -0,0 +1,102 @@
+import gzip
+import json
+import sqlite3
+from datetime import datetime, timedelta, UTC
+
+import pytest
+
+
+@pytest.fixture
+def retention(fresh_db, tmp_path, monkeypatch):
+    import retention
+    import audio_store
+    monkeypatch.setattr(retention, 'ARCHIVE_DIR', str(tmp_path / 'archive'))
+    monkeypatch.setattr(retention, 'RETENTION_LOCK_PATH', str(tmp_path / 'retention.lock'))
+    monkeypatch.setattr(audio_store, 'AUDIO_DIR', str(tmp_path / 'audio'))
+    return retention
+
+
+def _age(db, conversation_id, days):
+    stamp = (datetime.now(UTC) - timedelta(days=days)).isoformat()
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute('UPDATE conversations SET updated_at = ? WHERE id = ?', (stamp, conversation_id))
+    conn.commit()
+    conn.close()
+
+
+def _archived(retention, conversation_id):
+    with gzip.open(retention.archive_path(conversation_id), 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_idle_conversations_are_archived_and_deleted(fresh_db, retention, tmp_path):
+    db = fresh_db
+    idle = db.create_conversation('sys')
+    db.insert_message(idle, 'user', 'old question', metadata={'k': 1})
+    _age(db, idle, 60)
+    active = db.create_conversation('sys')
+    (tmp_path / 'audio' / idle).mkdir(parents=True)
+
+    report = retention.run_retention(max_age_days=30)
+
+    assert (report['archived'], report['deleted']) == (1, 1)
+    assert db.get_conversation(idle) is None
+    assert db.get_conversation(active) is not None
+    lines = _archived(retention, idle)
+    assert lines[0]['conversation']['id'] == idle
+    assert [(m['content'], m['metadata']) for m in lines[1:]] == [('old question', {'k': 1})]
+    assert not (tmp_path / 'audio' / idle).exists()
+
+
+def test_conversation_written_after_archiving_is_kept(fresh_db, retention, tmp_path, monkeypatch):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    _age(db, cid, 60)
+    (tmp_path / 'audio' / cid).mkdir(parents=True)
+    real_archive = retention.archive_conversation
+
+    def archive_then_write(conversation_id):
+        path = real_archive(conversation_id)
+        # a reply lands between the archive and the delete
+        db.enqueue_message(conversation_id, 'assistant', 'late reply')
+        return path
+
+    monkeypatch.setattr(retention, 'archive_conversation', archive_then_write)
+    report = retention.run_retention(max_age_days=30)
+
+    assert report['deleted'] == 0
+    assert [m['content'] for m in db.get_messages(cid)] == ['late reply']
+    assert (tmp_path / 'audio' / cid).exists()
+
+
+def test_delete_conversations_returns_only_deleted_ids(fresh_db):
+    db = fresh_db
+    stale = db.create_conversation('sys')
+    fresh = db.create_conversation('sys')
+    _age(db, stale, 60)
+    cutoff = (datetime.now(UTC) - timedelta(days=30)).isoformat()
+    assert db.delete_conversations([stale, fresh, 'missing'], updated_before=cutoff) == [stale]
+    assert db.get_conversation(fresh) is not None
+    assert db.delete_conversations([fresh]) == [fresh]
+
+
+def test_dry_run_changes_nothing(fresh_db, retention):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    _age(db, cid, 60)
+    report = retention.run_retention(max_age_days=30, dry_run=True)
+    assert report['would_archive'] == 1
+    assert db.get_conversation(cid) is not None
+
+
+def test_only_one_process_holds_the_retention_lock(retention):
+    first = retention._acquire_leader_lock()
+    try:
+        assert first is not None
+        # flock locks are per open file description, so a second open stands in for another worker
+        assert retention._acquire_leader_lock() is None
+    finally:
+        first.close()
+    second = retention._acquire_leader_lock()
+    assert second is not None
+    second.close()
@@ -0,0 +1,87 @@
+import json
+import sqlite3
+
+# schema as created before running totals, summarized_by and PRAGMA user_version
+_OLD_SCHEMA = '''
+CREATE TABLE conversations (
+    id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    user_id TEXT,
+    system_message TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'active',
+    metadata TEXT,
+    last_summary_message_id TEXT
+);
+CREATE INDEX idx_conversations_created_at ON conversations(created_at);
+CREATE INDEX idx_conversations_user_id ON conversations(user_id);
+CREATE TABLE messages (
+    id TEXT PRIMARY KEY,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens_est INTEGER,
+    created_at TEXT NOT NULL,
+    metadata TEXT
+);
+CREATE INDEX idx_messages_conv_created_at ON messages(conversation_id, created_at);
+'''
+
+
+def _old_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(_OLD_SCHEMA)
+    conn.execute("INSERT INTO conversations (id, created_at, updated_at, system_message, metadata, last_summary_message_id) "
+                 "VALUES ('c1', '2025-01-01', '2025-01-02', 'sys', '{}', 'mem1')")
+    rows = [
+        ('m1', 'user', 'hi', 3, '2025-01-01T00:00:01', json.dumps({'summarized': True})),
+        ('m2', 'assistant', 'hello', 5, '2025-01-01T00:00:02', '{}'),
+        ('mem1', 'memory', 'summary', 2, '2025-01-01T00:00:03', '{}'),
+    ]
+    conn.executemany("INSERT INTO messages (id, conversation_id, role, content, tokens_est, created_at, metadata) "
+                     "VALUES (?, 'c1', ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_old_database_is_migrated_and_backfilled(tmp_path, monkeypatch):
+    import db
+    path = str(tmp_path / 'old.db')
+    _old_db(path)
+    monkeypatch.setattr(db, 'DB_PATH', path)
+    db.init_db()
+
+    conn = sqlite3.connect(path)
+    try:
+        assert conn.execute('PRAGMA user_version').fetchone()[0] == db.SCHEMA_VERSION
+        assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert 'idx_messages_conv_created_id' in indexes
+        assert 'idx_messages_conv_created_at' not in indexes
+        summarized = dict(conn.execute('SELECT id, summarized_by FROM messages'))
+        assert summarized == {'m1': 'mem1', 'm2': None, 'mem1': None}
+    finally:
+        conn.close()
+
+    conv = db.get_conversation('c1')
+    assert (conv['token_total'], conv['message_count'], conv['last_message_id']) == (10, 3, 'mem1')
+
+
+def test_current_database_is_recognised_by_user_version(tmp_path, monkeypatch):
+    import db
+    path = str(tmp_path / 'new.db')
+    monkeypatch.setattr(db, 'DB_PATH', path)
+    db.init_db()
+    conn = sqlite3.connect(path)
+    conn.execute('DROP INDEX idx_messages_unsummarized')
+    conn.commit()
+    conn.close()
+
+    # up to date: init_db stops after reading user_version and recreates nothing
+    db.init_db()
+    conn = sqlite3.connect(path)
+    try:
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    finally:
+        conn.close()
+    assert 'idx_messages_unsummarized' not in indexes
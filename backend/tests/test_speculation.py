@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+import speculation
+from message_chunks import MESSAGE_CHUNKS
+
+
+@pytest.mark.parametrize('partial, final', [
+    ('what is the time complexity', 'What is the time complexity?'),
+    ("i'd use a hash map", "I'd use a hash-map."),
+    ('so first i sort the array and then i scan it once', 'So first I sort the array and then I scan it once more'),
+])
+def test_matching_transcripts(partial, final):
+    assert speculation.matches(partial, final)
+
+
+@pytest.mark.parametrize('partial, final', [
+    ('i would use a hash map', 'i would not use a hash map, a heap is better here'),
+    ('', 'anything'),
+    ('yes', 'no'),
+])
+def test_mismatching_transcripts(partial, final):
+    assert not speculation.matches(partial, final)
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """Swap stream_haiku for a scripted reply: a list of chunks, where an
+    Exception item is raised at that point."""
+    script = []
+
+    def stream_haiku(code, conversation_id, trace_id=None, pending_user=None, on_open=None):
+        for item in script:
+            time.sleep(0.01)
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    monkeypatch.setattr(speculation, 'stream_haiku', stream_haiku)
+    monkeypatch.setattr(speculation, '_SPECS', {})
+    monkeypatch.setattr(speculation, '_ERRORS', {})
+    return script
+
+
+def _wait_gone(key):
+    deadline = time.monotonic() + 5
+    while key in MESSAGE_CHUNKS and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return key not in MESSAGE_CHUNKS
+
+
+def test_claimed_speculation_is_replayed(fake_llm):
+    fake_llm += ['Good ', 'question.']
+    key = speculation.start('c1', 'how would you start')
+    assert speculation.claim('c1', 'How would you start?') == key
+    assert ''.join(speculation.follow(key)) == 'Good question.'
+    assert _wait_gone(key)
+
+
+def test_mismatch_or_changed_code_discards(fake_llm):
+    fake_llm += ['reply']
+    key = speculation.start('c1', 'how would you start', code='x = 1')
+    assert speculation.claim('c1', 'how would you start', code='x = 2') is None
+    assert _wait_gone(key)
+    key = speculation.start('c1', 'how would you start')
+    assert speculation.claim('c1', 'something else entirely') is None
+    assert _wait_gone(key)
+
+
+def test_failure_before_any_text_falls_back_to_live_reply(fake_llm):
+    fake_llm += [IOError('upstream error')]
+    key = speculation.start('c1', 'hello')
+    assert speculation.claim('c1', 'hello') == key
+    assert list(speculation.follow(key, fallback=lambda: iter(['live reply']))) == ['live reply']
+    assert _wait_gone(key)
+
+
+def test_failure_after_some_text_raises(fake_llm):
+    fake_llm += ['partial', IOError('upstream error')]
+    key = speculation.start('c1', 'hello')
+    assert speculation.claim('c1', 'hello') == key
+    out = []
+    with pytest.raises(RuntimeError):
+        for chunk in speculation.follow(key, fallback=lambda: iter(['live reply'])):
+            out.append(chunk)
+    assert out == ['partial']
+    assert _wait_gone(key)
+
+
+def test_unclaimed_speculation_expires(fake_llm, monkeypatch):
+    fake_llm += ['reply']
+    monkeypatch.setattr(speculation, 'TTL_S', 0.1)
+    key = speculation.start('c1', 'hello')
+    assert _wait_gone(key)
+    assert speculation.claim('c1', 'hello') is None
+
+
+def test_newer_speculation_replaces_older(fake_llm):
+    fake_llm += ['reply']
+    first = speculation.start('c1', 'hel')
+    second = speculation.start('c1', 'hello')
+    assert _wait_gone(first)
+    assert speculation.claim('c1', 'hello') == second
+    list(speculation.follow(second))
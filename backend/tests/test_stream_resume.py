@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+from message_chunks import MESSAGE_CHUNKS, add_chunk_to_message, get_or_create_message_tracker, mark_message_complete
+
+
+@pytest.fixture
+def message():
+    def make(*chunks):
+        get_or_create_message_tracker('m1')
+        for chunk in chunks:
+            add_chunk_to_message('m1', chunk)
+        mark_message_complete('m1')
+        return 'm1'
+    yield make
+    MESSAGE_CHUNKS.pop('m1', None)
+
+
+def _events(resp):
+    events = []
+    for block in resp.data.decode().strip().split('\n\n'):
+        fields = {}
+        for line in block.split('\n'):
+            name, _, value = line.partition(': ')
+            fields[name] = fields[name] + '\n' + value if name in fields else value
+        events.append(fields)
+    return events
+
+
+def _stream(main, mid, last_event_id=None):
+    headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+    return _events(main.app.test_client().get(f'/conversations/c1/stream_text?message_id={mid}', headers=headers))
+
+
+def test_stream_text_resumes_after_last_event_id(app_module, message):
+    mid = message('a', 'b\nc', 'd')
+    full = _stream(app_module, mid)
+    assert [(e.get('id'), e.get('data')) for e in full[:-1]] == [('0', 'a'), ('1', 'b\nc'), ('2', 'd')]
+    assert full[-1] == {'event': 'done', 'id': '2', 'data': '3'}
+
+    resumed = _stream(app_module, mid, last_event_id=0)
+    assert [e['data'] for e in resumed[:-1]] == ['b\nc', 'd']
+    assert resumed[-1] == {'event': 'done', 'id': '2', 'data': '3'}
+
+
+def test_stream_text_resume_past_the_end_is_just_done(app_module, message):
+    mid = message('a', 'b')
+    assert _stream(app_module, mid, last_event_id=1) == [{'event': 'done', 'id': '1', 'data': '2'}]
+    # an id the client cannot have seen is clamped to the end of the message
+    assert _stream(app_module, mid, last_event_id=9) == [{'event': 'done', 'id': '1', 'data': '2'}]
+
+
+def test_stream_text_done_without_chunks_has_no_id(app_module, message):
+    mid = message()
+    assert _stream(app_module, mid) == [{'event': 'done', 'data': '0'}]
+
+
+def test_stream_text_rejects_bad_ids(app_module, message):
+    mid = message('a')
+    client = app_module.app.test_client()
+    assert client.get(f'/conversations/c1/stream_text?message_id={mid}',
+                      headers={'Last-Event-ID': 'x'}).status_code == 400
+    assert client.get('/conversations/c1/stream_text?message_id=nope').status_code == 404
+
+
+def _received(client, until, timeout=5):
+    events = []
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events += [(e['name'], e['args'][0]) for e in client.get_received()]
+        if any(name == until for name, _ in events):
+            break
+        time.sleep(0.01)
+    return events
+
+
+def test_socket_resume_replays_from_index(app_module, message):
+    mid = message('a', 'b', 'c')
+    client = app_module.socketio.test_client(app_module.app)
+    client.emit('resume', {'message_id': mid, 'from_index': 1})
+    assert _received(client, 'llm_done') == [
+        ('llm_chunk', {'message_id': mid, 'index': 1, 'text': 'b'}),
+        ('llm_chunk', {'message_id': mid, 'index': 2, 'text': 'c'}),
+        ('llm_done', {'message_id': mid, 'count': 3}),
+    ]
+    client.disconnect()
+
+
+def test_socket_resume_past_the_end_and_miss(app_module, message):
+    mid = message('a')
+    client = app_module.socketio.test_client(app_module.app)
+    client.emit('resume', {'message_id': mid, 'from_index': 5})
+    assert _received(client, 'llm_done') == [('llm_done', {'message_id': mid, 'count': 1})]
+    client.emit('resume', {'message_id': 'gone'})
+    assert _received(client, 'llm_resume_miss') == [('llm_resume_miss', {'message_id': 'gone'})]
+    client.disconnect()
@@ -0,0 +1,53 @@
+import sqlite3
+
+
+def test_mark_summarized_merges_metadata_and_sets_summarized_by(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    kept = db.insert_message(cid, 'user', 'hi', metadata={'k': 1, 'nested': {'a': [1, 2]}})
+    bare = db.insert_message(cid, 'assistant', 'hello')
+    other = db.insert_message(cid, 'user', 'later')
+    conn = sqlite3.connect(db.DB_PATH)
+    conn.execute("UPDATE messages SET metadata = '' WHERE id = ?", (bare,))
+    conn.commit()
+    conn.close()
+    summary = db.insert_message(cid, 'memory', 'summary')
+
+    db.mark_messages_summarized([kept, bare], summary)
+
+    by_id = {m['id']: m for m in db.get_messages(cid)}
+    assert by_id[kept]['metadata'] == {'k': 1, 'nested': {'a': [1, 2]}, 'summarized': True}
+    assert by_id[bare]['metadata'] == {'summarized': True}
+    assert by_id[other]['metadata'] == {}
+    assert [m['id'] for m in db.get_unsummarized_messages(cid)] == [other, summary]
+    assert db.get_conversation(cid)['last_summary_message_id'] == summary
+
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        rows = dict(conn.execute('SELECT id, summarized_by FROM messages'))
+    finally:
+        conn.close()
+    assert rows == {kept: summary, bare: summary, other: None, summary: None}
+
+
+def test_queued_messages_are_flushed_before_marking(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    mid = db.enqueue_message(cid, 'user', 'queued')
+    db.mark_messages_summarized([mid], 'mem')
+    assert db.get_unsummarized_messages(cid) == []
+
+
+def test_unsummarized_query_uses_the_partial_index(fresh_db):
+    db = fresh_db
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        sql, = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_messages_unsummarized'").fetchone()
+        assert 'WHERE summarized_by IS NULL' in sql
+        plan = ' '.join(r[-1] for r in conn.execute(
+            'EXPLAIN QUERY PLAN SELECT * FROM messages WHERE conversation_id = ? AND summarized_by IS NULL '
+            'ORDER BY created_at ASC, id ASC LIMIT ?', ('c1', 10)))
+    finally:
+        conn.close()
+    assert 'idx_messages_unsummarized' in plan
+    assert 'TEMP B-TREE' not in plan
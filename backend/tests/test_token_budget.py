@@ -0,0 +1,48 @@
+import pytest
+
+TEN = 'x' * 40  # tokens_est = len / 4
+
+
+@pytest.fixture
+def history(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    ids = [db.insert_message(cid, 'user', TEN) for _ in range(3)]
+    db.insert_message(cid, 'memory', TEN)
+    return db, cid, ids
+
+
+def _ids(db, cid, budget, **kw):
+    return [m['id'] for m in db.get_recent_messages(cid, budget, **kw)]
+
+
+def test_zero_budget_returns_nothing(history):
+    db, cid, _ = history
+    assert _ids(db, cid, 0) == []
+
+
+@pytest.mark.parametrize('budget, newest', [(9, 0), (10, 1), (19, 1), (20, 2), (30, 3), (1000, 3)])
+def test_budget_boundary_is_inclusive(history, budget, newest):
+    db, cid, ids = history
+    # memory messages never count against the budget
+    assert _ids(db, cid, budget) == ids[len(ids) - newest:]
+
+
+def test_max_messages_caps_the_window(history):
+    db, cid, ids = history
+    assert _ids(db, cid, 1000, max_messages=2) == ids[1:]
+
+
+def test_queued_messages_are_spent_first(history):
+    db, cid, ids = history
+    queued = db.enqueue_message(cid, 'user', TEN)
+    assert _ids(db, cid, 9) == []
+    assert _ids(db, cid, 10) == [queued]
+    assert _ids(db, cid, 20) == [ids[-1], queued]
+    assert _ids(db, cid, 1000, max_messages=1) == [queued]
+
+
+def test_running_totals_include_every_role(history):
+    db, cid, ids = history
+    conv = db.get_conversation(cid)
+    assert (conv['token_total'], conv['message_count']) == (40, 4)
@@ -0,0 +1,72 @@
+import time
+import types
+
+import pytest
+
+import tts
+import metrics
+import tracing
+
+
+class _FakeTTS:
+    """stream_websocket stand-in: echoes the text back as audio, later segments faster."""
+
+    def stream_websocket(self, text_iter, reference_id=None, latency=None):
+        text = ''.join(text_iter)
+        # make early segments the slowest so out-of-order completion is likely
+        time.sleep(max(0.0, 0.05 - len(text) / 10000))
+        yield f'<{text}>'.encode()
+
+
+@pytest.fixture
+def fake_provider(monkeypatch):
+    client = types.SimpleNamespace(tts=_FakeTTS())
+    monkeypatch.setattr(tts.providers, 'fishaudio_client', lambda: client)
+    monkeypatch.setattr(tts, 'FIRST_SEGMENT_CHARS', 20)
+    monkeypatch.setattr(tts, 'SEGMENT_CHARS', 40)
+    monkeypatch.setattr(tts, 'PARALLEL_WORKERS', 3)
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    spans, gauges = [], []
+    monkeypatch.setattr(tracing, 'record', lambda trace_id, name, *a, **k: spans.append(name))
+    # gauge_dec goes through gauge_inc with a negative amount
+    monkeypatch.setattr(metrics, 'gauge_inc', lambda name, amount=1, **k: gauges.append((name, amount)))
+    return spans, gauges
+
+
+TEXT = ' '.join(f'Sentence number {i} is here.' for i in range(8))
+
+
+def test_split_segments_keeps_text_and_starts_short(monkeypatch):
+    monkeypatch.setattr(tts, 'FIRST_SEGMENT_CHARS', 20)
+    monkeypatch.setattr(tts, 'SEGMENT_CHARS', 60)
+    segments = tts.split_segments(TEXT)
+    assert len(segments) > 2
+    assert ' '.join(segments) == TEXT
+    assert len(segments[0]) <= 30
+
+
+def test_segments_are_streamed_in_order(fake_provider, recorded):
+    audio = b''.join(tts.synthesize_parallel(TEXT, trace_id='t'))
+    expected = b''.join(f'<{s}>'.encode() for s in tts.split_segments(TEXT))
+    assert audio == expected
+
+
+def test_parallel_stream_is_instrumented_once(fake_provider, recorded):
+    spans, gauges = recorded
+    list(tts.synthesize_parallel(TEXT, trace_id='t'))
+    assert spans.count('tts_first_byte') == 1
+    assert spans.count('tts_complete') == 1
+    assert gauges == [('active_tts_streams', 1), ('active_tts_streams', -1)]
+
+
+def test_segment_failure_is_raised(fake_provider, monkeypatch):
+    def broken(text, model_id=None, trace_id=None, instrument=True):
+        raise RuntimeError('upstream down')
+        yield
+
+    monkeypatch.setattr(tts, 'synthesize_stream', broken)
+    with pytest.raises(RuntimeError, match='upstream down'):
+        list(tts.synthesize_parallel(TEXT))
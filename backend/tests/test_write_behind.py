@@ -0,0 +1,81 @@
+import time
+import sqlite3
+
+
+def _stored_contents(db, conversation_id):
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        rows = conn.execute('SELECT content FROM messages WHERE conversation_id = ? ORDER BY created_at, id',
+                            (conversation_id,)).fetchall()
+        return [r[0] for r in rows]
+    finally:
+        conn.close()
+
+
+def test_queued_message_visible_before_commit_and_stored_after_flush(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    mid = db.enqueue_message(cid, 'user', 'hello')
+    assert [m['id'] for m in db.get_messages(cid)] == [mid]
+    assert db.flush_writes(5)
+    assert _stored_contents(db, cid) == ['hello']
+    conv = db.get_conversation(cid)
+    assert conv['message_count'] == 1
+    assert conv['last_message_id'] == mid
+
+
+def test_flush_without_writer_returns_immediately(fresh_db):
+    assert fresh_db.flush_writes(0.1)
+
+
+def test_bad_row_is_dropped_and_writer_keeps_running(fresh_db):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+    db.enqueue_message(cid, 'user', 'first')
+    db.enqueue_message(cid, 'user', 'unserializable', metadata={'x': object()})
+    db.enqueue_message(cid, 'user', 'second')
+    assert db.flush_writes(5)
+    assert db._WRITER.is_alive()
+    assert _stored_contents(db, cid) == ['first', 'second']
+    # the dropped row no longer shows up through the pending overlay either
+    assert [m['content'] for m in db.get_messages(cid)] == ['first', 'second']
+
+    db.enqueue_message(cid, 'user', 'third')
+    assert db.flush_writes(5)
+    assert _stored_contents(db, cid) == ['first', 'second', 'third']
+
+
+def test_flush_events_fire_when_commit_raises(fresh_db, monkeypatch):
+    db = fresh_db
+    cid = db.create_conversation('sys')
+
+    def broken(conn, rows):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(db, '_commit_batch', broken)
+    db.enqueue_message(cid, 'user', 'lost')
+    assert db.flush_writes(5)
+    assert db._WRITER.is_alive()
+
+
+def test_batch_window_is_not_extended_by_a_trickle(fresh_db, monkeypatch):
+    db = fresh_db
+    monkeypatch.setattr(db, 'WRITE_FLUSH_MS', 100)
+    monkeypatch.setattr(db, 'WRITE_BATCH_SIZE', 1000)
+    batches = []
+    real_commit = db._commit_batch
+
+    def recording(conn, rows):
+        batches.append(len(rows))
+        real_commit(conn, rows)
+
+    monkeypatch.setattr(db, '_commit_batch', recording)
+    cid = db.create_conversation('sys')
+    # one row every 40 ms for ~600 ms: a window that restarted on every row would
+    # hold them all in a single batch
+    for i in range(15):
+        db.enqueue_message(cid, 'user', f'm{i}')
+        time.sleep(0.04)
+    assert db.flush_writes(5)
+    assert sum(batches) == 15
+    assert len(batches) >= 3
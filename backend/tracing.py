@@ -0,0 +1,121 @@
+"""Per-turn trace timelines.
+
+A turn gets a trace id at its first request (/sst upload or the message POST;
+clients pass it along via the `trace_id` field or an X-Trace-Id header, and ids
+not in new_trace_id() form are replaced with a fresh one). Stage spans are
+recorded against it and the trace is linked to the assistant message id, so
+/conversations/<id>/messages/<message_id>/trace can return the waterfall for
+one turn.
+
+Traces live in a bounded in-memory ring buffer (TRACE_BUFFER_SIZE newest
+turns). Every span is also observed into the metrics histograms, so call sites
+use `span()` / `record()` instead of metrics.timed() for turn stages.
+"""
+import os
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import metrics
+
+TRACE_BUFFER_SIZE = int(os.environ.get('TRACE_BUFFER_SIZE', '1000'))
+MAX_SPANS_PER_TRACE = 64
+
+# perf_counter -> wall clock anchor for rendering absolute timestamps
+_WALL0 = time.time()
+_PERF0 = time.perf_counter()
+
+_TRACES = OrderedDict()  # trace_id -> {'spans': [...], 'messages': [...]}
+_MESSAGE_INDEX = {}  # message_id -> trace_id
+_LOCK = threading.Lock()
+
+
+_TRACE_ID = re.compile(r'[0-9a-f]{32}')
+
+
+def new_trace_id():
+    return uuid.uuid4().hex
+
+
+def is_trace_id(value):
+    """True if `value` looks like an id from new_trace_id()."""
+    return isinstance(value, str) and _TRACE_ID.fullmatch(value) is not None
+
+
+def continue_trace(trace_id):
+    """A client-supplied trace id if well-formed, else a fresh one."""
+    return trace_id if is_trace_id(trace_id) else new_trace_id()
+
+
+def _get_or_create(trace_id):
+    # caller holds _LOCK
+    trace = _TRACES.get(trace_id)
+    if trace is None:
+        trace = _TRACES[trace_id] = {'spans': [], 'messages': []}
+        while len(_TRACES) > TRACE_BUFFER_SIZE:
+            _, old = _TRACES.popitem(last=False)
+            for mid in old['messages']:
+                _MESSAGE_INDEX.pop(mid, None)
+    return trace
+
+
+def record(trace_id, name, start, end=None, **attrs):
+    """Record a span given perf_counter() start/end (end defaults to now)."""
+    end = time.perf_counter() if end is None else end
+    metrics.observe(name, end - start)
+    if not trace_id:
+        return
+    with _LOCK:
+        trace = _get_or_create(trace_id)
+        if len(trace['spans']) < MAX_SPANS_PER_TRACE:
+            trace['spans'].append((name, start, end, attrs or None))
+
+
+@contextmanager
+def span(trace_id, name, **attrs):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(trace_id, name, start, **attrs)
+
+
+def link_message(trace_id, message_id):
+    """Associate a message id (e.g. the assistant reply) with a trace."""
+    if not trace_id or not message_id:
+        return
+    with _LOCK:
+        _get_or_create(trace_id)['messages'].append(message_id)
+        _MESSAGE_INDEX[message_id] = trace_id
+
+
+def trace_for_message(message_id):
+    with _LOCK:
+        return _MESSAGE_INDEX.get(message_id)
+
+
+def get_trace(trace_id):
+    """Return the waterfall for a trace: spans sorted by start, offsets in ms from the first span."""
+    with _LOCK:
+        trace = _TRACES.get(trace_id)
+        if trace is None:
+            return None
+        spans = list(trace['spans'])
+        messages = list(trace['messages'])
+    spans.sort(key=lambda s: s[1])
+    t0 = spans[0][1] if spans else _PERF0
+    return {
+        'trace_id': trace_id,
+        'message_ids': messages,
+        'started_at': _WALL0 + (t0 - _PERF0),
+        'total_ms': round((max(s[2] for s in spans) - t0) * 1000, 2) if spans else 0,
+        'spans': [{
+            'name': name,
+            'start_ms': round((start - t0) * 1000, 2),
+            'duration_ms': round((end - start) * 1000, 2),
+            **({'attrs': attrs} if attrs else {}),
+        } for name, start, end, attrs in spans],
+    }
@@ -1,5 +1,15 @@
 import os
-from fishaudio import FishAudio, TTSConfig
+import re
+import time
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+
+import metrics
+import providers
+import audio_formats
+import tracing
 
 # rump
 MODEL_ID = os.environ.get('MODEL_ID', 'b545c585f631496c914815291da4e893')
@@ -14,44 +24,262 @@ MODEL_ID = os.environ.get('MODEL_ID', 'b545c585f631496c914815291da4e893')
 FEMALE_MODEL_ID = os.environ.get('F_MODEL_ID', 'b545c585f631496c914815291da4e893')
 # DEFAULT_MODEL_ID = os.environ.get('D_MODEL_ID', FEMALE_MODEL_ID)
 
-client = FishAudio()
-
 
 def synthesize_bytes(text: str, model_id: str = None) -> bytes:
     """Use FishAudio convert() to get audio bytes."""
     mid = model_id or MODEL_ID
-    audio = client.tts.convert(text=text, reference_id=mid, latency='balanced')
+    audio = providers.fishaudio_client().tts.convert(text=text, reference_id=mid, latency='balanced')
     # The SDK in the original demo returned bytes-like object
     return audio
 
-def synthesize_stream_gen(text_gen, model_id: str = None):
+def synthesize_stream_gen(text_gen, model_id: str = None, trace_id: str = None, cancelled=None,
+                          instrument: bool = True):
+    # cancelled: optional zero-arg callable; when it returns True the stream stops at the
+    # next audio chunk and the websocket is closed.
+    # instrument=False skips the stage spans and active_tts_streams (for the pieces of a
+    # parallel synthesis, which instruments itself as one stream)
     mid = model_id or MODEL_ID
+    # tts_first_byte / tts_complete are measured from the first text chunk in,
+    # so time spent waiting on the LLM is not counted against TTS
+    first_text = None
+
+    def tracked_text():
+        nonlocal first_text
+        for piece in text_gen:
+            if first_text is None:
+                first_text = time.perf_counter()
+            yield piece
 
     # print(f"[TTS] Starting stream for {len(text)} chars")
-    audio_stream = client.tts.stream_websocket(text_gen,
-                                     reference_id=mid,
-                                     latency='balanced')
+    if instrument:
+        metrics.gauge_inc('active_tts_streams', help_text='FishAudio TTS streams in progress.')
+    try:
+        audio_stream = providers.fishaudio_client().tts.stream_websocket(tracked_text(),
+                                         reference_id=mid,
+                                         latency='balanced')
 
-    for i, chunk in enumerate(audio_stream):
-        # print(f"[TTS] Yielding chunk {i}, size {len(chunk)}")
-        yield chunk
+        for i, chunk in enumerate(audio_stream):
+            if cancelled is not None and cancelled():
+                close = getattr(audio_stream, 'close', None)
+                if close:
+                    close()
+                return
+            # print(f"[TTS] Yielding chunk {i}, size {len(chunk)}")
+            if i == 0 and first_text is not None and instrument:
+                tracing.record(trace_id, 'tts_first_byte', first_text)
+            yield chunk
 
-    # print("[TTS] Stream complete")
+        # print("[TTS] Stream complete")
+        if first_text is not None and instrument:
+            tracing.record(trace_id, 'tts_complete', first_text)
+    finally:
+        if instrument:
+            metrics.gauge_dec('active_tts_streams')
 
 
-def synthesize_stream(text: str, model_id: str = None):
-    mid = model_id or MODEL_ID
+def synthesize_stream(text: str, model_id: str = None, trace_id: str = None, instrument: bool = True):
     def text_chunks():
         # print(text)
         yield text
 
-    # print(f"[TTS] Starting stream for {len(text)} chars")
-    audio_stream = client.tts.stream_websocket(text_chunks(),
-                                     reference_id=mid,
-                                     latency='balanced')
+    yield from synthesize_stream_gen(text_chunks(), model_id, trace_id, instrument=instrument)
+
+
+# Pre-synthesized audio for fixed texts (conversation greetings), shared by
+# every conversation with the same text and voice. Entries stream while they
+# are still being synthesized, so a request that races the background job
+# follows it instead of starting a second synthesis. Other output formats are
+# transcoded from the cached MP3 once and cached alongside it.
+AUDIO_CACHE_SIZE = int(os.environ.get('TTS_AUDIO_CACHE_SIZE', '32'))
+# a reader gives up on an entry that produced nothing new for this long
+AUDIO_CACHE_STALL_S = float(os.environ.get('TTS_AUDIO_CACHE_STALL_S', '15'))
+_AUDIO_CACHE = OrderedDict()  # (model_id, format, sha1(text)) -> _AudioEntry
+_AUDIO_CACHE_LOCK = threading.Lock()
+
+
+class _AudioEntry:
+    def __init__(self, key):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.failed = False
+        self.cond = threading.Condition()
+
+
+def _audio_key(text, model_id, fmt='mp3'):
+    return (model_id or MODEL_ID, fmt, hashlib.sha1(text.encode('utf-8')).hexdigest())
+
+
+def _fill_entry(key, entry, source):
+    try:
+        for chunk in source:
+            with entry.cond:
+                entry.chunks.append(chunk)
+                entry.cond.notify_all()
+    except Exception as e:
+        print('presynthesize error', e)
+        with _AUDIO_CACHE_LOCK:
+            if _AUDIO_CACHE.get(key) is entry:
+                del _AUDIO_CACHE[key]
+        with entry.cond:
+            entry.failed = True
+    with entry.cond:
+        entry.done = True
+        entry.cond.notify_all()
+
+
+def _start_entry(key, make_source):
+    """Cache entry for `key`, filling it from make_source() in the background if new."""
+    with _AUDIO_CACHE_LOCK:
+        entry = _AUDIO_CACHE.get(key)
+        if entry is not None:
+            _AUDIO_CACHE.move_to_end(key)
+            return entry
+        entry = _AUDIO_CACHE[key] = _AudioEntry(key)
+        while len(_AUDIO_CACHE) > AUDIO_CACHE_SIZE:
+            _AUDIO_CACHE.popitem(last=False)
+    threading.Thread(target=_fill_entry, args=(key, entry, make_source()),
+                     name='tts-presynth', daemon=True).start()
+    return entry
+
+
+def _read_entry(entry, fallback=None):
+    """Follow an entry's audio. If its synthesis stalls for AUDIO_CACHE_STALL_S the entry
+    is dropped from the cache and, when nothing was yielded yet, fallback() is streamed
+    instead; otherwise the stall raises like a live stream error."""
+    i = 0
+    while True:
+        with entry.cond:
+            stalled = not entry.cond.wait_for(lambda: i < len(entry.chunks) or entry.done,
+                                              timeout=AUDIO_CACHE_STALL_S)
+            new = entry.chunks[i:]
+            done, failed = entry.done, entry.failed
+        if stalled:
+            metrics.counter_inc('tts_audio_cache_stalls_total', help_text='Reads of pre-synthesized audio that timed out.')
+            with _AUDIO_CACHE_LOCK:
+                if _AUDIO_CACHE.get(entry.key) is entry:
+                    del _AUDIO_CACHE[entry.key]
+            if i == 0 and fallback is not None:
+                yield from fallback()
+                return
+            raise TimeoutError('pre-synthesized audio stalled')
+        i += len(new)
+        yield from new
+        if done and i >= len(entry.chunks):
+            if failed:
+                raise RuntimeError('pre-synthesized audio failed')
+            return
+
+
+def presynthesize(text: str, model_id: str = None):
+    """Synthesize `text` in the background unless it is already cached."""
+    if text:
+        _start_entry(_audio_key(text, model_id), lambda: synthesize_stream(text, model_id))
+
+
+def cached_stream(text: str, model_id: str = None, fmt: str = 'mp3'):
+    """Generator over cached audio for `text` in `fmt`, or None if it was never presynthesized.
+    If the background synthesis fails part-way the generator raises, like a live stream would."""
+    with _AUDIO_CACHE_LOCK:
+        entry = _AUDIO_CACHE.get(_audio_key(text, model_id, fmt))
+        base = _AUDIO_CACHE.get(_audio_key(text, model_id))
+    if entry is None and base is not None and fmt != 'mp3':
+        entry = _start_entry(_audio_key(text, model_id, fmt),
+                             lambda: audio_formats.transcode(_read_entry(base), fmt))
+    if entry is None or entry.failed:
+        return None
+    metrics.counter_inc('tts_audio_cache_hits_total', help_text='TTS requests served from pre-synthesized audio.')
+    return _read_entry(entry, lambda: audio_formats.transcode(synthesize_stream(text, model_id), fmt))
+
+
+# Long finished texts are split at sentence boundaries and the pieces are
+# synthesized concurrently, then streamed back strictly in order. The first
+# segment is kept short so playback starts as soon as possible.
+PARALLEL_MIN_CHARS = int(os.environ.get('TTS_PARALLEL_MIN_CHARS', '400'))
+PARALLEL_WORKERS = int(os.environ.get('TTS_PARALLEL_WORKERS', '3'))
+SEGMENT_CHARS = int(os.environ.get('TTS_SEGMENT_CHARS', '300'))
+FIRST_SEGMENT_CHARS = int(os.environ.get('TTS_FIRST_SEGMENT_CHARS', '120'))
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+|\n{2,}')
+
+
+def split_segments(text: str):
+    """Group sentences into segments of about SEGMENT_CHARS (FIRST_SEGMENT_CHARS for the first)."""
+    segments = []
+    current = ''
+    for sentence in _SENTENCE_END.split(text):
+        if not sentence.strip():
+            continue
+        limit = FIRST_SEGMENT_CHARS if not segments else SEGMENT_CHARS
+        if current and len(current) + len(sentence) + 1 > limit:
+            segments.append(current)
+            current = sentence
+        else:
+            current = f'{current} {sentence}' if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+
+def synthesize_parallel(text: str, model_id: str = None, trace_id: str = None):
+    """Synthesize segments of `text` on up to PARALLEL_WORKERS threads and yield audio in order."""
+    segments = split_segments(text)
+    if len(segments) < 2 or PARALLEL_WORKERS < 2:
+        yield from synthesize_stream(text, model_id, trace_id)
+        return
+
+    outputs = [queue.Queue() for _ in segments]
+    todo = queue.Queue()
+    for i in range(len(segments)):
+        todo.put(i)
+    cancelled = threading.Event()
+
+    def worker():
+        while not cancelled.is_set():
+            try:
+                i = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                for chunk in synthesize_stream(segments[i], model_id, instrument=False):
+                    if cancelled.is_set():
+                        break
+                    outputs[i].put(chunk)
+            except Exception as e:
+                outputs[i].put(e)
+            outputs[i].put(None)
+
+    metrics.counter_inc('tts_parallel_segments_total', len(segments), 'Segments synthesized by parallel TTS.')
+    start = time.perf_counter()
+    for _ in range(min(PARALLEL_WORKERS, len(segments))):
+        threading.Thread(target=worker, name='tts-segment', daemon=True).start()
+    first = True
+    metrics.gauge_inc('active_tts_streams', help_text='FishAudio TTS streams in progress.')
+    try:
+        for out in outputs:
+            while True:
+                item = out.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                if first:
+                    tracing.record(trace_id, 'tts_first_byte', start)
+                    first = False
+                yield item
+        tracing.record(trace_id, 'tts_complete', start)
+    finally:
+        # client went away or a segment failed: stop the remaining work
+        cancelled.set()
+        metrics.gauge_dec('active_tts_streams')
 
-    for i, chunk in enumerate(audio_stream):
-        # print(f"[TTS] Yielding chunk {i}, size {len(chunk)}")
-        yield chunk
 
-    # print("[TTS] Stream complete")
+def synthesize_complete(text: str, model_id: str = None, trace_id: str = None, fmt: str = 'mp3'):
+    """Audio stream in `fmt` for a finished text: pre-synthesized audio if cached, else a
+    live synthesis (parallel and ordered for texts longer than PARALLEL_MIN_CHARS)."""
+    cached = cached_stream(text, model_id, fmt)
+    if cached is not None:
+        return cached
+    if len(text) >= PARALLEL_MIN_CHARS:
+        return audio_formats.transcode(synthesize_parallel(text, model_id, trace_id), fmt)
+    return audio_formats.transcode(synthesize_stream(text, model_id, trace_id), fmt)